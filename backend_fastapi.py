@@ -3,13 +3,9 @@ from starlette.staticfiles import StaticFiles
 from starlette.responses import FileResponse
 import uvicorn
 import geojson
-from height_map.height_info import HeightInfo
-from height_map.cci_land_cover import LandCover
+from height_map.sources import get_height_info, get_land_cover
 import height_map.track_methods as track_methods
 
-hi = HeightInfo()
-lc = LandCover()
-
 app = FastAPI(
     openapi_prefix="",
     title="HeightMap",
@@ -40,7 +36,7 @@ def get_height(
     lat: float = Query(..., ge=-90, le=90),
     lon: float = Query(..., ge=-180, le=180),
 ):
-    response = hi.get_height(lat, lon)
+    response = get_height_info().get_height(lat, lon)
     if response["source"] == "NODATA":
         raise HTTPException(status_code=404, detail="no data available")
     return response
@@ -53,7 +49,7 @@ def get_max_height(
     lat_ur: float = Query(..., ge=-90, le=90),
     lon_ur: float = Query(..., ge=-180, le=180),
 ):
-    return hi.get_max_height(lat_ll, lon_ll, lat_ur, lon_ur)
+    return get_height_info().get_max_height(lat_ll, lon_ll, lat_ur, lon_ur)
 
 
 @app.get("/api/get_min_height")
@@ -63,7 +59,7 @@ def get_min_height(
     lat_ur: float = Query(..., ge=-90, le=90),
     lon_ur: float = Query(..., ge=-180, le=180),
 ):
-    return hi.get_min_height(lat_ll, lon_ll, lat_ur, lon_ur)
+    return get_height_info().get_min_height(lat_ll, lon_ll, lat_ur, lon_ur)
 
 
 @app.get("/api/get_min_max_height")
@@ -74,7 +70,9 @@ def get_min_max_height(
     lon_ur: float = Query(..., ge=-180, le=180),
 ):
     extreme_locations = []
-    result = hi.get_min_max_height(lat_ll, lon_ll, lat_ur, lon_ur)
+    result = get_height_info().get_min_max_height(
+        lat_ll, lon_ll, lat_ur, lon_ur
+    )
     for _location in result["location_min"]:
         extreme_locations.append(
             geojson.Feature(
@@ -107,7 +105,7 @@ def get_surface_cover(
     lat: float = Query(..., ge=-90, le=90),
     lon: float = Query(..., ge=-180, le=180),
 ):
-    return lc.get_data_at_position(lat, lon)
+    return get_land_cover().get_data_at_position(lat, lon)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,35 @@
+import time
+import numpy as np
+from height_map.gebco import Gebco
+
+# compare the original netCDF file with the tiles of create_gebco_tiles.py
+rng = np.random.default_rng(0)
+lats = rng.uniform(-80, 80, 1000)
+lons = rng.uniform(-180, 180, 1000)
+# an ocean track crossing the Atlantic in steps of about 100m
+track_lats = np.linspace(40, 42, 2000)
+track_lons = np.linspace(-30, -27, 2000)
+windows = [(_lat, _lon, _lat + 0.1, _lon + 0.1)
+    for _lat, _lon in zip(lats[:100], lons[:100])]
+
+for file_name in ['GEBCO_2023.nc', Gebco.tiles_file_name]:
+    gebco = Gebco(file_name=file_name)
+    timings = {}
+    t_start = time.time()
+    for _lat, _lon in zip(lats, lons):
+        gebco.get_height(_lat, _lon)
+    timings['random points'] = time.time() - t_start
+    t_start = time.time()
+    for _lat, _lon in zip(track_lats, track_lons):
+        gebco.get_height(_lat, _lon)
+    timings['track points'] = time.time() - t_start
+    gebco.chunk_cache.clear()
+    t_start = time.time()
+    gebco.get_heights(lats, lons)
+    timings['random batch'] = time.time() - t_start
+    t_start = time.time()
+    for _window in windows:
+        gebco.get_min_max_height(*_window)
+    timings['small windows'] = time.time() - t_start
+    print('{}: {}'.format(file_name, ', '.join('{} {:.3f}s'.format(*_item)
+        for _item in timings.items())))
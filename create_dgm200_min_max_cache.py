@@ -0,0 +1,8 @@
+import numpy as np
+from height_map.dgm200 import Dgm200, create_cache_levels, get_cache_level_file
+
+dgm = Dgm200()
+
+# every level of the pyramid is stored as [minimum, maximum] array
+for _b, _minimum, _maximum in create_cache_levels(dgm.grid, dgm.NODATA):
+    np.save(get_cache_level_file(dgm.file, _b), np.stack([_minimum, _maximum]))
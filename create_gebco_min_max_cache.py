@@ -1,21 +1,23 @@
-import os
-import json
 import numpy as np
-from height_map.gebco import Gebco
+from height_map.gebco import Gebco, NCOLS, NROWS, CACHE_BLOCK_SIZES
 
 gebco = Gebco()
 
-z_max = np.zeros([180, 360])
-z_min = np.zeros([180, 360])
+strip_size = CACHE_BLOCK_SIZES[0]
+z_min = {_b: np.zeros([NROWS//_b, NCOLS//_b], dtype=np.int16)
+    for _b in CACHE_BLOCK_SIZES}
+z_max = {_b: np.zeros([NROWS//_b, NCOLS//_b], dtype=np.int16)
+    for _b in CACHE_BLOCK_SIZES}
 
-data = np.array(gebco.h5_file['elevation'])
+for _x in range(NROWS//strip_size):
+    # process one strip of 1 degree to avoid loading the whole grid
+    data = gebco.elevation[_x*strip_size:(_x+1)*strip_size, :]
+    for _b in CACHE_BLOCK_SIZES:
+        blocks = data.reshape(strip_size//_b, _b, NCOLS//_b, _b)
+        _rows = slice(_x*strip_size//_b, (_x+1)*strip_size//_b)
+        z_min[_b][_rows] = blocks.min(axis=(1, 3))
+        z_max[_b][_rows] = blocks.max(axis=(1, 3))
 
-for _x in range(180):
-    for _y in range(360):
-        z_max[_x, _y] = data[_x*240:(_x+1)*240, _y*240:(_y+1)*240].max()
-        z_min[_x, _y] = data[_x*240:(_x+1)*240, _y*240:(_y+1)*240].min()
-
-min_max_cache = {'minimum': np.around(z_min, 1).tolist(),
-    'maximum': np.around(z_max, 1).tolist()}
-with open(os.path.join(gebco.cache_path, gebco.cache_file_name), 'w') as f:
-    json.dump(min_max_cache, f)
+# every level of the pyramid is stored as [minimum, maximum] array
+for _b in CACHE_BLOCK_SIZES:
+    np.save(gebco.get_cache_level_file(_b), np.stack([z_min[_b], z_max[_b]]))
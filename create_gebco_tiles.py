@@ -0,0 +1,8 @@
+import os
+from height_map.gebco import Gebco
+from height_map.gebco_tiles import write_tiles
+
+# always convert the original netCDF file, even if tiles exist already
+gebco = Gebco(file_name='GEBCO_2023.nc')
+path = os.path.dirname(gebco.h5_file.filename)
+write_tiles(gebco.elevation, os.path.join(path, gebco.tiles_file_name))
@@ -35,6 +35,7 @@ use_errorlog = errorlog_var or None
 graceful_timeout_str = os.getenv("GRACEFUL_TIMEOUT", "120")
 timeout_str = os.getenv("TIMEOUT", "120")
 keepalive_str = os.getenv("KEEP_ALIVE", "5")
+preload_app_str = os.getenv("PRELOAD_APP", "false")
 
 # Gunicorn config variables
 loglevel = use_loglevel
@@ -46,6 +47,53 @@ accesslog = use_accesslog
 graceful_timeout = int(graceful_timeout_str)
 timeout = int(timeout_str)
 keepalive = int(keepalive_str)
+# load the data sources once in the master, the workers share the memory
+# mapped grids and caches copy-on-write
+preload_app = preload_app_str.lower() in ("1", "true", "yes")
+
+
+def get_memory_usage():
+    """
+    Resident memory of the current process in kB from /proc, RssAnon is
+    private to the process while RssFile includes mapped files shared
+    with other processes.
+    """
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for _line in f:
+                key, _, value = _line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile", "RssShmem"):
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return usage
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from height_map.sources import registry
+
+    registry.preload()
+    server.log.info(f"Sources loaded in ms: {json.dumps(registry.init_times)}")
+    server.log.info(f"Master memory in kB: {json.dumps(get_memory_usage())}")
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from height_map.sources import registry
+
+    # h5py and GDAL handles of the master must not be used by workers
+    registry.reopen()
+
+
+def post_worker_init(worker):
+    # compare the private memory of the workers with and without preload_app
+    worker.log.info(
+        f"Worker {worker.pid} memory in kB: {json.dumps(get_memory_usage())}"
+    )
 
 
 # For debugging and testing
@@ -56,6 +104,7 @@ log_data = {
     "graceful_timeout": graceful_timeout,
     "timeout": timeout,
     "keepalive": keepalive,
+    "preload_app": preload_app,
     "errorlog": errorlog,
     "accesslog": accesslog,
     # Additional, non-gunicorn variables
@@ -1,16 +1,73 @@
-import pygeodesy.ellipsoidalVincenty as ev
-import pygeodesy.ellipsoidalExact as ee
+import numpy as np
+from height_map import geodesic
 
+# positions differing less than this in degrees of latitude and longitude
+# are measured in the local tangent plane, which deviates less than 0.1 mm
+# from Vincenty
+LOCAL_DISTANCE_LIMIT = 0.02
 
-def calculate_distance(lat1, lon1, lat2, lon2):
+
+def calculate_distance(lat1, lon1, lat2, lon2, exact=False):
     if lat1 == lat2 and lon1 == lon2:
         return 0
-    try:
-        location_1 = ev.LatLon(lat1, lon1)
-        location_2 = ev.LatLon(lat2, lon2)
-        distance = location_1.distanceTo(location_2)
-    except ev.VincentyError:
-        location_1 = ee.LatLon(lat1, lon1)
-        location_2 = ee.LatLon(lat2, lon2)
-        distance = location_1.distanceTo(location_2)
-    return distance
+    return float(calculate_distances(lat1, lon1, lat2, lon2, exact)[0])
+
+
+def calculate_distances(lats1, lons1, lats2, lons2, exact=False):
+    """
+    Calculate the distances between pairs of positions.
+
+    Nearby positions like a location and its closest grid point are
+    measured on the plane tangent to the WGS84 ellipsoid at their mean
+    latitude, all others by Vincenty.
+
+    :param lats1: array of float -- latitudes of the first positions.
+    :param lons1: array of float -- longitudes of the first positions.
+    :param lats2: array of float -- latitudes of the second positions.
+    :param lons2: array of float -- longitudes of the second positions.
+    :param exact: bool -- use Vincenty for all positions.
+    :returns: array of float -- distances in m.
+    """
+    lats1, lons1, lats2, lons2 = (np.asarray(_a, dtype=float).reshape(-1)
+        for _a in (lats1, lons1, lats2, lons2))
+    if exact:
+        return geodesic.inverse(lats1, lons1, lats2, lons2)[0]
+    d_lats = lats2 - lats1
+    d_lons = (lons2 - lons1 + 180) % 360 - 180
+    phi = np.radians((lats1 + lats2) / 2)
+    e2 = geodesic.F * (2 - geodesic.F)
+    s = 1 - e2 * np.sin(phi)**2
+    nu = geodesic.A / np.sqrt(s)
+    rho = nu * (1 - e2) / s
+    distances = np.hypot(rho * np.radians(d_lats),
+        nu * np.cos(phi) * np.radians(d_lons))
+    far = ((np.abs(d_lats) >= LOCAL_DISTANCE_LIMIT) |
+        (np.abs(d_lons) >= LOCAL_DISTANCE_LIMIT))
+    if far.any():
+        distances[far] = geodesic.inverse(lats1[far], lons1[far], lats2[far],
+            lons2[far])[0]
+    return distances
+
+
+def check_coordinates(lats, lons):
+    lats = np.asarray(lats, dtype=float).reshape(-1)
+    lons = np.asarray(lons, dtype=float).reshape(-1)
+    if lats.shape != lons.shape:
+        raise ValueError('latitudes and longitudes differ in shape')
+    if not (np.all((-90 <= lats) & (lats <= 90)) and
+            np.all((-180 <= lons) & (lons <= 180))):
+        raise ValueError('invalid coordinates')
+    return lats, lons
+
+
+def group_indices(keys):
+    """
+    Group the positions of an array by their key.
+
+    :param keys: array -- one key per position.
+    :returns: iterator of (key, positions) for each unique key.
+    """
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(unique_keys)))
+    return zip(unique_keys, np.split(order, bounds[:-1]))
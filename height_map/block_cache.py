@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+
+
+class BlockCache:
+    """
+    LRU cache of raster blocks stored as NumPy arrays.
+
+    The least recently used blocks are dropped as soon as all cached blocks
+    together exceed max_bytes. The cache may be shared between threads,
+    blocks are read outside of the lock.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.blocks
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def get(self, key, read_block):
+        """
+        Get a cached block or read and cache it.
+
+        :param key: hashable -- identifier of the block.
+        :param read_block: function -- returns the block if not cached.
+        :returns: numpy.ndarray
+        """
+        with self.lock:
+            block = self.blocks.get(key)
+            if block is not None:
+                self.blocks.move_to_end(key)
+                return block
+        block = read_block()
+        with self.lock:
+            if key in self.blocks:
+                # read by another thread meanwhile
+                return self.blocks[key]
+            self.blocks[key] = block
+            self.nbytes += block.nbytes
+            while self.nbytes > self.max_bytes and len(self.blocks) > 1:
+                _key, _block = self.blocks.popitem(last=False)
+                self.nbytes -= _block.nbytes
+        return block
+
+    def clear(self):
+        with self.lock:
+            self.blocks.clear()
+            self.nbytes = 0
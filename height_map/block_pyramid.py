@@ -0,0 +1,252 @@
+import numpy as np
+from height_map import group_indices
+
+
+def get_padded_shape(shape, block_size):
+    # a pyramid covers the grid padded to whole blocks of its coarsest level
+    return tuple(-(-_n // block_size) * block_size for _n in shape)
+
+
+def create_levels(values, block_sizes, nodata):
+    """
+    Compute the extreme values of all blocks for each level of a pyramid.
+
+    NODATA is ignored for the minimum, blocks without data get +inf as
+    minimum. The padding cells never match any extreme value.
+
+    :param values: 2D array -- the grid.
+    :param block_sizes: list of int -- block sizes, coarse to fine, each
+        dividing the previous one.
+    :param nodata: number -- value of missing data.
+    :returns: list of (block_size, minimum, maximum), coarse to fine.
+    """
+    shape = get_padded_shape(values.shape, block_sizes[0])
+    nrows, ncols = values.shape
+    maximum = np.full(shape, -np.inf, dtype=np.float32)
+    maximum[:nrows, :ncols] = values
+    minimum = np.full(shape, np.inf, dtype=np.float32)
+    minimum[:nrows, :ncols] = np.where(values == nodata, np.inf, values)
+    levels = []
+    for block_size in block_sizes[::-1]:
+        factor = block_size // (levels[0][0] if levels else 1)
+        _shape = (minimum.shape[0] // factor, factor,
+            minimum.shape[1] // factor, factor)
+        minimum = minimum.reshape(_shape).min(axis=(1, 3))
+        maximum = maximum.reshape(_shape).max(axis=(1, 3))
+        levels.insert(0, (block_size, minimum, maximum))
+    return levels
+
+
+def split_window(y_0, y_1, x_0, x_1, shape, block_sizes, level=0):
+    """
+    Split a window of a grid into blocks of the pyramid levels.
+
+    The block aligned core of the window is taken from the current level,
+    the frame around it from the finer levels down to single cells.
+
+    :param y_0: int -- first row of the window.
+    :param y_1: int -- row after the window.
+    :param x_0: int -- first column of the window.
+    :param x_1: int -- column after the window.
+    :param shape: tuple of int -- number of rows and columns of the grid.
+    :param block_sizes: list of int -- block sizes of the levels.
+    :param level: int -- index of the current level.
+    :returns: list of (level, y_0, y_1, x_0, x_1) in block indices of the
+        level, level len(block_sizes) refers to single cells.
+    """
+    if y_0 >= y_1 or x_0 >= x_1:
+        return []
+    if level == len(block_sizes):
+        return [(level, y_0, y_1, x_0, x_1)]
+    block_size = block_sizes[level]
+    nrows, ncols = get_padded_shape(shape, block_sizes[0])
+    # blocks at the lower and right border include the padding
+    i_0 = -(-y_0 // block_size)
+    i_1 = (nrows if y_1 == shape[0] else y_1) // block_size
+    j_0 = -(-x_0 // block_size)
+    j_1 = (ncols if x_1 == shape[1] else x_1) // block_size
+    if i_0 >= i_1 or j_0 >= j_1:
+        return split_window(y_0, y_1, x_0, x_1, shape, block_sizes,
+            level + 1)
+    _y_0 = i_0 * block_size
+    _y_1 = min(i_1 * block_size, y_1)
+    _x_0 = j_0 * block_size
+    _x_1 = min(j_1 * block_size, x_1)
+    return [(level, i_0, i_1, j_0, j_1)] + [_piece for _window in [
+        (y_0, _y_0, x_0, x_1), (_y_1, y_1, x_0, x_1),
+        (_y_0, _y_1, x_0, _x_0), (_y_0, _y_1, _x_1, x_1)]
+        for _piece in split_window(*_window, shape, block_sizes, level + 1)]
+
+
+def get_extreme(pieces, levels, use_maximum, nodata):
+    """
+    Determine the maximum or minimum of a window split by split_window().
+
+    :param pieces: list -- result of split_window().
+    :param levels: list of arrays -- maxima or minima of the pyramid levels
+        followed by the grid itself.
+    :param use_maximum: bool -- find the maximum instead of the minimum.
+    :param nodata: number -- value of missing data.
+    :returns: float -- the extreme value, at least nodata for the maximum
+        and None for the minimum of a window without data.
+    """
+    h = nodata if use_maximum else np.inf
+    for level, i_0, i_1, j_0, j_1 in pieces:
+        values = np.asarray(levels[level][i_0:i_1, j_0:j_1])
+        if use_maximum:
+            h = max(h, float(values.max()))
+            continue
+        if level == len(levels) - 1:
+            values = values[values != nodata]
+        if values.size:
+            h = min(h, float(values.min()))
+    if h == np.inf:
+        return None
+    return h
+
+
+def get_cells(grid, rows, cols, block_size):
+    """
+    Read single cells of a grid, block by block if the grid does not
+    support fancy indexing, e.g. an h5py.Dataset.
+
+    :param grid: 2D array or dataset -- the grid.
+    :param rows: array of int -- row indices.
+    :param cols: array of int -- column indices.
+    :param block_size: int -- size of the blocks read at once.
+    :returns: array -- one value per cell.
+    """
+    if isinstance(grid, np.ndarray):
+        return grid[rows, cols]
+    values = np.empty(len(rows), dtype=grid.dtype)
+    if len(rows) == 0:
+        return values
+    block_rows = rows // block_size
+    block_cols = cols // block_size
+    keys = block_rows * (grid.shape[1] // block_size + 1) + block_cols
+    for _key, _indices in group_indices(keys):
+        i_0 = block_rows[_indices[0]] * block_size
+        j_0 = block_cols[_indices[0]] * block_size
+        block = np.asarray(grid[i_0:i_0 + block_size, j_0:j_0 + block_size])
+        values[_indices] = block[rows[_indices] - i_0, cols[_indices] - j_0]
+    return values
+
+
+def find_cells(pieces, levels, block_sizes, h):
+    """
+    Follow the blocks holding the value h down the pyramid to the cells.
+
+    :param pieces: list -- result of split_window().
+    :param levels: list of arrays -- maxima or minima of the pyramid levels
+        followed by the grid itself.
+    :param block_sizes: list of int -- block sizes of the levels.
+    :param h: float -- the extreme value of the window.
+    :returns: tuple of arrays -- rows and columns of the cells in row-major
+        order.
+    """
+    # single cells form the last level below the pyramid
+    block_sizes = list(block_sizes) + [1]
+    nrows, ncols = levels[-1].shape
+    rows = [np.zeros(0, dtype=int)]
+    cols = [np.zeros(0, dtype=int)]
+    for level, i_0, i_1, j_0, j_1 in pieces:
+        selection = np.asarray(levels[level][i_0:i_1, j_0:j_1]) == h
+        if selection.sum() * 4 > selection.size:
+            # reading the whole piece is cheaper if most blocks match, e.g.
+            # in flat areas
+            block_size = block_sizes[level]
+            i_0, i_1 = i_0 * block_size, i_1 * block_size
+            j_0, j_1 = j_0 * block_size, j_1 * block_size
+            selection = np.asarray(levels[-1][i_0:i_1, j_0:j_1]) == h
+            level = len(levels) - 1
+        i, j = np.nonzero(selection)
+        i += i_0
+        j += j_0
+        for _level in range(level + 1, len(levels)):
+            factor = block_sizes[_level - 1] // block_sizes[_level]
+            offsets = np.arange(factor)
+            i = (i[:, None, None] * factor + offsets[None, :, None]
+                ).repeat(factor, axis=2).reshape(-1)
+            j = (j[:, None, None] * factor + offsets[None, None, :]
+                ).repeat(factor, axis=1).reshape(-1)
+            if _level == len(levels) - 1:
+                inside = (i < nrows) & (j < ncols)
+                i = i[inside]
+                j = j[inside]
+                values = get_cells(levels[-1], i, j, block_sizes[_level - 1])
+            else:
+                values = levels[_level][i, j]
+            selection = values == h
+            i = i[selection]
+            j = j[selection]
+        rows.append(i)
+        cols.append(j)
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    order = np.lexsort((cols, rows))
+    return rows[order], cols[order]
+
+
+class PyramidWindow:
+    """
+    Window of a grid searched through the min/max pyramid of the grid.
+
+    Sources of HeightInfo provide their rectangles as windows, see
+    HeightInfo.find_extreme().
+
+    :param levels: list of arrays -- maxima or minima of the pyramid levels
+        followed by the grid itself, or a function returning them which is
+        called when the window is first searched.
+    :param block_sizes: list of int -- block sizes of the levels.
+    :param window: tuple of int -- first row, row after, first column and
+        column after the window.
+    :param use_maximum: bool -- levels hold maxima instead of minima.
+    :param nodata: number -- value of missing data.
+    :param get_latlon: function -- converts arrays of rows and columns of
+        the grid to latitudes and longitudes.
+    :param bound: float -- known limit of the extreme value, e.g. of the
+        whole tile, None if unknown.
+    """
+
+    def __init__(self, levels, block_sizes, window, use_maximum, nodata,
+            get_latlon, bound=None):
+        self._levels = levels
+        self.block_sizes = list(block_sizes)
+        self.window = window
+        self.use_maximum = use_maximum
+        self.nodata = nodata
+        self.get_latlon = get_latlon
+        self.bound = bound
+        self._pieces = None
+        self._extreme = None
+
+    @property
+    def levels(self):
+        if callable(self._levels):
+            self._levels = self._levels()
+        return self._levels
+
+    @property
+    def pieces(self):
+        if self._pieces is None:
+            self._pieces = split_window(*self.window, self.levels[-1].shape,
+                self.block_sizes)
+        return self._pieces
+
+    def get_extreme(self):
+        """
+        :returns: float -- the extreme value, None if there is no data.
+        """
+        if self._extreme is None:
+            h = get_extreme(self.pieces, self.levels, self.use_maximum,
+                self.nodata)
+            self._extreme = (None if h is None or h <= self.nodata else h,)
+        return self._extreme[0]
+
+    def find_cells(self, h):
+        """
+        :param h: float -- the extreme value of the window.
+        :returns: tuple of arrays -- rows and columns of the cells holding
+            h.
+        """
+        return find_cells(self.pieces, self.levels, self.block_sizes, h)
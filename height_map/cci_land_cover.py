@@ -1,5 +1,6 @@
 import os
 import json
+from height_map import check_coordinates
 from height_map.geotiff_handler import GeoTiffHandler
 
 
@@ -23,11 +24,18 @@ class LandCover:
             self.legend = json.load(f)
         self.gth = GeoTiffHandler(os.path.join(path, file_name))
 
+    def reopen(self):
+        self.gth.reopen()
+
     def get_value_at_position(self, lat, lon):
         if not (-90 <= lat <= 90 and -180 <= lon <= 180):
             raise ValueError('invalid coordinates ({}, {})'.format(lat, lon))
         return self.gth.get_value_at_position(lat, lon)
 
+    def get_values_at_positions(self, lats, lons):
+        lats, lons = check_coordinates(lats, lons)
+        return self.gth.get_values_at_positions(lats, lons)
+
     def get_data_at_position(self, lat, lon):
         value = self.get_value_at_position(lat, lon)
         _legend = self.legend.get(str(value))
@@ -18,9 +18,15 @@ class WaterBodies:
         self.gth = GeoTiffHandler(os.path.join(path, file_name))
         self.legend = {'0': 'Ocean', '1': 'Land', '2': 'Water'}
 
+    def reopen(self):
+        self.gth.reopen()
+
     def get_value_at_position(self, lat, lon):
         return self.gth.get_value_at_position(lat, lon)
 
+    def get_values_at_positions(self, lats, lons):
+        return self.gth.get_values_at_positions(lats, lons)
+
     def get_data_at_position(self, lat, lon):
         if not (-90 <= lat <= 90 and -180 <= lon <= 180):
             raise ValueError('invalid coordinates ({}, {})'.format(lat, lon))
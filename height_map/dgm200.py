@@ -1,8 +1,10 @@
 import os
-import pygeodesy
-import struct
 import logging
-from height_map import calculate_distance
+import numpy as np
+from height_map import (calculate_distance, calculate_distances,
+    check_coordinates)
+from height_map.block_pyramid import (create_levels, split_window,
+    get_extreme, find_cells, PyramidWindow)
 
 XLLCENTER = 280000
 YLLCENTER = 5236000
@@ -13,18 +15,111 @@ LAT_MIN = 47.141612
 LAT_MAX = 55.016964
 LON_MIN = 5.557084
 LON_MAX = 15.572619
+# block sizes of the min/max pyramid, each dividing the previous one
+CACHE_BLOCK_SIZES = (64, 8)
+
+
+def _get_kruger_coefficients(n):
+    # series coefficients of Karney (2011), eqs. 35 and 36
+    alpha = np.array([
+        n/2 - 2*n**2/3 + 5*n**3/16 + 41*n**4/180 - 127*n**5/288 +
+        7891*n**6/37800,
+        13*n**2/48 - 3*n**3/5 + 557*n**4/1440 + 281*n**5/630 -
+        1983433*n**6/1935360,
+        61*n**3/240 - 103*n**4/140 + 15061*n**5/26880 + 167603*n**6/181440,
+        49561*n**4/161280 - 179*n**5/168 + 6601661*n**6/7257600,
+        34729*n**5/80640 - 3418889*n**6/1995840,
+        212378941*n**6/319334400])
+    beta = np.array([
+        n/2 - 2*n**2/3 + 37*n**3/96 - n**4/360 - 81*n**5/512 +
+        96199*n**6/604800,
+        n**2/48 + n**3/15 - 437*n**4/1440 + 46*n**5/105 -
+        1118711*n**6/3870720,
+        17*n**3/480 - 37*n**4/840 - 209*n**5/4480 + 5569*n**6/90720,
+        4397*n**4/161280 - 11*n**5/504 - 830251*n**6/7257600,
+        4583*n**5/161280 - 108847*n**6/3991680,
+        20648693*n**6/638668800])
+    return alpha, beta
+
+
+# UTM zone 32N on the WGS84 ellipsoid
+UTM_A = 6378137.
+UTM_F = 1 / 298.257223563
+UTM_K0 = 0.9996
+UTM_LON0 = np.radians(9.)
+UTM_FALSE_EASTING = 500000.
+_UTM_E = np.sqrt(UTM_F * (2 - UTM_F))
+_UTM_N = UTM_F / (2 - UTM_F)
+_UTM_A = UTM_A / (1 + _UTM_N) * (1 + _UTM_N**2/4 + _UTM_N**4/64 +
+    _UTM_N**6/256)
+_UTM_ALPHA, _UTM_BETA = _get_kruger_coefficients(_UTM_N)
+_UTM_J = 2 * np.arange(1, 7)
+
+
+def _conformal_tan(tau):
+    sigma = np.sinh(_UTM_E * np.arctanh(_UTM_E * tau / np.sqrt(1 + tau**2)))
+    return tau * np.sqrt(1 + sigma**2) - sigma * np.sqrt(1 + tau**2)
+
+
+def to_utm32(latitudes, longitudes):
+    """
+    Project WGS84 coordinates to UTM zone 32N using Krüger's series like
+    pygeodesy.toUtm(), but for arrays of coordinates.
+
+    :param latitudes: array of float -- latitudes.
+    :param longitudes: array of float -- longitudes.
+    :returns: tuple of arrays -- eastings and northings in m.
+    """
+    tau = np.tan(np.radians(latitudes))
+    lam = np.radians(longitudes) - UTM_LON0
+    tau_prime = _conformal_tan(tau)
+    # complex notation zeta = xi + i*eta of Karney (2011), eq. 11
+    zeta_prime = np.arctan2(tau_prime, np.cos(lam)) + 1j * np.arcsinh(
+        np.sin(lam) / np.sqrt(tau_prime**2 + np.cos(lam)**2))
+    zeta = zeta_prime + np.sum(_UTM_ALPHA * np.sin(
+        _UTM_J * np.expand_dims(zeta_prime, -1)), axis=-1)
+    return (UTM_K0 * _UTM_A * zeta.imag + UTM_FALSE_EASTING,
+        UTM_K0 * _UTM_A * zeta.real)
+
+
+def from_utm32(eastings, northings):
+    """
+    Convert UTM zone 32N coordinates to WGS84, the inverse of to_utm32().
+
+    :param eastings: array of float -- eastings in m.
+    :param northings: array of float -- northings in m.
+    :returns: tuple of arrays -- latitudes and longitudes.
+    """
+    zeta = (np.asarray(northings, dtype=float) + 1j * (np.asarray(
+        eastings, dtype=float) - UTM_FALSE_EASTING)) / (UTM_K0 * _UTM_A)
+    zeta_prime = zeta - np.sum(_UTM_BETA * np.sin(
+        _UTM_J * np.expand_dims(zeta, -1)), axis=-1)
+    xi_prime = zeta_prime.real
+    eta_prime = zeta_prime.imag
+    tau_prime = np.sin(xi_prime) / np.sqrt(np.sinh(eta_prime)**2 +
+        np.cos(xi_prime)**2)
+    # Newton's method for the latitude
+    tau = tau_prime.copy()
+    for _ in range(5):
+        _tau_prime = _conformal_tan(tau)
+        delta = (tau_prime - _tau_prime) / np.sqrt(1 + _tau_prime**2) * (
+            1 + (1 - _UTM_E**2) * tau**2) / ((1 - _UTM_E**2) *
+            np.sqrt(1 + tau**2))
+        tau += delta
+        if np.all(np.abs(delta) < 1e-14):
+            break
+    lam = np.arctan2(np.sinh(eta_prime), np.cos(xi_prime))
+    return np.degrees(np.arctan(tau)), np.degrees(lam + UTM_LON0)
 
 
 def utm_to_ll(easting, northing):
-    _utm = pygeodesy.Utm(32, 'N', easting, northing)
-    _latlon = _utm.toLatLon()
-    return _latlon.lat, _latlon.lon
+    lat, lon = from_utm32(easting, northing)
+    return float(lat), float(lon)
 
 
 def ll_to_utm(latitude, longitude):
-    _utm = pygeodesy.toUtm(latitude, longitude)
-    _utm_32 = _utm.toUtm(32)
-    return _utm_32.easting, _utm_32.northing
+    easting, northing = to_utm32(latitude, longitude)
+    return float(easting), float(northing)
 
 
 # calculate the distance to the closest DGM200 reference point
@@ -61,10 +156,39 @@ def get_indices_from_latlon(latitude, longitude):
 def get_latlon_from_indices(x, y):
     easting = x*CELLSIZE + XLLCENTER
     northing = (NROWS - 1 - y)*CELLSIZE + YLLCENTER
+    if np.ndim(easting):
+        return from_utm32(easting, northing)
     lat, lon = utm_to_ll(easting, northing)
     return lat, lon
 
 
+def get_locations(mask, x_ll, y_ur):
+    # convert the positions of a window mask back to coordinates
+    y, x = np.nonzero(mask)
+    lats, lons = get_latlon_from_indices(x + x_ll, y + y_ur)
+    return list(zip(lats.tolist(), lons.tolist()))
+
+
+def get_cache_level_file(file, block_size):
+    return '{}_{}.npy'.format(os.path.splitext(file)[0], block_size)
+
+
+def create_cache_levels(grid, nodata):
+    return create_levels(grid, CACHE_BLOCK_SIZES, nodata)
+
+
+# read-only memory maps of DGM200 grids shared by all instances of a process
+_grids = {}
+
+
+def get_grid(file):
+    grid = _grids.get(file)
+    if grid is None:
+        grid = np.memmap(file, dtype='>f4', mode='r', shape=(NROWS, NCOLS))
+        _grids[file] = grid
+    return grid
+
+
 class Dgm200:
     logger = logging.getLogger(__name__)
     attribution_url = 'http://www.bkg.bund.de'
@@ -73,6 +197,8 @@ class Dgm200:
         attribution_url)
     precision = 10.0  # max height error of dgm200 dataset
     file = None
+    grid = None
+    cache_levels = []
     seabed_included = False
     NODATA = -9999
 
@@ -87,6 +213,71 @@ class Dgm200:
             self.file = file
         else:
             raise FileNotFoundError(file)
+        self.grid = get_grid(file)
+        self.cache_levels = self.load_cache_levels()
+
+    def load_cache_levels(self):
+        """
+        Load the min/max pyramid created by create_dgm200_min_max_cache.py.
+
+        Each level is memory mapped from a .npy file next to the grid named
+        after the block size, e.g. dgm200_utm32s_f4_64.npy holding
+        [minimum, maximum].
+
+        :returns: list of (block_size, minimum, maximum), coarse to fine.
+        """
+        cache_levels = []
+        for block_size in CACHE_BLOCK_SIZES:
+            level_file = get_cache_level_file(self.file, block_size)
+            if not os.path.isfile(level_file):
+                break
+            minimum, maximum = np.load(level_file, mmap_mode='r')
+            cache_levels.append((block_size, minimum, maximum))
+        return cache_levels
+
+    def read_window(self, x_ll, y_ll, x_ur, y_ur):
+        return np.asarray(self.grid[y_ur:y_ll + 1, x_ll:x_ur + 1])
+
+    def find_max(self, values, x_ll, y_ur):
+        h_max = self.NODATA
+        if values.size:
+            h_max = max(float(values.max()), self.NODATA)
+        return h_max, get_locations(values == h_max, x_ll, y_ur)
+
+    def find_min(self, values, x_ll, y_ur):
+        valid = values != self.NODATA
+        if not valid.any():
+            return self.NODATA, []
+        h_min = float(values[valid].min())
+        return h_min, get_locations(values == h_min, x_ll, y_ur)
+
+    def get_levels(self, use_maximum):
+        # block sizes and maxima or minima of the pyramid followed by the grid
+        block_sizes = [_b for _b, _minimum, _maximum in self.cache_levels]
+        levels = [_maximum if use_maximum else _minimum
+            for _b, _minimum, _maximum in self.cache_levels] + [self.grid]
+        return block_sizes, levels
+
+    def find_extreme_from_cache(self, x_ll, y_ll, x_ur, y_ur, use_maximum):
+        """
+        Find the maximum or minimum of a window using the min/max pyramid.
+
+        Only the blocks covering the window and the cells along its edges
+        are inspected. Blocks holding the extreme value are followed down
+        the pyramid to collect its locations.
+
+        :returns: tuple of (float, list) -- extreme value and its locations
+            in the same order as find_max() and find_min().
+        """
+        block_sizes, levels = self.get_levels(use_maximum)
+        pieces = split_window(y_ur, y_ll + 1, x_ll, x_ur + 1, self.grid.shape,
+            block_sizes)
+        h = get_extreme(pieces, levels, use_maximum, self.NODATA)
+        if h is None:
+            return self.NODATA, []
+        rows, cols = find_cells(pieces, levels, block_sizes, h)
+        lats, lons = get_latlon_from_indices(cols, rows)
+        return h, list(zip(lats.tolist(), lons.tolist()))
 
     def get_max_height(self, lat_ll, lon_ll, lat_ur, lon_ur):
         if not (-90 <= lat_ll <= 90 and -180 <= lon_ll <= 180 and
@@ -109,35 +300,14 @@ class Dgm200:
         (x_ur, y_ur) = get_indices_from_latlon(lat_ur, lon_ur)
         if x_ur == -1 or y_ur == -1:
             return result
-        #
-        h_max = self.NODATA
-        counter = 0
-        # start in the upper left edge of the target area
-        x_pos = x_ll
-        y_pos = y_ur
-        locations = []
-        with open(self.file, "rb") as f:
-            while y_ur <= y_pos <= y_ll:
-                #
-                f.seek((y_pos*NCOLS + x_pos) * 4)
-                num_values = x_ur - x_ll + 1
-                buf = f.read(num_values * 4)
-                values = struct.unpack('>{:d}f'.format(num_values), buf)
-                while x_ll <= x_pos <= x_ur:
-                    val = values[x_pos - x_ll]
-                    if val > h_max:
-                        h_max = val
-                        locations.clear()
-                        locations.append(get_latlon_from_indices(x_pos, y_pos))
-                        counter = 1
-                    elif val == h_max:
-                        locations.append(get_latlon_from_indices(x_pos, y_pos))
-                        counter += 1
-                    x_pos += 1
-                x_pos = x_ll
-                y_pos += 1
+        if self.cache_levels:
+            h_max, locations = self.find_extreme_from_cache(x_ll, y_ll, x_ur,
+                y_ur, True)
+        else:
+            values = self.read_window(x_ll, y_ll, x_ur, y_ur)
+            h_max, locations = self.find_max(values, x_ll, y_ur)
         result.update({'location_max': locations, 'h_max': h_max,
-            'counter_max': counter})
+            'counter_max': len(locations)})
         return result
 
     def get_min_height(self, lat_ll, lon_ll, lat_ur, lon_ur):
@@ -161,39 +331,14 @@ class Dgm200:
         x_ur, y_ur = get_indices_from_latlon(lat_ur, lon_ur)
         if x_ur == -1 or y_ur == -1:
             return result
-        #
-        h_min = -self.NODATA
-        counter = 0
-        # start in the upper left edge of the target area
-        x_pos = x_ll
-        y_pos = y_ur
-        locations = []
-        with open(self.file, "rb") as f:
-            while y_ur <= y_pos <= y_ll:
-                #
-                f.seek((y_pos*NCOLS + x_pos) * 4)
-                num_values = x_ur - x_ll + 1
-                buf = f.read(num_values * 4)
-                values = struct.unpack('>{:d}f'.format(num_values), buf)
-                while x_ll <= x_pos <= x_ur:
-                    val = values[x_pos - x_ll]
-                    if val == self.NODATA:
-                        pass
-                    elif val < h_min:
-                        h_min = val
-                        locations.clear()
-                        locations.append(get_latlon_from_indices(x_pos, y_pos))
-                        counter = 1
-                    elif val == h_min:
-                        locations.append(get_latlon_from_indices(x_pos, y_pos))
-                        counter += 1
-                    x_pos += 1
-                x_pos = x_ll
-                y_pos += 1
-        if h_min == -self.NODATA:
-            h_min = self.NODATA
+        if self.cache_levels:
+            h_min, locations = self.find_extreme_from_cache(x_ll, y_ll, x_ur,
+                y_ur, False)
+        else:
+            values = self.read_window(x_ll, y_ll, x_ur, y_ur)
+            h_min, locations = self.find_min(values, x_ll, y_ur)
         result.update({'location_min': locations, 'h_min': h_min,
-            'counter_min': counter})
+            'counter_min': len(locations)})
         return result
 
     def get_min_max_height(self, lat_ll, lon_ll, lat_ur, lon_ur):
@@ -219,58 +364,45 @@ class Dgm200:
         x_ur, y_ur = get_indices_from_latlon(lat_ur, lon_ur)
         if x_ur == -1 or y_ur == -1:
             return result
-        #
-        h_max = self.NODATA
-        h_min = -self.NODATA
-        counter_max = 0
-        counter_min = 0
-        # start in the upper left edge of the target area
-        x_pos = x_ll
-        y_pos = y_ur
-        locations_max = []
-        locations_min = []
-        with open(self.file, "rb") as f:
-            while y_ur <= y_pos <= y_ll:
-                #
-                f.seek((y_pos*NCOLS + x_pos) * 4)
-                num_values = x_ur - x_ll + 1
-                buf = f.read(num_values * 4)
-                values = struct.unpack('>{:d}f'.format(num_values), buf)
-                while x_ll <= x_pos <= x_ur:
-                    val = values[x_pos - x_ll]
-                    if val == self.NODATA:
-                        pass
-                    elif val < h_min:
-                        h_min = val
-                        locations_min.clear()
-                        locations_min.append(get_latlon_from_indices(x_pos,
-                            y_pos))
-                        counter_min = 1
-                    elif val == h_min:
-                        locations_min.append(get_latlon_from_indices(x_pos,
-                            y_pos))
-                        counter_min += 1
-                    if val > h_max:
-                        h_max = val
-                        locations_max.clear()
-                        locations_max.append(get_latlon_from_indices(x_pos,
-                            y_pos))
-                        counter_max = 1
-                    elif val == h_max:
-                        locations_max.append(get_latlon_from_indices(x_pos,
-                            y_pos))
-                        counter_max += 1
-                    x_pos += 1
-                x_pos = x_ll
-                y_pos += 1
-        if h_min == -self.NODATA:
-            h_min = self.NODATA
+        if self.cache_levels:
+            h_max, locations_max = self.find_extreme_from_cache(x_ll, y_ll,
+                x_ur, y_ur, True)
+            h_min, locations_min = self.find_extreme_from_cache(x_ll, y_ll,
+                x_ur, y_ur, False)
+        else:
+            values = self.read_window(x_ll, y_ll, x_ur, y_ur)
+            h_max, locations_max = self.find_max(values, x_ll, y_ur)
+            h_min, locations_min = self.find_min(values, x_ll, y_ur)
         result.update({
             'location_max': locations_max, 'h_max': h_max,
-            'counter_max': counter_max, 'location_min': locations_min,
-            'h_min': h_min, 'counter_min': counter_min})
+            'counter_max': len(locations_max), 'location_min': locations_min,
+            'h_min': h_min, 'counter_min': len(locations_min)})
         return result
 
+    def get_search_windows(self, lat_ll, lon_ll, lat_ur, lon_ur,
+            use_maximum):
+        """
+        Provide the rectangle as a window of the grid searched through the
+        min/max pyramid, see HeightInfo.find_extreme().
+
+        :returns: list of PyramidWindow -- empty if the rectangle is out of
+            bounds.
+        """
+        if (lat_ll < LAT_MIN or lat_ll > LAT_MAX or lon_ll < LON_MIN or
+                lon_ll > LON_MAX or lat_ur < LAT_MIN or lat_ur > LAT_MAX or
+                lon_ur < LON_MIN or lon_ur > LON_MAX):
+            return []
+        if lat_ll > lat_ur or lon_ll > lon_ur:
+            return []
+        (x_ll, y_ll) = get_indices_from_latlon(lat_ll, lon_ll)
+        (x_ur, y_ur) = get_indices_from_latlon(lat_ur, lon_ur)
+        if -1 in (x_ll, y_ll, x_ur, y_ur):
+            return []
+        block_sizes, levels = self.get_levels(use_maximum)
+        return [PyramidWindow(levels, block_sizes,
+            (y_ur, y_ll + 1, x_ll, x_ur + 1), use_maximum, self.NODATA,
+            lambda rows, cols: get_latlon_from_indices(cols, rows))]
+
     def get_height(self, latitude, longitude):
         if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
             raise ValueError('invalid coordinates ({}, {})'.format(latitude,
@@ -285,10 +417,7 @@ class Dgm200:
         x, y = get_indices_from_latlon(latitude, longitude)
         if x == -1 or y == -1:
             return result
-        with open(self.file, "rb") as f:
-            f.seek((y*NCOLS + x) * 4)  # go to the right spot,
-            buf = f.read(4)  # read four bytes and convert them:
-            val = struct.unpack('>f', buf)[0]  # ">f" is a four byte float
+        val = float(self.grid[y, x])
         lat_found, lon_found = get_latlon_from_indices(x, y)
         result.update({
             'lat_found': lat_found, 'lon_found': lon_found,
@@ -296,3 +425,39 @@ class Dgm200:
             'distance_m': calculate_distance(latitude, longitude, lat_found,
             lon_found)})
         return result
+
+    def get_heights(self, latitudes, longitudes):
+        """
+        Get the elevations of many locations at once.
+
+        :param latitudes: array of float -- latitudes.
+        :param longitudes: array of float -- longitudes.
+        :returns: dict of arrays with one entry per location.
+        """
+        latitudes, longitudes = check_coordinates(latitudes, longitudes)
+        altitudes = np.full(latitudes.shape, self.NODATA, dtype=float)
+        lats_found = np.full(latitudes.shape, np.nan)
+        lons_found = np.full(latitudes.shape, np.nan)
+        distances = np.zeros(latitudes.shape)
+        indices = np.flatnonzero((latitudes >= LAT_MIN) &
+            (latitudes <= LAT_MAX) & (longitudes >= LON_MIN) &
+            (longitudes <= LON_MAX))
+        eastings, northings = to_utm32(latitudes[indices],
+            longitudes[indices])
+        x = np.rint((eastings - XLLCENTER) / CELLSIZE).astype(int)
+        y = np.rint(NROWS - 1 - (northings - YLLCENTER) / CELLSIZE).astype(int)
+        valid = (x >= 0) & (x < NCOLS) & (y >= 0) & (y < NROWS)
+        indices = indices[valid]
+        x = x[valid]
+        y = y[valid]
+        altitudes[indices] = np.rint(self.grid[y, x].astype(float) * 100
+            ) / 100
+        lats_found[indices], lons_found[indices] = get_latlon_from_indices(
+            x, y)
+        distances[indices] = calculate_distances(latitudes[indices],
+            longitudes[indices], lats_found[indices], lons_found[indices])
+        return {
+            'lat': latitudes, 'lon': longitudes, 'lat_found': lats_found,
+            'lon_found': lons_found, 'altitude_m': altitudes,
+            'source': self.attribution_name, 'distance_m': distances,
+            'attributions': [self.attribution]}
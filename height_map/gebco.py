@@ -2,7 +2,11 @@ import h5py
 import os
 import json
 import numpy as np
-from height_map import calculate_distance
+from height_map import (calculate_distance, calculate_distances,
+    check_coordinates, group_indices)
+from height_map.block_cache import BlockCache
+from height_map.block_pyramid import PyramidWindow
+from height_map.gebco_tiles import TiledGrid
 from height_map.timeit import timeit
 
 NCOLS = 86400
@@ -10,6 +14,10 @@ NROWS = 43200
 CELLSIZE = 1./240
 XLLCENTER = -180.
 YLLCENTER = -90.
+# block sizes of the min/max cache pyramid in cells (1 deg, 15', 3')
+CACHE_BLOCK_SIZES = [240, 60, 12]
+# cells read at once from a dataset without chunked layout
+CONTIGUOUS_CHUNK_SHAPE = (16, 240)
 
 
 def get_index_from_latitude(lat):
@@ -36,27 +44,164 @@ class Gebco:
         attribution_name)
     seabed_included = True
     NODATA = -32768
-    old_i = None
-    old_j = None
-    old_val = None
+    # upper limit of memory used by decoded chunks
+    CACHE_SIZE = 64 * 1024**2
+    # raw data chunk cache of HDF5 used by window reads
+    RDCC_NBYTES = 16 * 1024**2
+    RDCC_NSLOTS = 10007
+    tiles_file_name = 'gebco_2023_tiles_i2.bin'
     h5_file = None
+    elevation = None
+    chunk_shape = CONTIGUOUS_CHUNK_SHAPE
 
     def __init__(self, path=None, file_name=None, cache_path=None,
-            cache_file_name=None):
+            cache_file_name=None, cache_size=None, rdcc_nbytes=None,
+            rdcc_nslots=None):
         pwd = os.path.dirname(os.path.abspath(__file__))
         if path is None:
             path = os.path.join(pwd, 'maps/gebco')
         if file_name is None:
             file_name = 'GEBCO_2023.nc'
+            # tiles created by create_gebco_tiles.py are preferred
+            if os.path.isfile(os.path.join(path, self.tiles_file_name)):
+                file_name = self.tiles_file_name
         if cache_path is None:
-            self.cache_path = pwd
+            cache_path = pwd
         if cache_file_name is None:
-            self.cache_file_name = 'gebco_2023_cache.json'
+            cache_file_name = 'gebco_2023_cache.json'
+        self.cache_path = cache_path
+        self.cache_file_name = cache_file_name
         file = os.path.join(path, file_name)
-        if os.path.isfile(file):
-            self.h5_file = h5py.File(file, 'r')
-        else:
+        if rdcc_nbytes is None:
+            rdcc_nbytes = self.RDCC_NBYTES
+        if rdcc_nslots is None:
+            rdcc_nslots = self.RDCC_NSLOTS
+        if cache_size is None:
+            cache_size = self.CACHE_SIZE
+        if not os.path.isfile(file):
             raise FileNotFoundError(file)
+        self.file_name = file
+        self.rdcc_nbytes = rdcc_nbytes
+        self.rdcc_nslots = rdcc_nslots
+        self.open_elevation()
+        if self.elevation.chunks is not None:
+            self.chunk_shape = self.elevation.chunks
+        # decoded chunks of the elevation dataset used by point requests
+        self.chunk_cache = BlockCache(cache_size)
+        self._cache_levels = None
+
+    def open_elevation(self):
+        if self.file_name.endswith('.bin'):
+            self.elevation = TiledGrid(self.file_name, (NROWS, NCOLS))
+        else:
+            self.h5_file = h5py.File(self.file_name, 'r',
+                rdcc_nbytes=self.rdcc_nbytes, rdcc_nslots=self.rdcc_nslots)
+            self.elevation = self.h5_file['elevation']
+
+    def reopen(self):
+        """
+        Open the HDF5 file again in a forked process, the handle of the
+        parent process must not be used. Memory mapped tiles are kept.
+        """
+        if self.h5_file is not None:
+            self.open_elevation()
+
+    def preload(self):
+        # map the min/max cache before worker processes are forked
+        return self.cache_levels
+
+    @property
+    def cache_levels(self):
+        if self._cache_levels is None:
+            self._cache_levels = self.load_cache_levels()
+        return self._cache_levels
+
+    def get_cache_level_file(self, block_size):
+        return os.path.join(self.cache_path, '{}_{}.npy'.format(
+            os.path.splitext(self.cache_file_name)[0], block_size))
+
+    def load_cache_levels(self):
+        """
+        Load the pyramid of block-wise minimum and maximum values.
+
+        Each level is memory mapped from a .npy file named after the block
+        size, e.g. gebco_2023_cache_60.npy holding [minimum, maximum]. The
+        1 degree level falls back to the JSON cache file.
+
+        :returns: list of (block_size, minimum, maximum), coarse to fine.
+        """
+        cache_levels = []
+        level_file = self.get_cache_level_file(CACHE_BLOCK_SIZES[0])
+        cache_file = os.path.join(self.cache_path, self.cache_file_name)
+        if os.path.isfile(level_file):
+            minimum, maximum = np.load(level_file, mmap_mode='r')
+        elif os.path.isfile(cache_file):
+            with open(cache_file, 'r') as f:
+                cache_data = json.load(f)
+            minimum = np.array(cache_data['minimum'], dtype=np.int16)
+            maximum = np.array(cache_data['maximum'], dtype=np.int16)
+        else:
+            return cache_levels
+        cache_levels.append((CACHE_BLOCK_SIZES[0], minimum, maximum))
+        for block_size in CACHE_BLOCK_SIZES[1:]:
+            level_file = self.get_cache_level_file(block_size)
+            if not os.path.isfile(level_file):
+                break
+            minimum, maximum = np.load(level_file, mmap_mode='r')
+            cache_levels.append((block_size, minimum, maximum))
+        return cache_levels
+
+    def refine_cache_blocks(self, i_blocks, j_blocks, value, use_maximum):
+        """
+        Follow blocks of the coarsest cache level down the pyramid.
+
+        Only sub-blocks whose cached extreme equals value are kept. Blocks
+        in which more than a quarter of the sub-blocks match (e.g. flat
+        areas) are not refined any further.
+
+        :returns: list of windows (i_ll, j_ll, i_ur, j_ur) in cell indices.
+        """
+        windows = []
+        block_size = CACHE_BLOCK_SIZES[0]
+        for _block_size, minimum, maximum in self.cache_levels[1:]:
+            cache = maximum if use_maximum else minimum
+            factor = block_size // _block_size
+            offsets = np.arange(factor)
+            _i = (i_blocks[:, None, None] * factor + offsets[None, :, None]
+                ).repeat(factor, axis=2)
+            _j = (j_blocks[:, None, None] * factor + offsets[None, None, :]
+                ).repeat(factor, axis=1)
+            selection = cache[_i, _j] == value
+            coarse = selection.sum(axis=(1, 2)) * 4 > factor**2
+            windows += [(int(_ib) * block_size, int(_jb) * block_size,
+                (int(_ib) + 1) * block_size, (int(_jb) + 1) * block_size)
+                for _ib, _jb in zip(i_blocks[coarse], j_blocks[coarse])]
+            selection[coarse] = False
+            i_blocks = _i[selection]
+            j_blocks = _j[selection]
+            block_size = _block_size
+        return windows + [(int(_ib) * block_size, int(_jb) * block_size,
+            (int(_ib) + 1) * block_size, (int(_jb) + 1) * block_size)
+            for _ib, _jb in zip(i_blocks, j_blocks)]
+
+    def get_chunk(self, i_chunk, j_chunk):
+        """
+        Get a decoded chunk of the elevation dataset.
+
+        Each chunk is read and decompressed once and kept in the chunk
+        cache, reading a single cell would decode the whole chunk anyway.
+        Tiles of a TiledGrid are memory mapped and need no cache.
+
+        :param i_chunk: int -- row of the chunk.
+        :param j_chunk: int -- column of the chunk.
+        :returns: numpy.ndarray
+        """
+        if isinstance(self.elevation, TiledGrid):
+            return self.elevation.tiles[i_chunk, j_chunk]
+        rows, cols = self.chunk_shape
+        return self.chunk_cache.get((i_chunk, j_chunk),
+            lambda: self.elevation[i_chunk*rows:(i_chunk+1)*rows,
+                j_chunk*cols:(j_chunk+1)*cols])
 
     def get_height(self, lat, lon):
         if not (-90 <= lat <= 90 and -180 <= lon <= 180):
@@ -66,16 +211,10 @@ class Gebco:
         j = get_index_from_longitude(lon)
         lat_found = get_lat_from_index(i)
         lon_found = get_lon_from_index(j)
-        if self.h5_file is None:
-            pass
-        elif self.old_i == i and self.old_j == j:
-            # same grid position, file access not necessary
-            val = self.old_val
-        else:
-            val = round(float(self.h5_file['elevation'][i][j]), 2)
-            self.old_i = i
-            self.old_j = j
-            self.old_val = val
+        if self.elevation is not None:
+            rows, cols = self.chunk_shape
+            chunk = self.get_chunk(i // rows, j // cols)
+            val = round(float(chunk[i % rows, j % cols]), 2)
         distance = calculate_distance(lat, lon, lat_found, lon_found)
         return {
             'lat': lat, 'lon': lon, 'lat_found': round(lat_found, 6),
@@ -83,6 +222,37 @@ class Gebco:
             'source': self.attribution_name,
             'distance_m': round(distance, 3), 'attributions': [self.attribution]}
 
+    def get_heights(self, lats, lons):
+        """
+        Get the elevations of many locations at once.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :returns: dict of arrays with one entry per location.
+        """
+        lats, lons = check_coordinates(lats, lons)
+        i = np.clip(np.rint((lats - YLLCENTER) / CELLSIZE).astype(int), 0,
+            NROWS - 1)
+        j = np.rint((lons - XLLCENTER) / CELLSIZE).astype(int) % NCOLS
+        lats_found = np.round(i*CELLSIZE + YLLCENTER, 6)
+        lons_found = np.round(j*CELLSIZE + XLLCENTER, 6)
+        altitudes = np.full(lats.shape, self.NODATA, dtype=float)
+        if self.elevation is not None:
+            rows, cols = self.chunk_shape
+            chunk_ids = i // rows * -(-NCOLS // cols) + j // cols
+            for _id, _indices in group_indices(chunk_ids):
+                _i = i[_indices]
+                _j = j[_indices]
+                chunk = self.get_chunk(_i[0] // rows, _j[0] // cols)
+                altitudes[_indices] = chunk[_i % rows, _j % cols]
+        distances = calculate_distances(lats, lons, lats_found, lons_found)
+        return {
+            'lat': lats, 'lon': lons, 'lat_found': lats_found,
+            'lon_found': lons_found, 'altitude_m': np.round(altitudes, 2),
+            'source': self.attribution_name,
+            'distance_m': np.round(distances, 3),
+            'attributions': [self.attribution]}
+
     @timeit
     def get_max_height(self, lat_ll, lon_ll, lat_ur, lon_ur):
         result = {'location_max': [], 'h_max': self.NODATA, 'counter_max': 0,
@@ -161,13 +331,45 @@ class Gebco:
             result['h_min'] = self.NODATA
         return result
 
+    def get_search_windows(self, lat_ll, lon_ll, lat_ur, lon_ur,
+            use_maximum):
+        """
+        Provide the rectangle as a window of the grid searched through the
+        min/max pyramid, see HeightInfo.find_extreme().
+
+        :returns: list of PyramidWindow -- empty without data or for an
+            incorrectly defined rectangle.
+        """
+        if lon_ur >= 180 - CELLSIZE/2:
+            lon_ur -= CELLSIZE
+        if self.elevation is None or lat_ll > lat_ur or lon_ll > lon_ur:
+            return []
+        i_ll = get_index_from_latitude(lat_ll)
+        j_ll = get_index_from_longitude(lon_ll)
+        i_ur = get_index_from_latitude(lat_ur)
+        j_ur = get_index_from_longitude(lon_ur)
+        # without the cache only windows smaller than a 1 degree block are
+        # read from the grid
+        block_size = CACHE_BLOCK_SIZES[0]
+        if not self.cache_levels and (
+                -(-i_ll // block_size) < (i_ur + 1) // block_size and
+                -(-j_ll // block_size) < (j_ur + 1) // block_size):
+            raise FileNotFoundError('GEBCO min/max cache file is missing.')
+        block_sizes = [_b for _b, _minimum, _maximum in self.cache_levels]
+        levels = [_maximum if use_maximum else _minimum
+            for _b, _minimum, _maximum in self.cache_levels] + [self.elevation]
+        return [PyramidWindow(levels, block_sizes,
+            (i_ll, i_ur + 1, j_ll, j_ur + 1), use_maximum, self.NODATA,
+            lambda rows, cols: (np.round(rows*CELLSIZE + YLLCENTER, 6),
+                np.round(cols*CELLSIZE + XLLCENTER, 6)))]
+
     @timeit
     def get_max_height_from_h5file(self, i_ll, j_ll, i_ur, j_ur):
         h_max = self.NODATA
         locations_max = []
         counter_max = 0
-        if self.h5_file is not None and i_ll < i_ur and j_ll < j_ur:
-            selection = self.h5_file['elevation'][i_ll:i_ur, j_ll:j_ur]
+        if self.elevation is not None and i_ll < i_ur and j_ll < j_ur:
+            selection = self.elevation[i_ll:i_ur, j_ll:j_ur]
             h_max = selection.max()
             x_max, y_max = np.where(selection == h_max)
             counter_max = len(x_max)
@@ -180,8 +382,8 @@ class Gebco:
         h_min = -self.NODATA
         locations_min = []
         counter_min = 0
-        if self.h5_file is not None and i_ll < i_ur and j_ll < j_ur:
-            selection = self.h5_file['elevation'][i_ll:i_ur, j_ll:j_ur]
+        if self.elevation is not None and i_ll < i_ur and j_ll < j_ur:
+            selection = self.elevation[i_ll:i_ur, j_ll:j_ur]
             h_min = selection.min()
             x_min, y_min = np.where(selection == h_min)
             counter_min = len(x_min)
@@ -197,8 +399,8 @@ class Gebco:
         h_min = -self.NODATA
         locations_min = []
         counter_min = 0
-        if self.h5_file is not None and i_ll < i_ur and j_ll < j_ur:
-            selection = self.h5_file['elevation'][i_ll:i_ur, j_ll:j_ur]
+        if self.elevation is not None and i_ll < i_ur and j_ll < j_ur:
+            selection = self.elevation[i_ll:i_ur, j_ll:j_ur]
             h_max = selection.max()
             x_max, y_max = np.where(selection == h_max)
             counter_max = len(x_max)
@@ -215,55 +417,52 @@ class Gebco:
     @timeit
     def get_max_locations_from_cache(self, i_ll, j_ll, i_ur, j_ur):
         locations_max = []
-        cache_file = os.path.join(self.cache_path, self.cache_file_name)
-        if os.path.isfile(cache_file) and i_ll < i_ur and j_ll < j_ur:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            max_cache = np.array(cache_data['maximum'])
+        if not self.cache_levels:
+            raise FileNotFoundError('GEBCO min/max cache file is missing.')
+        elif i_ll < i_ur and j_ll < j_ur:
+            max_cache = self.cache_levels[0][2]
             selection = max_cache[i_ll:i_ur, j_ll:j_ur]
             h_max = selection.max()
             x_max, y_max = np.where(selection == h_max)
-            locations_max = [(i_ll+_x, j_ll+_y) for _x, _y in zip(x_max, y_max)]
-        elif not os.path.isfile(cache_file):
-            raise FileNotFoundError('GEBCO min/max cache file is missing.')
+            locations_max = self.refine_cache_blocks(i_ll+x_max, j_ll+y_max,
+                h_max, use_maximum=True)
         return locations_max
 
     @timeit
     def get_min_locations_from_cache(self, i_ll, j_ll, i_ur, j_ur):
         locations_min = []
-        cache_file = os.path.join(self.cache_path, self.cache_file_name)
-        if os.path.isfile(cache_file) and i_ll < i_ur and j_ll < j_ur:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            min_cache = np.array(cache_data['minimum'])
+        if not self.cache_levels:
+            raise FileNotFoundError('GEBCO min/max cache file is missing.')
+        elif i_ll < i_ur and j_ll < j_ur:
+            min_cache = self.cache_levels[0][1]
             selection = min_cache[i_ll:i_ur, j_ll:j_ur]
             h_min = selection.min()
             x_min, y_min = np.where(selection == h_min)
-            locations_min = [(i_ll+_x, j_ll+_y) for _x, _y in zip(x_min, y_min)]
-        elif not os.path.isfile(cache_file):
-            raise FileNotFoundError('GEBCO min/max cache file is missing.')
+            locations_min = self.refine_cache_blocks(i_ll+x_min, j_ll+y_min,
+                h_min, use_maximum=False)
         return locations_min
 
     @timeit
     def get_min_max_locations_from_cache(self, i_ll, j_ll, i_ur, j_ur):
         locations = []
-        cache_file = os.path.join(self.cache_path, self.cache_file_name)
-        if os.path.isfile(cache_file) and i_ll < i_ur and j_ll < j_ur:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            max_cache = np.array(cache_data['maximum'])
-            selection = max_cache[i_ll:i_ur, j_ll:j_ur]
-            h_max = selection.max()
-            x_max, y_max = np.where(selection == h_max)
-            locations_max = [(i_ll+_x, j_ll+_y) for _x, _y in zip(x_max, y_max)]
-            min_cache = np.array(cache_data['minimum'])
-            selection = min_cache[i_ll:i_ur, j_ll:j_ur]
-            h_min = selection.min()
-            x_min, y_min = np.where(selection == h_min)
-            locations_min = [(i_ll+_x, j_ll+_y) for _x, _y in zip(x_min, y_min)]
-            locations = set(locations_max + locations_min)
-        elif not os.path.isfile(cache_file):
+        if not self.cache_levels:
             raise FileNotFoundError('GEBCO min/max cache file is missing.')
+        elif i_ll < i_ur and j_ll < j_ur:
+            locations_max = self.get_max_locations_from_cache(i_ll, j_ll,
+                i_ur, j_ur)
+            locations_min = self.get_min_locations_from_cache(i_ll, j_ll,
+                i_ur, j_ur)
+            windows = set(locations_max + locations_min)
+            # skip windows which are part of a larger window anyway
+            for _window in windows:
+                block_size = _window[2] - _window[0]
+                if not any((
+                        _window[0] - _window[0] % _b,
+                        _window[1] - _window[1] % _b,
+                        _window[0] - _window[0] % _b + _b,
+                        _window[1] - _window[1] % _b + _b) in windows
+                        for _b in CACHE_BLOCK_SIZES if _b > block_size):
+                    locations.append(_window)
         return locations
 
     @timeit
@@ -298,11 +497,8 @@ class Gebco:
             cache_locations = self.get_max_locations_from_cache(
                 i_ll_cache//240, j_ll_cache//240, i_ur_cache//240,
                 j_ur_cache//240)
-            for _cache_location in cache_locations:
-                _i_ll = _cache_location[0] * 240
-                _j_ll = _cache_location[1] * 240
-                h5_results.append(self.get_max_height_from_h5file(_i_ll,
-                    _j_ll, _i_ll+240, _j_ll+240))
+            for _window in cache_locations:
+                h5_results.append(self.get_max_height_from_h5file(*_window))
             for _result in h5_results:
                 if not _result['location_max']:
                     pass
@@ -348,11 +544,8 @@ class Gebco:
             cache_locations = self.get_min_locations_from_cache(
                 i_ll_cache//240, j_ll_cache//240, i_ur_cache//240,
                 j_ur_cache//240)
-            for _cache_location in cache_locations:
-                _i_ll = _cache_location[0] * 240
-                _j_ll = _cache_location[1] * 240
-                h5_results.append(self.get_min_height_from_h5file(_i_ll, _j_ll,
-                    _i_ll+240, _j_ll+240))
+            for _window in cache_locations:
+                h5_results.append(self.get_min_height_from_h5file(*_window))
             for _result in h5_results:
                 if not _result['location_min']:
                     pass
@@ -401,11 +594,8 @@ class Gebco:
             cache_locations = self.get_min_max_locations_from_cache(
                 i_ll_cache//240, j_ll_cache//240, i_ur_cache//240,
                 j_ur_cache//240)
-            for _cache_location in cache_locations:
-                _i_ll = _cache_location[0] * 240
-                _j_ll = _cache_location[1] * 240
-                h5_results.append(self.get_min_max_height_from_h5file(_i_ll,
-                    _j_ll, _i_ll+240, _j_ll+240))
+            for _window in cache_locations:
+                h5_results.append(self.get_min_max_height_from_h5file(*_window))
             for _result in h5_results:
                 if not _result['location_max']:
                     pass
@@ -0,0 +1,75 @@
+import os
+import numpy as np
+
+# 1 degree tiles of 15 arc-second cells as little-endian int16
+TILE_SIZE = 240
+TILE_DTYPE = '<i2'
+
+
+class TiledGrid:
+    """
+    Read-only grid stored as one file of memory mapped square tiles.
+
+    The tiles are stored row by row, each tile holding its cells row by
+    row, so the tile (i, j) of a grid with n tile columns starts at
+    (i * n + j) * TILE_SIZE**2 cells. Windows are read by 2D slicing like
+    an h5py dataset.
+    """
+
+    def __init__(self, file_name, shape, tile_size=TILE_SIZE):
+        self.file_name = file_name
+        self.shape = shape
+        self.dtype = np.dtype(TILE_DTYPE)
+        # the tiles take the role of HDF5 chunks
+        self.chunks = (tile_size, tile_size)
+        self.tiles = np.memmap(file_name, dtype=TILE_DTYPE, mode='r',
+            shape=(shape[0] // tile_size, shape[1] // tile_size, tile_size,
+            tile_size))
+
+    def __getitem__(self, key):
+        rows, cols = key
+        i_0, i_1, _ = rows.indices(self.shape[0])
+        j_0, j_1, _ = cols.indices(self.shape[1])
+        window = np.zeros((max(i_1 - i_0, 0), max(j_1 - j_0, 0)),
+            dtype=self.dtype)
+        if window.size == 0:
+            return window
+        tile_size = self.chunks[0]
+        tj_0 = j_0 // tile_size
+        tj_1 = -(-j_1 // tile_size)
+        _j_0 = j_0 - tj_0 * tile_size
+        for ti in range(i_0 // tile_size, -(-i_1 // tile_size)):
+            # rows of the window within this row of tiles
+            _i_0 = max(i_0, ti * tile_size)
+            _i_1 = min(i_1, (ti + 1) * tile_size)
+            strip = self.tiles[ti, tj_0:tj_1, _i_0 - ti * tile_size:
+                _i_1 - ti * tile_size].transpose(1, 0, 2).reshape(
+                _i_1 - _i_0, -1)
+            window[_i_0 - i_0:_i_1 - i_0] = strip[:, _j_0:_j_0 + j_1 - j_0]
+        return window
+
+
+def write_tiles(elevation, file_name, tile_size=TILE_SIZE, log=print):
+    """
+    Rewrite a grid like the elevation dataset of GEBCO as TiledGrid file.
+
+    The grid is read strip by strip of one tile row to limit the memory
+    used. The file is replaced atomically when complete.
+
+    :param elevation: 2D array or h5py.Dataset -- the grid.
+    :param file_name: str -- path of the tile file to be written.
+    :param tile_size: int -- rows and columns of each tile.
+    :param log: function -- receives progress messages, None for silence.
+    """
+    nrows, ncols = elevation.shape
+    temp_file_name = file_name + '.tmp'
+    with open(temp_file_name, 'wb') as f:
+        for ti in range(nrows // tile_size):
+            strip = np.asarray(elevation[ti*tile_size:(ti+1)*tile_size, :],
+                dtype=TILE_DTYPE)
+            strip.reshape(tile_size, ncols // tile_size, tile_size
+                ).transpose(1, 0, 2).tofile(f)
+            if log is not None:
+                log('[{}/{}] tile rows written'.format(ti + 1,
+                    nrows // tile_size))
+    os.replace(temp_file_name, file_name)
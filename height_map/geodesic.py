@@ -0,0 +1,181 @@
+import numpy as np
+import pygeodesy.ellipsoidalExact as ee
+
+# WGS84 ellipsoid
+A = 6378137.
+F = 1 / 298.257223563
+B = A * (1 - F)
+E22 = (A / B)**2 - 1
+# convergence of the Vincenty iterations in radians, about 6 um
+EPSILON = 1e-12
+MAX_ITERATIONS = 200
+
+
+def _reduced_latitude(lats):
+    # sine, cosine and tangent of the reduced latitude
+    t = (1 - F) * np.tan(np.radians(lats))
+    c = 1 / np.hypot(1, t)
+    return c * t, c, t
+
+
+def _get_ab(ca2):
+    u2 = ca2 * E22
+    a = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    b = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    return a, b
+
+
+def _delta_sigma(b, cs, ss, c2sm, d):
+    c2sm2 = 2 * c2sm**2 - 1
+    ss2 = (4 * ss**2 - 3) * (2 * c2sm2 - 1)
+    return d + b * ss * (c2sm + b / 4 * (c2sm2 * cs - b / 6 * c2sm * ss2))
+
+
+def _delta_lambda(ca2, sa, s, cs, ss, c2sm, dl=0):
+    c = F * ca2 / 4
+    c *= F - 3 * c + 1
+    s = s + c * ss * (c2sm + c * cs * (2 * c2sm**2 - 1))
+    return dl + (1 - c) * F * sa * s
+
+
+def _bearing(y, x):
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def _wrap180(lons):
+    wrapped = np.mod(lons, 360)
+    wrapped[wrapped > 180] -= 360
+    wrapped[(lons < 0) & (wrapped == 180)] = -180
+    return wrapped
+
+
+def _inverse_exact(lat1, lon1, lat2, lon2):
+    return ee.LatLon(lat1, lon1).distanceTo3(ee.LatLon(lat2, lon2))[:3]
+
+
+def inverse(lats1, lons1, lats2, lons2):
+    """
+    Solve the inverse geodesic problem on the WGS84 ellipsoid for arrays
+    of start and end points.
+
+    Implements the Vincenty formulas like pygeodesy.ellipsoidalVincenty for
+    all positions at once. Nearly antipodal positions for which Vincenty
+    does not converge are solved by pygeodesy.ellipsoidalExact instead.
+
+    :param lats1: array of float -- latitudes of the start points.
+    :param lons1: array of float -- longitudes of the start points.
+    :param lats2: array of float -- latitudes of the end points.
+    :param lons2: array of float -- longitudes of the end points.
+    :returns: tuple of arrays -- distances in m, initial and final bearings
+        in degrees.
+    """
+    lats1, lons1, lats2, lons2 = (np.asarray(_a, dtype=float).reshape(-1)
+        for _a in (lats1, lons1, lats2, lons2))
+    s1, c1, _ = _reduced_latitude(lats1)
+    s2, c2, _ = _reduced_latitude(lats2)
+    c1c2, s1c2 = c1 * c2, s1 * c2
+    c1s2, s1s2 = c1 * s2, s1 * s2
+    dl = np.radians(lons2 - lons1)
+    ll = dl.copy()
+    ss = np.zeros(dl.shape)
+    cs = np.ones(dl.shape)
+    s = np.zeros(dl.shape)
+    ca2 = np.zeros(dl.shape)
+    c2sm = np.zeros(dl.shape)
+    # coincident positions remain at zero distance and bearing
+    active = np.ones(dl.shape, dtype=bool)
+    failed = np.zeros(dl.shape, dtype=bool)
+    for _ in range(MAX_ITERATIONS):
+        indices = np.flatnonzero(active)
+        if len(indices) == 0:
+            break
+        sll = np.sin(ll[indices])
+        cll = np.cos(ll[indices])
+        _ss = np.hypot(c2[indices] * sll, c1s2[indices] - s1c2[indices] * cll)
+        _cs = s1s2[indices] + c1c2[indices] * cll
+        singular = _ss < np.finfo(float).eps
+        failed[indices[singular & (_cs < 0)]] = True
+        active[indices[singular]] = False
+        ll[indices[singular]] = 0
+        indices = indices[~singular]
+        _ss = _ss[~singular]
+        _cs = _cs[~singular]
+        _s = np.arctan2(_ss, _cs)
+        _sa = c1c2[indices] * np.sin(ll[indices]) / _ss
+        _ca2 = 1 - _sa**2
+        _ca2[_ca2 < np.finfo(float).eps**2] = 0
+        equatorial = _ca2 == 0
+        _c2sm = np.where(equatorial, 0,
+            _cs - 2 * s1s2[indices] / np.where(equatorial, 1, _ca2))
+        _ll = _delta_lambda(_ca2, _sa, _s, _cs, _ss, _c2sm, dl[indices])
+        converged = np.abs(_ll - ll[indices]) < EPSILON
+        ll[indices] = _ll
+        ss[indices] = _ss
+        cs[indices] = _cs
+        s[indices] = _s
+        ca2[indices] = _ca2
+        c2sm[indices] = _c2sm
+        active[indices[converged]] = False
+    failed |= active
+    a, b = _get_ab(ca2)
+    distances = -B * a * _delta_sigma(b, cs, ss, c2sm, -s)
+    sll = np.sin(ll)
+    cll = np.cos(ll)
+    initial_bearings = _bearing(c2 * sll, c1s2 - s1c2 * cll)
+    final_bearings = _bearing(c1 * sll, -s1c2 + c1s2 * cll)
+    for _i in np.flatnonzero(failed):
+        distances[_i], initial_bearings[_i], final_bearings[_i] = (
+            _inverse_exact(lats1[_i], lons1[_i], lats2[_i], lons2[_i]))
+    return distances, initial_bearings, final_bearings
+
+
+def direct(lats, lons, distances, bearings):
+    """
+    Solve the direct geodesic problem on the WGS84 ellipsoid for arrays of
+    start points, distances and initial bearings.
+
+    :param lats: array of float -- latitudes of the start points.
+    :param lons: array of float -- longitudes of the start points.
+    :param distances: array of float -- distances in m.
+    :param bearings: array of float -- initial bearings in degrees.
+    :returns: tuple of arrays -- latitudes and longitudes of the
+        destinations and final bearings in degrees.
+    """
+    lats, lons, distances, bearings = np.broadcast_arrays(*(
+        np.asarray(_a, dtype=float).reshape(-1)
+        for _a in (lats, lons, distances, bearings)))
+    sb = np.sin(np.radians(bearings))
+    cb = np.cos(np.radians(bearings))
+    s1, c1, t1 = _reduced_latitude(lats)
+    s12 = 2 * np.arctan2(t1, cb)
+    sa = c1 * sb
+    ca2 = 1 - sa**2
+    ca2[ca2 < np.finfo(float).eps**2] = 0
+    a, b = _get_ab(ca2)
+    d = distances / (a * B)
+    s = d.copy()
+    ss = np.zeros(d.shape)
+    cs = np.ones(d.shape)
+    c2sm = np.ones(d.shape)
+    indices = np.arange(len(d))
+    for _ in range(MAX_ITERATIONS):
+        # keep the terms of the previous iteration like Vincenty
+        ss[indices] = np.sin(s[indices])
+        cs[indices] = np.cos(s[indices])
+        c2sm[indices] = np.cos(s12[indices] + s[indices])
+        _s = _delta_sigma(b[indices], cs[indices], ss[indices],
+            c2sm[indices], d[indices])
+        converged = np.abs(_s - s[indices]) < EPSILON
+        s[indices] = _s
+        indices = indices[~converged]
+        if len(indices) == 0:
+            break
+    else:
+        raise ValueError('no convergence of the direct geodesic problem')
+    t = s1 * ss - c1 * cs * cb
+    final_bearings = _bearing(sa, -t)
+    lats2 = np.degrees(np.arctan2(s1 * cs + c1 * cb * ss,
+        np.hypot(sa, t) * (1 - F)))
+    lons2 = _wrap180(np.degrees(np.arctan2(sb * ss, c1 * cs - s1 * cb * ss))
+        + lons - np.degrees(_delta_lambda(ca2, sa, s, cs, ss, c2sm)))
+    return lats2, lons2, final_bearings
@@ -1,10 +1,15 @@
-from osgeo import gdal, gdalconst
-import struct
+import threading
+from osgeo import gdal, gdalconst, gdal_array
+import numpy as np
+from height_map import group_indices
+from height_map.block_cache import BlockCache
 
 
 class GeoTiffHandler:
+    # upper limit of memory used by cached blocks
+    CACHE_SIZE = 64 * 1024**2
 
-    def __init__(self, file_name):
+    def __init__(self, file_name, cache_size=None):
         self._fmttypes = {
             gdalconst.GDT_Byte: 'B',
             gdalconst.GDT_Int16: 'h',
@@ -14,44 +19,160 @@ class GeoTiffHandler:
             gdalconst.GDT_Float32: 'f',
             gdalconst.GDT_Float64: 'f'
         }
+        self.file_name = file_name
         self.ds = gdal.Open(file_name, gdalconst.GA_ReadOnly)
         if self.ds is None:
             raise FileNotFoundError(file_name)
+        # GDAL datasets must not be shared between threads
+        self._local = threading.local()
         self.geo_transform = self.ds.GetGeoTransform()
         self.cols = self.ds.RasterXSize
         self.rows = self.ds.RasterYSize
         self.bands = self.ds.RasterCount
         self.inv_geo_transform = gdal.InvGeoTransform(self.geo_transform)
+        if cache_size is None:
+            cache_size = self.CACHE_SIZE
+        self.block_cache = BlockCache(cache_size)
+
+    def reopen(self):
+        """
+        Open the file again in a forked process, GDAL datasets of the
+        parent process must not be used.
+        """
+        self.ds = gdal.Open(self.file_name, gdalconst.GA_ReadOnly)
+        self._local = threading.local()
 
     def _pt2fmt(self, pt):
         return self._fmttypes.get(pt, 'x')
 
+    def get_pixels(self, lats, lons):
+        inv = self.inv_geo_transform
+        px = np.trunc(inv[0] + lons*inv[1] + lats*inv[2]).astype(int)
+        py = np.trunc(inv[3] + lons*inv[4] + lats*inv[5]).astype(int)
+        px[px == self.cols] -= 1
+        py[py == self.rows] -= 1
+        valid = (px >= 0) & (px < self.cols) & (py >= 0) & (py < self.rows)
+        return px, py, valid
+
+    def get_thread_dataset(self):
+        ds = getattr(self._local, 'ds', None)
+        if ds is None:
+            ds = gdal.Open(self.file_name, gdalconst.GA_ReadOnly)
+            self._local.ds = ds
+        return ds
+
+    def get_block(self, raster_band, block_x, block_y, ds=None):
+        """
+        Get one of the natural blocks of a raster band, e.g. a tile or strip.
+
+        :param raster_band: int -- number of the raster band.
+        :param block_x: int -- column of the block.
+        :param block_y: int -- row of the block.
+        :param ds: gdal.Dataset -- handle used for reading, defaults to
+            self.ds.
+        :returns: numpy.ndarray -- clipped to the raster at its edges.
+        """
+        if ds is None:
+            ds = self.ds
+        band = ds.GetRasterBand(raster_band)
+        block_cols, block_rows = band.GetBlockSize()
+
+        def read_block():
+            x_off = block_x * block_cols
+            y_off = block_y * block_rows
+            return band.ReadAsArray(x_off, y_off,
+                min(block_cols, self.cols - x_off),
+                min(block_rows, self.rows - y_off))
+
+        return self.block_cache.get((raster_band, block_x, block_y),
+            read_block)
+
+    def prefetch_blocks(self, lats, lons, executor, raster_band=1):
+        """
+        Read all blocks covering the given positions into the block cache in
+        the background, each worker thread uses a dataset of its own.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :param executor: concurrent.futures.Executor -- runs the reads.
+        :param raster_band: int -- number of the raster band.
+        :returns: list of concurrent.futures.Future
+        """
+        lats = np.asarray(lats, dtype=float).reshape(-1)
+        lons = np.asarray(lons, dtype=float).reshape(-1)
+        block_cols, block_rows = self.ds.GetRasterBand(
+            raster_band).GetBlockSize()
+        px, py, valid = self.get_pixels(lats, lons)
+        blocks = set(zip((px[valid] // block_cols).tolist(),
+            (py[valid] // block_rows).tolist()))
+        return [
+            executor.submit(self._prefetch_block, raster_band, _x, _y)
+            for _x, _y in sorted(blocks)
+            if (raster_band, _x, _y) not in self.block_cache]
+
+    def _prefetch_block(self, raster_band, block_x, block_y):
+        self.get_block(raster_band, block_x, block_y,
+            self.get_thread_dataset())
+
     def get_value_at_position(self, lat, lon, raster_band=1):
         band = self.ds.GetRasterBand(raster_band)
         nodata_value = band.GetNoDataValue()
         fmt = self._pt2fmt(band.DataType)
-        px, py = gdal.ApplyGeoTransform(self.inv_geo_transform, lon, lat)
-        px = int(px)
-        py = int(py)
-        if px == self.cols:
-            px -= 1
-        if py == self.rows:
-            py -= 1
-        if px > self.cols or py > self.rows or px < 0 or py < 0:
+        px, py, valid = self.get_pixels(np.array([lat], dtype=float),
+            np.array([lon], dtype=float))
+        if not valid[0]:
             if fmt == 'f':
                 return float('nan')
             else:
                 return None
-        structval = band.ReadRaster(px, py, 1, 1,
-            buf_type=band.DataType)
-        value = struct.unpack(fmt, structval)
-        if value[0] == nodata_value:
+        block_cols, block_rows = band.GetBlockSize()
+        px = int(px[0])
+        py = int(py[0])
+        block = self.get_block(raster_band, px // block_cols,
+            py // block_rows)
+        value = block[py % block_rows, px % block_cols].item()
+        if value == nodata_value:
             if fmt == 'f':
                 return float('nan')
             else:
                 return None
         else:
-            return value[0]
+            return value
+
+    def get_values_at_positions(self, lats, lons, raster_band=1):
+        """
+        Get the values of a raster band at many positions at once.
+
+        Positions are grouped by the natural blocks of the raster, each
+        block is read once and kept in the block cache.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :param raster_band: int -- number of the raster band.
+        :returns: numpy.ma.MaskedArray -- masked where no data is available.
+        """
+        lats = np.asarray(lats, dtype=float).reshape(-1)
+        lons = np.asarray(lons, dtype=float).reshape(-1)
+        band = self.ds.GetRasterBand(raster_band)
+        nodata_value = band.GetNoDataValue()
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType)
+        block_cols, block_rows = band.GetBlockSize()
+        px, py, valid = self.get_pixels(lats, lons)
+        values = np.zeros(lats.shape, dtype=dtype)
+        indices = np.flatnonzero(valid)
+        px = px[indices]
+        py = py[indices]
+        blocks_per_row = -(-self.cols // block_cols)
+        block_ids = (py // block_rows) * blocks_per_row + px // block_cols
+        for block_id, _indices in group_indices(block_ids):
+            block_y, block_x = divmod(int(block_id), blocks_per_row)
+            block = self.get_block(raster_band, block_x, block_y)
+            values[indices[_indices]] = block[py[_indices] % block_rows,
+                px[_indices] % block_cols]
+        mask = ~valid
+        if nodata_value is not None:
+            mask |= values == nodata_value
+        return np.ma.masked_array(values, mask=mask)
 
     def get_values_at_position(self, lat, lon):
         results = []
@@ -1,21 +1,37 @@
+import numpy as np
+from height_map import check_coordinates
 from height_map.terr50 import Terrain50
 from height_map.srtm1 import Srtm1
 from height_map.dgm200 import Dgm200
 from height_map.gebco import Gebco
 from height_map.cci_water_bodies_v4 import WaterBodies
+from height_map.prefetch import prefetch_files
+
+
+def get_subset(result, selection):
+    return {
+        key: value[selection] if isinstance(value, np.ndarray) else value
+        for key, value in result.items()}
 
 
 class HeightInfo:
     attribution_name = 'height_info'
     NODATA = -32768
+    # more locations of an extreme value indicate flat or missing data
+    MAX_EXTREME_LOCATIONS = 50
 
-    def __init__(self):
-        self.wb = WaterBodies()
-        self.srtm = Srtm1()
-        self.gebco = Gebco()
-        self.dgm = Dgm200()
-        self.terr50 = Terrain50()
+    def __init__(self, wb=None, srtm=None, gebco=None, dgm=None,
+            terr50=None):
+        # sources may be shared with other users, see sources.py
+        self.wb = WaterBodies() if wb is None else wb
+        self.srtm = Srtm1() if srtm is None else srtm
+        self.gebco = Gebco() if gebco is None else gebco
+        self.dgm = Dgm200() if dgm is None else dgm
+        self.terr50 = Terrain50() if terr50 is None else terr50
         self.sources = [self.terr50, self.dgm, self.gebco]
+        # source ids of get_source_ids() are indices of this list
+        self.source_names = ['NODATA'] + [_source.attribution_name
+            for _source in [self.dgm, self.terr50, self.srtm, self.gebco]]
 
     def get_height(self, lat, lon):
         """
@@ -66,6 +82,185 @@ class HeightInfo:
                 'distance_m': 0, 'source': 'NODATA', 'wb_label': wb_label,
                 'attributions': wb_attributions}
 
+    def get_heights(self, lats, lons):
+        """
+        Get the elevations of many locations from the best available data
+        sources, following the same rules as get_height.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :returns: dict of arrays with one entry per location.
+        """
+        lats, lons = check_coordinates(lats, lons)
+        result = {
+            'lat': lats, 'lon': lons,
+            'lat_found': np.full(lats.shape, np.nan),
+            'lon_found': np.full(lats.shape, np.nan),
+            'altitude_m': np.full(lats.shape, self.NODATA, dtype=float),
+            'distance_m': np.zeros(lats.shape),
+            'source': np.full(lats.shape, 'NODATA', dtype=object),
+            'attributions': [self.wb.attribution]}
+        wb_values = self.wb.get_values_at_positions(lats, lons)
+        wb_codes, wb_inverse = np.unique(wb_values.astype(int).filled(-1),
+            return_inverse=True)
+        result['wb_label'] = np.array([self.wb.legend.get(str(_code))
+            for _code in wb_codes], dtype=object)[wb_inverse]
+        is_ocean = result['wb_label'] == 'Ocean'
+
+        def take(indices, source_result, selection):
+            # store the selected results and return the remaining selection
+            _indices = indices[selection]
+            for key in ['lat_found', 'lon_found', 'altitude_m',
+                    'distance_m']:
+                result[key][_indices] = source_result[key][selection]
+            if len(_indices) > 0:
+                result['source'][_indices] = source_result['source']
+                for _attribution in source_result['attributions']:
+                    if _attribution not in result['attributions']:
+                        result['attributions'].insert(-1, _attribution)
+            return ~selection
+
+        indices = np.arange(len(lats))
+        dgm200_result = self.dgm.get_heights(lats, lons)
+        h_dgm200 = dgm200_result['altitude_m']
+        remaining = take(indices, dgm200_result,
+            (dgm200_result['distance_m'] < 25) & (h_dgm200 != self.dgm.NODATA)
+            & ~is_ocean)
+        # prefer sea floor bathymetry if possible
+        for source in [self.terr50, self.srtm]:
+            indices = indices[remaining]
+            source_result = source.get_heights(lats[indices], lons[indices])
+            h_source = source_result['altitude_m']
+            remaining = take(indices, source_result,
+                (h_source != source.NODATA) & ~is_ocean[indices] |
+                (h_source > 0))
+        indices = indices[remaining]
+        remaining = take(indices, get_subset(dgm200_result, indices),
+            (h_dgm200[indices] != self.dgm.NODATA) & ~is_ocean[indices])
+        indices = indices[remaining]
+        gebco_result = self.gebco.get_heights(lats[indices], lons[indices])
+        take(indices, gebco_result,
+            gebco_result['altitude_m'] != self.gebco.NODATA)
+        return result
+
+    def prefetch(self, lats, lons, executor):
+        """
+        Start reading the tiles and raster blocks get_heights needs for the
+        given locations, e.g. all points of a resampled track.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :param executor: concurrent.futures.Executor -- runs the reads.
+        :returns: list of concurrent.futures.Future
+        """
+        lats, lons = check_coordinates(lats, lons)
+        futures = self.wb.gth.prefetch_blocks(lats, lons, executor)
+        for source in [self.terr50, self.srtm]:
+            futures += prefetch_files(source.get_file_reads(lats, lons),
+                executor)
+        return futures
+
+    def get_source_ids(self, sources):
+        """
+        Encode the source names returned by get_heights as small integers.
+
+        :param sources: array of str -- source name per location.
+        :returns: array of uint8 -- index of each source in source_names.
+        """
+        names, inverse = np.unique(np.asarray(sources, dtype=str),
+            return_inverse=True)
+        ids = np.array([self.source_names.index(_name) for _name in names],
+            dtype=np.uint8)
+        return ids[inverse.reshape(-1)]
+
+    def get_altitude_list(self, result):
+        """
+        Convert the altitudes returned by get_heights to Python numbers of
+        the same types as returned by get_height, i.e. int for SRTM1 and
+        missing data and float for the other sources.
+
+        :param result: dict -- result of get_heights.
+        :returns: list of int or float -- one altitude per location.
+        """
+        is_int = np.isin(np.asarray(result['source'], dtype=str),
+            ['NODATA', self.srtm.attribution_name])
+        return [int(_altitude) if _is_int else _altitude
+            for _altitude, _is_int in zip(result['altitude_m'].tolist(),
+                is_int.tolist())]
+
+    def is_ocean(self, lats, lons):
+        """
+        Look up the water bodies of many locations at once.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :returns: array of bool -- True for locations in the ocean.
+        """
+        ocean_codes = [int(_code) for _code, _label in self.wb.legend.items()
+            if _label == 'Ocean']
+        wb_values = self.wb.get_values_at_positions(lats, lons)
+        return np.isin(wb_values.astype(int).filled(-1), ocean_codes)
+
+    def find_extreme(self, source, lat_ll, lon_ll, lat_ur, lon_ur,
+            use_maximum):
+        """
+        Search the maximum or minimum of a source and check its locations,
+        i.e. a few locations none of which is in the ocean unless the source
+        includes the sea floor.
+
+        The windows of the source are searched best first through their
+        min/max pyramids, skipping windows whose bound cannot beat the
+        extreme value found so far. The locations are only converted and
+        looked up in the water bodies if their number is acceptable.
+
+        :param source: data source providing get_search_windows().
+        :param use_maximum: bool -- search the maximum instead of the
+            minimum.
+        :returns: tuple of (float, list) -- extreme value and its locations
+            as (lat, lon) tuples, None if the source has no acceptable
+            extreme value.
+        """
+        sign = 1 if use_maximum else -1
+        windows = source.get_search_windows(lat_ll, lon_ll, lat_ur, lon_ur,
+            use_maximum)
+        # windows without a known bound have to be searched first
+        windows.sort(key=lambda _window: -np.inf if _window.bound is None
+            else -sign * _window.bound)
+        h_extreme = None
+        candidates = []
+        for _window in windows:
+            if (h_extreme is not None and _window.bound is not None and
+                    sign * (_window.bound - h_extreme) < 0):
+                break
+            h = _window.get_extreme()
+            if h is None:
+                continue
+            if h_extreme is None or sign * (h - h_extreme) > 0:
+                h_extreme = h
+                candidates = [_window]
+            elif h == h_extreme:
+                candidates.append(_window)
+        if h_extreme is None:
+            return None
+        cells = []
+        counter = 0
+        for _window in candidates:
+            rows, cols = _window.find_cells(h_extreme)
+            counter += len(rows)
+            if counter >= self.MAX_EXTREME_LOCATIONS:
+                return None
+            cells.append((_window, rows, cols))
+        lats, lons = [], []
+        for _window, rows, cols in cells:
+            _lats, _lons = _window.get_latlon(rows, cols)
+            lats += np.asarray(_lats, dtype=float).tolist()
+            lons += np.asarray(_lons, dtype=float).tolist()
+        if not lats:
+            return None
+        if not source.seabed_included and self.is_ocean(lats, lons).any():
+            return None
+        return float(h_extreme), list(zip(lats, lons))
+
     def get_max_height(self, lat_ll, lon_ll, lat_ur, lon_ur):
         if not (-90 <= lat_ll <= 90 and -180 <= lon_ll <= 180 and
                 -90 <= lat_ur <= 90 and -180 <= lon_ur <= 180):
@@ -106,61 +301,22 @@ class HeightInfo:
         result = {
             'location_max': [], 'h_max': self.NODATA, 'counter_max': 0,
             'location_min': [], 'h_min': self.NODATA, 'counter_min': 0,
+            'source_max': 'NODATA', 'source_min': 'NODATA',
             'source': self.attribution_name, 'attributions': []}
         # consider only correctly defined rectangle:
         if lat_ll > lat_ur or lon_ll > lon_ur:
             return result
-        max_found = False
-        min_found = False
-        for source in self.sources:
-            if not max_found and not min_found:
-                _result = source.get_min_max_height(lat_ll, lon_ll, lat_ur,
-                    lon_ur)
-                min_locations = _result['location_min']
-                max_locations = _result['location_max']
-                min_is_ocean = [
-                    self.wb.get_data_at_position(lat, lon)['label'] == 'Ocean'
-                    for lat, lon in min_locations]
-                max_is_ocean = [
-                    self.wb.get_data_at_position(lat, lon)['label'] == 'Ocean'
-                    for lat, lon in max_locations]
-                if 0 < len(min_locations) < 50 and (not any(min_is_ocean) or
-                        source.seabed_included):
-                    min_found = True
-                    _result['source_min'] = _result['source']
-                if 0 < len(max_locations) < 50 and (not any(max_is_ocean) or
-                        source.seabed_included):
-                    max_found = True
-                    _result['source_max'] = _result['source']
-                if not min_found and not max_found:
-                    continue
-            elif not max_found:
-                _result = source.get_max_height(lat_ll, lon_ll, lat_ur, lon_ur)
-                max_locations = _result['location_max']
-                max_is_ocean = [
-                    self.wb.get_data_at_position(lat, lon)['label'] == 'Ocean'
-                    for lat, lon in max_locations]
-                if 0 < len(max_locations) < 50 and (not any(max_is_ocean) or
-                        source.seabed_included):
-                    max_found = True
-                    _result['source_max'] = _result['source']
-                else:
-                    continue
-            elif not min_found:
-                _result = source.get_min_height(lat_ll, lon_ll, lat_ur, lon_ur)
-                min_locations = _result['location_min']
-                min_is_ocean = [
-                    self.wb.get_data_at_position(lat, lon)['label'] == 'Ocean'
-                    for lat, lon in min_locations]
-                if 0 < len(min_locations) < 50 and (not any(min_is_ocean) or
-                        source.seabed_included):
-                    min_found = True
-                    _result['source_min'] = _result['source']
-                else:
+        for use_maximum, key in [(True, 'max'), (False, 'min')]:
+            # sources by priority, falling through if the extreme value of
+            # a source is not acceptable, e.g. in the ocean
+            for source in self.sources:
+                extreme = self.find_extreme(source, lat_ll, lon_ll, lat_ur,
+                    lon_ur, use_maximum)
+                if extreme is None:
                     continue
-            else:
+                h, locations = extreme
+                result.update({'location_' + key: locations, 'h_' + key: h,
+                    'counter_' + key: len(locations),
+                    'source_' + key: source.attribution_name})
                 break
-            _result.pop('attributions')
-            _result.pop('source')
-            result.update(_result)
         return result
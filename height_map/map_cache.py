@@ -0,0 +1,127 @@
+import os
+import json
+import numpy as np
+
+# one record per tile, sorted by tile file name, mtime and size of the
+# tile allow incremental rebuilds of the cache
+MAP_CACHE_DTYPE = np.dtype([
+    ('name', 'S16'), ('h_max', 'f4'), ('h_min', 'f4'),
+    ('counter_max', 'i4'), ('counter_min', 'i4'), ('mtime', 'f8'),
+    ('size', 'i8')])
+
+
+def get_blocks_key(block_size):
+    # optional field holding [minimum, maximum] of the blocks of a tile
+    return 'blocks_{}'.format(block_size)
+
+
+def get_map_cache_dtype(map_cache):
+    """
+    Extend MAP_CACHE_DTYPE by the block fields present in all entries.
+
+    :param map_cache: dict -- cache entries by tile file name.
+    :returns: numpy.dtype
+    """
+    keys = None
+    for entry in map_cache.values():
+        _keys = {_key for _key in entry if _key.startswith('blocks_')}
+        keys = _keys if keys is None else keys & _keys
+    if not keys:
+        return MAP_CACHE_DTYPE
+    entry = next(iter(map_cache.values()))
+    return np.dtype(MAP_CACHE_DTYPE.descr + [
+        (_key, 'f4', np.shape(entry[_key])) for _key in sorted(keys)])
+
+
+class MapCache:
+    """
+    Read-only view of a binary min/max cache with one record per tile.
+
+    The .npy file is memory mapped on first access, so creating an
+    instance does not read or parse anything.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._records = None
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = np.load(self.file_name, mmap_mode='r')
+        return self._records
+
+    def _find(self, name):
+        key = name.encode()
+        names = self.records['name']
+        index = int(np.searchsorted(names, key))
+        if index < len(names) and names[index] == key:
+            return index
+        return None
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, name, default=None):
+        index = self._find(name)
+        if index is None:
+            return default
+        return self._to_dict(self.records[index])
+
+    def items(self):
+        for record in self.records:
+            yield record['name'].decode(), self._to_dict(record)
+
+    @staticmethod
+    def _to_dict(record):
+        entry = {
+            key: record[key].item() for key in MAP_CACHE_DTYPE.names
+            if key != 'name'}
+        for key in record.dtype.names[len(MAP_CACHE_DTYPE.names):]:
+            entry[key] = np.array(record[key])
+        return entry
+
+
+def save_map_cache(file_name, map_cache):
+    """
+    Store a dict of min/max cache entries as binary cache file.
+
+    The file is replaced atomically, so running instances which mapped the
+    previous version are not affected.
+
+    :param file_name: str -- path of the .npy file to be written.
+    :param map_cache: dict -- cache entries by tile file name.
+    """
+    dtype = get_map_cache_dtype(map_cache)
+    records = np.zeros(len(map_cache), dtype=dtype)
+    for _i, name in enumerate(sorted(map_cache)):
+        records[_i]['name'] = name.encode()
+        for key in dtype.names[1:]:
+            records[_i][key] = map_cache[name].get(key, 0)
+    temp_file_name = file_name + '.tmp'
+    with open(temp_file_name, 'wb') as f:
+        np.save(f, records)
+    os.replace(temp_file_name, file_name)
+
+
+def load_map_cache(file_name):
+    """
+    Open a min/max cache, preferring the binary over the JSON format.
+
+    :param file_name: str -- path of the cache without or with either
+        .npy or .json extension.
+    :returns: MapCache or dict -- empty if no cache file is available.
+    """
+    base_name = os.path.splitext(file_name)[0]
+    if os.path.isfile(base_name + '.npy'):
+        return MapCache(base_name + '.npy')
+    if os.path.isfile(base_name + '.json'):
+        with open(base_name + '.json') as json_cache_file:
+            try:
+                return json.load(json_cache_file)
+            except json.decoder.JSONDecodeError:
+                pass
+    return {}
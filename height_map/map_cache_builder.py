@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+import fnmatch
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from height_map import srtm1, terr50
+from height_map.block_pyramid import create_levels
+from height_map.map_cache import (load_map_cache, save_map_cache,
+    get_blocks_key)
+
+# tile layout of the supported sources: file pattern, dtype, shape, NODATA
+# and the block sizes of the min/max pyramid of each tile
+TILE_FORMATS = {
+    'srtm1': ('*.hgt', '>i2', (srtm1.NROWS, srtm1.NCOLS), srtm1.Srtm1.NODATA,
+        srtm1.CACHE_BLOCK_SIZES),
+    'terr50': ('*.bin', '>f4', (terr50.NROWS, terr50.NCOLS),
+        terr50.Terrain50.NODATA, ()),
+}
+
+
+def find_tiles(path, pattern):
+    """
+    Collect all tiles matching the pattern below the given path.
+
+    :param path: str -- root directory of the tiles.
+    :param pattern: str -- file name pattern, e.g. '*.hgt'.
+    :returns: dict -- full path of each tile by its file name.
+    """
+    tiles = {}
+    for root, dirs, files in os.walk(path):
+        for file_name in fnmatch.filter(files, pattern):
+            tiles[file_name] = os.path.join(root, file_name)
+    return tiles
+
+
+def scan_tile(full_path, dtype, shape, nodata, block_sizes=()):
+    """
+    Determine the extreme values of a tile and how often they occur.
+
+    :param full_path: str -- path of the tile file.
+    :param dtype: str -- data type of the stored values.
+    :param shape: tuple -- number of rows and columns of the tile.
+    :param nodata: number -- value of missing data.
+    :param block_sizes: tuple of int -- levels of the min/max pyramid.
+    :returns: dict -- cache entry with h_max, h_min and their counters as
+        well as [minimum, maximum] of the blocks of each level.
+    """
+    values = np.fromfile(full_path, dtype=dtype, count=shape[0]*shape[1])
+    valid = values[values >= nodata]
+    h_max = valid.max() if valid.size else nodata
+    counter_max = int(np.count_nonzero(values == h_max))
+    valid = valid[valid > nodata]
+    if valid.size:
+        h_min = valid.min()
+        counter_min = int(np.count_nonzero(values == h_min))
+    else:
+        h_min = nodata
+        counter_min = 0
+    stat = os.stat(full_path)
+    entry = {
+        'counter_max': counter_max, 'counter_min': counter_min,
+        'h_max': np.asarray(h_max).item(), 'h_min': np.asarray(h_min).item(),
+        'mtime': stat.st_mtime, 'size': stat.st_size}
+    if block_sizes:
+        for block_size, minimum, maximum in create_levels(
+                values.reshape(shape), block_sizes, nodata):
+            entry[get_blocks_key(block_size)] = np.stack([minimum, maximum])
+    return entry
+
+
+def is_up_to_date(entry, full_path, block_sizes=()):
+    if entry is None:
+        return False
+    if not all(get_blocks_key(_b) in entry for _b in block_sizes):
+        return False
+    stat = os.stat(full_path)
+    return (entry.get('mtime') == stat.st_mtime and
+        entry.get('size') == stat.st_size)
+
+
+def build_map_cache(tiles, tile_format, map_cache=None, max_workers=None,
+        log=print):
+    """
+    Scan tiles in parallel and collect their min/max cache entries.
+
+    Entries of map_cache are kept for tiles whose modification time and
+    size did not change, entries of tiles which no longer exist are
+    dropped.
+
+    :param tiles: dict -- full path of each tile by its file name.
+    :param tile_format: str -- key of TILE_FORMATS.
+    :param map_cache: dict or MapCache -- previous cache, optional.
+    :param max_workers: int -- number of processes, defaults to CPU count.
+    :param log: function -- receives progress messages, None for silence.
+    :returns: tuple of (dict, dict) -- new cache entries and statistics.
+    """
+    pattern, dtype, shape, nodata, block_sizes = TILE_FORMATS[tile_format]
+    if map_cache is None:
+        map_cache = {}
+    t_start = time.time()
+    new_cache = {}
+    pending = []
+    for file_name in sorted(tiles):
+        entry = map_cache.get(file_name)
+        if is_up_to_date(entry, tiles[file_name], block_sizes):
+            new_cache[file_name] = entry
+        else:
+            pending.append(file_name)
+    stats = {
+        'tiles': len(tiles), 'scanned': len(pending),
+        'unchanged': len(new_cache),
+        'removed': sum(1 for _name, _entry in map_cache.items()
+            if _name not in tiles)}
+    scan = partial(scan_tile, dtype=dtype, shape=shape, nodata=nodata,
+        block_sizes=block_sizes)
+
+    def report(done, file_name, entry):
+        if log is not None:
+            log('[{}/{}] {}: min={}m, max={}m'.format(done, len(pending),
+                file_name, entry['h_min'], entry['h_max']))
+
+    if max_workers == 1 or len(pending) < 2:
+        for _done, file_name in enumerate(pending, 1):
+            new_cache[file_name] = scan(tiles[file_name])
+            report(_done, file_name, new_cache[file_name])
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(scan, tiles[file_name]): file_name
+                for file_name in pending}
+            for _done, future in enumerate(as_completed(futures), 1):
+                file_name = futures[future]
+                new_cache[file_name] = future.result()
+                report(_done, file_name, new_cache[file_name])
+    stats['seconds'] = round(time.time() - t_start, 3)
+    if stats['scanned'] and stats['seconds'] > 0:
+        stats['tiles_per_second'] = round(
+            stats['scanned'] / stats['seconds'], 1)
+    return new_cache, stats
+
+
+def get_default_paths(tile_format):
+    if tile_format == 'srtm1':
+        source = srtm1.Srtm1()
+    else:
+        source = terr50.Terrain50()
+    return source.path, os.path.join(source.cache_path,
+        '{}_map_cache.npy'.format(tile_format))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Create the min/max cache of SRTM1 or OS Terrain 50 '
+        'tiles.')
+    parser.add_argument('tile_format', choices=sorted(TILE_FORMATS))
+    parser.add_argument('--path', help='directory of the tiles')
+    parser.add_argument('--cache-file', help='.npy cache file to write')
+    parser.add_argument('--workers', type=int,
+        help='number of processes, defaults to the number of CPUs')
+    parser.add_argument('--full', action='store_true',
+        help='rescan all tiles instead of changed ones only')
+    parser.add_argument('--quiet', action='store_true',
+        help='do not report each scanned tile')
+    args = parser.parse_args(argv)
+    path, cache_file = get_default_paths(args.tile_format)
+    if args.path is not None:
+        path = args.path
+    if args.cache_file is not None:
+        cache_file = args.cache_file
+    map_cache = None if args.full else load_map_cache(cache_file)
+    tiles = find_tiles(path, TILE_FORMATS[args.tile_format][0])
+    new_cache, stats = build_map_cache(tiles, args.tile_format, map_cache,
+        args.workers, None if args.quiet else print)
+    save_map_cache(os.path.splitext(cache_file)[0] + '.npy', new_cache)
+    print(', '.join('{}: {}'.format(*_item) for _item in stats.items()))
+    return stats
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,191 @@
+import numpy as np
+
+# WGS84 and Airy 1830 ellipsoids
+WGS84_A = 6378137.
+WGS84_F = 1 / 298.257223563
+AIRY_A = 6377563.396
+AIRY_F = 1 / 299.3249646
+# Helmert transformation WGS84 -> OSGB36, translations in m, rotations in
+# arc seconds and scale in ppm
+HELMERT_T = np.array([-446.448, 125.157, -542.060])
+HELMERT_R = np.radians(np.array([-0.1502, -0.2470, -0.8421]) / 3600)
+HELMERT_S = 20.4894e-6
+# transverse Mercator projection of the National Grid
+F0 = 0.9996012717
+PHI0 = np.radians(49.)
+LAM0 = np.radians(-2.)
+E0 = 400000.
+N0 = -100000.
+# extent of the National Grid
+EASTING_MAX = 700000.
+NORTHING_MAX = 1300000.
+# convergence of the meridional arc when converting from grid coordinates
+EPSILON = 1e-5
+MAX_ITERATIONS = 32
+
+_AIRY_E2 = AIRY_F * (2 - AIRY_F)
+_AIRY_N = AIRY_F / (2 - AIRY_F)
+_WGS84_E2 = WGS84_F * (2 - WGS84_F)
+_M = np.array([
+    (4 + 4*_AIRY_N + 5*_AIRY_N**2 + 5*_AIRY_N**3) / 4,
+    (24*_AIRY_N + 24*_AIRY_N**2 + 21*_AIRY_N**3) / 8,
+    (15*_AIRY_N**2 + 15*_AIRY_N**3) / 8,
+    35*_AIRY_N**3 / 24])
+
+
+def _get_letter(index):
+    # the letter I is not used
+    return chr(ord('A') + index + (index > 7))
+
+
+# two letter codes of the 100km squares indexed by [easting, northing]
+GRID_LETTERS = np.array([[
+    _get_letter((19 - _n) - (19 - _n) % 5 + (_e + 10) // 5) +
+    _get_letter((19 - _n) * 5 % 25 + _e % 5)
+    for _n in range(13)] for _e in range(7)])
+
+
+def _to_cartesian(phi, lam, a, e2):
+    nu = a / np.sqrt(1 - e2 * np.sin(phi)**2)
+    return np.stack([nu * np.cos(phi) * np.cos(lam),
+        nu * np.cos(phi) * np.sin(lam), nu * (1 - e2) * np.sin(phi)])
+
+
+def _from_cartesian(xyz, a, e2):
+    x, y, z = xyz
+    p = np.hypot(x, y)
+    phi = np.arctan2(z, p * (1 - e2))
+    for _ in range(5):
+        nu = a / np.sqrt(1 - e2 * np.sin(phi)**2)
+        h = p / np.cos(phi) - nu
+        phi = np.arctan2(z, p * (1 - e2 * nu / (nu + h)))
+    return phi, np.arctan2(y, x)
+
+
+def _helmert(xyz, inverse=False):
+    # small angle approximation, the inverse just flips all signs
+    sign = -1 if inverse else 1
+    s1 = 1 + sign * HELMERT_S
+    rx, ry, rz = sign * HELMERT_R
+    x, y, z = xyz
+    return np.stack([
+        x * s1 - y * rz + z * ry + sign * HELMERT_T[0],
+        x * rz + y * s1 - z * rx + sign * HELMERT_T[1],
+        -x * ry + y * rx + z * s1 + sign * HELMERT_T[2]])
+
+
+def _meridional_arc(phi):
+    d = phi - PHI0
+    s = phi + PHI0
+    return AIRY_A * (1 - AIRY_F) * F0 * (_M[0] * d -
+        _M[1] * np.sin(d) * np.cos(s) + _M[2] * np.sin(2 * d) * np.cos(2 * s) -
+        _M[3] * np.sin(3 * d) * np.cos(3 * s))
+
+
+def _nu_rho_eta2(sin_phi):
+    s = 1 - _AIRY_E2 * sin_phi**2
+    nu = AIRY_A * F0 / np.sqrt(s)
+    nu_rho = s / (1 - _AIRY_E2)
+    return nu, nu_rho, nu_rho - 1
+
+
+def to_national_grid(lats, lons):
+    """
+    Convert WGS84 coordinates to eastings and northings of the OS National
+    Grid.
+
+    Implements the Helmert transformation to OSGB36 and the transverse
+    Mercator formulas of the Ordnance Survey like pygeodesy.toOsgr() for
+    arrays of coordinates.
+
+    :param lats: array of float -- WGS84 latitudes.
+    :param lons: array of float -- WGS84 longitudes.
+    :returns: tuple of arrays -- eastings and northings in m.
+    """
+    xyz = _to_cartesian(np.radians(lats), np.radians(lons), WGS84_A,
+        _WGS84_E2)
+    phi, lam = _from_cartesian(_helmert(xyz), AIRY_A, _AIRY_E2)
+    sin_phi = np.sin(phi)
+    cos_phi = np.cos(phi)
+    tan2 = -np.tan(phi)**2
+    tan4 = tan2**2
+    nu, nu_rho, eta2 = _nu_rho_eta2(sin_phi)
+    lam = lam - LAM0
+    t = lam * sin_phi * nu / 2
+    d = lam * cos_phi
+    d2 = d**2
+    eastings = d * nu * (1 + d2 / 6 * (nu_rho + tan2 + d2 / 20 * (5 +
+        18 * tan2 + tan4 + 14 * eta2 + 58 * eta2 * tan2))) + E0
+    northings = d * t * (1 + d2 / 12 * (5 + tan2 + 9 * eta2 + d2 / 30 * (
+        61 + tan4 + 58 * tan2))) + _meridional_arc(phi) + N0
+    return eastings, northings
+
+
+def from_national_grid(eastings, northings):
+    """
+    Convert eastings and northings of the OS National Grid to WGS84
+    coordinates, the inverse of to_national_grid().
+
+    :param eastings: array of float -- eastings in m.
+    :param northings: array of float -- northings in m.
+    :returns: tuple of arrays -- WGS84 latitudes and longitudes.
+    """
+    e = np.asarray(eastings, dtype=float) - E0
+    n = np.asarray(northings, dtype=float) - N0
+    phi = np.full(n.shape, PHI0)
+    m = n.copy()
+    active = np.ones(n.shape, dtype=bool)
+    # iterate each position until its meridional arc converged
+    for _ in range(MAX_ITERATIONS):
+        phi[active] += m[active] / (AIRY_A * F0)
+        m[active] = n[active] - _meridional_arc(phi[active])
+        active &= np.abs(m) >= EPSILON
+        if not active.any():
+            break
+    else:
+        raise ValueError('no convergence of the meridional arc')
+    sin_phi = np.sin(phi)
+    cos_phi = np.cos(phi)
+    tan = np.tan(phi)
+    tan2 = tan**2
+    tan4 = tan2**2
+    nu, nu_rho, eta2 = _nu_rho_eta2(sin_phi)
+    tan = tan * nu_rho / 2
+    d = e / nu
+    d2 = d**2
+    phi = phi + d2 * tan * (-1 + d2 / 12 * ((5 + 3 * tan2 -
+        9 * tan2 * eta2 + eta2) - d2 / 30 * (61 + 90 * tan2 + 45 * tan4)))
+    lam = LAM0 + d / cos_phi * (1 - d2 / 6 * ((nu_rho + 2 * tan2) -
+        d2 / 20 * ((5 + 28 * tan2 + 24 * tan4) + d2 / 42 * (61 +
+        662 * tan2 + 1320 * tan4 + 720 * tan2 * tan4))))
+    xyz = _helmert(_to_cartesian(phi, lam, AIRY_A, _AIRY_E2), inverse=True)
+    phi, lam = _from_cartesian(xyz, WGS84_A, _WGS84_E2)
+    return np.degrees(phi), np.degrees(lam)
+
+
+def is_on_grid(eastings, northings):
+    return ((0 <= eastings) & (eastings < EASTING_MAX) & (0 <= northings) &
+        (northings < NORTHING_MAX))
+
+
+def get_grid_letters(eastings, northings):
+    """
+    Get the two letter codes of the 100km squares containing the positions.
+
+    :param eastings: array of float -- eastings in m, on the grid.
+    :param northings: array of float -- northings in m, on the grid.
+    :returns: array of str -- letter codes like 'TQ'.
+    """
+    return GRID_LETTERS[(np.asarray(eastings) // 100000).astype(int),
+        (np.asarray(northings) // 100000).astype(int)]
+
+
+def get_square_origin(letters):
+    """
+    Get the lower left corner of a 100km square.
+
+    :param letters: str -- two letter code like 'TQ'.
+    :returns: tuple of int -- easting and northing in m.
+    """
+    e, n = np.argwhere(GRID_LETTERS == letters)[0]
+    return int(e) * 100000, int(n) * 100000
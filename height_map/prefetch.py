@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# reading files releases the GIL, so a few threads overlap their I/O
+MAX_WORKERS = 8
+
+
+def get_row_ranges(rows, row_bytes):
+    """
+    Merge rows of a tile file into contiguous byte ranges.
+
+    :param rows: array of int -- row indices, unsorted and repeated.
+    :param row_bytes: int -- size of one row in bytes.
+    :returns: list of (offset, length) tuples.
+    """
+    rows = np.unique(rows)
+    if len(rows) == 0:
+        return []
+    starts = np.flatnonzero(np.diff(rows, prepend=rows[0] - 2) != 1)
+    ends = np.append(starts[1:], len(rows))
+    return [(int(rows[_start]) * row_bytes, int(_end - _start) * row_bytes)
+        for _start, _end in zip(starts, ends)]
+
+
+class FileHandles:
+    """
+    Pool of read-only file descriptors for positional reads.
+
+    os.pread does not move a file position, so any number of threads may
+    read through the same descriptor at once. The descriptors of the least
+    recently used files are closed when more than max_files files are open
+    and no thread is reading them.
+    """
+
+    def __init__(self, max_files=64):
+        self.max_files = max_files
+        # [fd, number of readers] by file path
+        self.handles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.handles)
+
+    def acquire(self, full_path):
+        """
+        Get a descriptor of the file and register a reader of it.
+
+        :param full_path: str -- path of the file.
+        :returns: int or None if the file does not exist.
+        """
+        with self.lock:
+            handle = self.handles.get(full_path)
+            if handle is not None:
+                handle[1] += 1
+                self.handles.move_to_end(full_path)
+                return handle[0]
+        try:
+            fd = os.open(full_path, os.O_RDONLY)
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+        with self.lock:
+            # another thread may have opened the same file meanwhile
+            handle = self.handles.setdefault(full_path, [fd, 0])
+            handle[1] += 1
+            self.handles.move_to_end(full_path)
+            self._close_unused()
+        if handle[0] != fd:
+            os.close(fd)
+        return handle[0]
+
+    def release(self, full_path):
+        with self.lock:
+            self.handles[full_path][1] -= 1
+            self._close_unused()
+
+    def _close_unused(self):
+        # expects the lock to be held
+        for _path in list(self.handles):
+            if len(self.handles) <= self.max_files:
+                break
+            fd, readers = self.handles[_path]
+            if readers == 0:
+                del self.handles[_path]
+                os.close(fd)
+
+    def clear(self):
+        with self.lock:
+            for _path in list(self.handles):
+                fd, readers = self.handles[_path]
+                if readers == 0:
+                    del self.handles[_path]
+                    os.close(fd)
+
+
+# shared by all threads of the process
+file_handles = FileHandles()
+
+
+def read_ranges(full_path, ranges, handles=None):
+    """
+    Read byte ranges of a file to pull them into the page cache, where the
+    memory mapped tiles find them later.
+
+    :param full_path: str -- path of the file.
+    :param ranges: list of (offset, length) tuples.
+    :param handles: FileHandles -- descriptors to read through, defaults to
+        the pool of the process.
+    :returns: int -- number of bytes read.
+    """
+    if handles is None:
+        handles = file_handles
+    fd = handles.acquire(full_path)
+    if fd is None:
+        return 0
+    try:
+        return sum(len(os.pread(fd, _length, _offset))
+            for _offset, _length in ranges)
+    finally:
+        handles.release(full_path)
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Get the thread pool of the process which runs the prefetching.
+
+    The threads live as long as the process, so the datasets they open
+    (see GeoTiffHandler.get_thread_dataset) are reused by later requests.
+    A forked process creates a pool of its own.
+
+    :returns: concurrent.futures.ThreadPoolExecutor
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                thread_name_prefix='prefetch')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def prefetch_files(file_reads, executor):
+    """
+    Submit the reads of several files to an executor.
+
+    :param file_reads: dict -- list of (offset, length) by file path.
+    :param executor: concurrent.futures.Executor -- runs the reads.
+    :returns: list of concurrent.futures.Future
+    """
+    return [executor.submit(read_ranges, _full_path, _ranges)
+        for _full_path, _ranges in file_reads.items()]
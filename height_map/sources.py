@@ -0,0 +1,104 @@
+import time
+import logging
+import threading
+from height_map.terr50 import Terrain50
+from height_map.srtm1 import Srtm1
+from height_map.dgm200 import Dgm200
+from height_map.gebco import Gebco
+from height_map.cci_water_bodies_v4 import WaterBodies
+from height_map.cci_land_cover import LandCover
+from height_map.height_info import HeightInfo
+
+logger = logging.getLogger(__name__)
+
+
+class SourceRegistry:
+    """
+    Data sources of the process, each constructed on first use and shared
+    by all its users.
+
+    The factories receive the registry to get the sources they depend on.
+    The registry may be shared between threads.
+    """
+
+    def __init__(self, factories):
+        self.factories = factories
+        self.sources = {}
+        # construction time in ms by name, including the time of sources
+        # constructed on the way
+        self.init_times = {}
+        # reentrant, factories get other sources while holding the lock
+        self.lock = threading.RLock()
+
+    def __contains__(self, name):
+        return name in self.sources
+
+    def get(self, name):
+        """
+        Get the source of the given name, constructing it if necessary.
+
+        :param name: str -- key of the factories.
+        :returns: object -- the source.
+        """
+        source = self.sources.get(name)
+        if source is not None:
+            return source
+        with self.lock:
+            if name not in self.sources:
+                ts = time.time()
+                source = self.factories[name](self)
+                self.init_times[name] = int((time.time() - ts) * 1000)
+                logger.info('%s initialised in %d ms' % (name,
+                    self.init_times[name]))
+                self.sources[name] = source
+        return self.sources[name]
+
+    def preload(self):
+        """
+        Construct all sources, e.g. in a server process before forking
+        workers which share the memory mapped data.
+        """
+        for name in self.factories:
+            source = self.get(name)
+            if hasattr(source, 'preload'):
+                source.preload()
+
+    def reopen(self):
+        """
+        Reopen the file handles of the constructed sources which must not
+        be shared with the parent process after a fork.
+        """
+        with self.lock:
+            for source in self.sources.values():
+                if hasattr(source, 'reopen'):
+                    source.reopen()
+
+    def clear(self):
+        with self.lock:
+            self.sources.clear()
+            self.init_times.clear()
+
+
+FACTORIES = {
+    'water_bodies': lambda registry: WaterBodies(),
+    'land_cover': lambda registry: LandCover(),
+    'terr50': lambda registry: Terrain50(),
+    'srtm1': lambda registry: Srtm1(),
+    'dgm200': lambda registry: Dgm200(),
+    'gebco': lambda registry: Gebco(),
+    'height_info': lambda registry: HeightInfo(
+        wb=registry.get('water_bodies'), srtm=registry.get('srtm1'),
+        gebco=registry.get('gebco'), dgm=registry.get('dgm200'),
+        terr50=registry.get('terr50')),
+}
+
+# shared by all modules of the process
+registry = SourceRegistry(FACTORIES)
+
+
+def get_height_info():
+    return registry.get('height_info')
+
+
+def get_land_cover():
+    return registry.get('land_cover')
@@ -1,13 +1,23 @@
-import struct
 from math import floor
-import json
 import os
-from height_map import calculate_distance
+import numpy as np
+from height_map import (
+    calculate_distance,
+    calculate_distances,
+    check_coordinates,
+    group_indices,
+)
+from height_map.block_pyramid import split_window, get_extreme, find_cells
+from height_map.map_cache import load_map_cache, get_blocks_key
+from height_map.prefetch import get_row_ranges
+from height_map.tile_pool import TilePool
 from height_map.timeit import timeit
 
 NCOLS = 3601
 NROWS = 3601
 CELLSIZE = 1.0 / 3600
+# block sizes of the min/max pyramid of each tile stored in the map cache
+CACHE_BLOCK_SIZES = (600, 120)
 
 
 def get_index_from_latitude(lat, yllcenter):
@@ -26,6 +36,20 @@ def get_lon_from_index(j, xllcenter):
     return j * CELLSIZE + xllcenter
 
 
+def get_locations(mask, list_item):
+    # convert the positions of a window mask back to coordinates
+    i, j = np.nonzero(mask)
+    return get_cell_locations(
+        i + list_item["i_ur"], j + list_item["j_ll"], list_item
+    )
+
+
+def get_cell_locations(i, j, list_item):
+    lats = get_lat_from_index(i, list_item["y_ll_tile"])
+    lons = get_lon_from_index(j, list_item["x_ll_tile"])
+    return list(zip(lats.tolist(), lons.tolist()))
+
+
 def get_filename(yllcenter, xllcenter):
     if yllcenter >= 0:
         if xllcenter >= 0:
@@ -54,10 +78,15 @@ class Srtm1:
     precision = 16.0  # 16m SRTM vertical error
     seabed_included = False
     NODATA = -32768
-    old_file = None
-    old_file_name = None
+    MAX_OPEN_TILES = 16
 
-    def __init__(self, path=None, cache_path=None, cache_file_name=None):
+    def __init__(
+        self,
+        path=None,
+        cache_path=None,
+        cache_file_name=None,
+        max_open_tiles=None,
+    ):
         pwd = os.path.dirname(os.path.abspath(__file__))
         if path is None:
             self.path = os.path.join(pwd, "maps/srtm1")
@@ -67,14 +96,12 @@ class Srtm1:
             cache_file_name = os.path.join(
                 self.cache_path, "srtm1_map_cache.json"
             )
-        if os.path.isfile(cache_file_name):
-            with open(cache_file_name) as json_cache_file:
-                try:
-                    self.map_cache = json.load(json_cache_file)
-                except json.decoder.JSONDecodeError:
-                    self.map_cache = {}
-        else:
-            self.map_cache = {}
+        # binary srtm1_map_cache.npy is preferred over the JSON version
+        self.map_cache = load_map_cache(cache_file_name)
+        if max_open_tiles is None:
+            max_open_tiles = self.MAX_OPEN_TILES
+        # memory mapped .hgt files shared by point and rectangle requests
+        self.tiles = TilePool(">i2", (NROWS, NCOLS), max_open_tiles)
 
     def create_filelist(self, lat_ll, lon_ll, lat_ur, lon_ur, file_list):
         # obtain the coordinates of the tile containing the lower left
@@ -177,45 +204,108 @@ class Srtm1:
                 filtered_files[file_name] = list_item
         return filtered_files
 
+    def read_window(self, file_name, list_item):
+        # target area of the memory mapped tile as big-endian int16
+        tile = self.tiles.get(os.path.join(self.path, file_name))
+        return np.asarray(
+            tile[
+                list_item["i_ur"] : list_item["i_ll"] + 1,
+                list_item["j_ll"] : list_item["j_ur"] + 1,
+            ]
+        )
+
+    def get_cache_levels(self, file_name):
+        """
+        Get the min/max pyramid of a tile from the map cache.
+
+        :param file_name: str -- name of the tile.
+        :returns: list of (block_size, minimum, maximum), coarse to fine,
+            empty if the map cache holds no blocks of the tile.
+        """
+        cache_data = self.map_cache.get(file_name) or {}
+        cache_levels = []
+        for block_size in CACHE_BLOCK_SIZES:
+            blocks = cache_data.get(get_blocks_key(block_size))
+            if blocks is None:
+                break
+            cache_levels.append((block_size, blocks[0], blocks[1]))
+        return cache_levels
+
+    def find_extreme(
+        self, file_name, list_item, cache_levels, h, use_maximum, values=None
+    ):
+        """
+        Find the maximum or minimum within the window of a tile.
+
+        Using the min/max pyramid of the tile, only the cells along the
+        edges of the window and those of blocks holding the extreme value
+        are read. Locations are only determined if the extreme value is
+        not beaten by h.
+
+        :param file_name: str -- name of the tile.
+        :param list_item: dict -- window of the tile from create_filelist.
+        :param cache_levels: list -- result of get_cache_levels.
+        :param h: int -- best extreme value found so far.
+        :param use_maximum: bool -- find the maximum instead of the minimum.
+        :param values: array -- the window if read already.
+        :returns: tuple of (int, list) -- extreme value, None for the
+            minimum of a window without data, and its locations.
+        """
+        if not cache_levels:
+            if values is None:
+                values = self.read_window(file_name, list_item)
+            if use_maximum:
+                _h = int(values.max())
+            else:
+                valid = values > self.NODATA
+                if not valid.any():
+                    return None, []
+                _h = int(values[valid].min())
+            if (_h < h) if use_maximum else (_h > h):
+                return _h, []
+            return _h, get_locations(values == _h, list_item)
+        block_sizes = [_level[0] for _level in cache_levels]
+        levels = [
+            _level[2] if use_maximum else _level[1] for _level in cache_levels
+        ]
+        levels.append(self.tiles.get(os.path.join(self.path, file_name)))
+        pieces = split_window(
+            list_item["i_ur"],
+            list_item["i_ll"] + 1,
+            list_item["j_ll"],
+            list_item["j_ur"] + 1,
+            (NROWS, NCOLS),
+            block_sizes,
+        )
+        _h = get_extreme(pieces, levels, use_maximum, self.NODATA)
+        if _h is None:
+            return None, []
+        _h = int(_h)
+        if (_h < h) if use_maximum else (_h > h):
+            return _h, []
+        i, j = find_cells(pieces, levels, block_sizes, _h)
+        return _h, get_cell_locations(i, j, list_item)
+
     @timeit
     def check_max_files(self, file_list):
         h_max = self.NODATA
         location_max = []
-        counter_max = 0
         for file_name, list_item in file_list.items():
-            j_ll = list_item["j_ll"]
-            i_ll = list_item["i_ll"]
-            j_ur = list_item["j_ur"]
-            i_ur = list_item["i_ur"]
-            x_ll_tile = list_item["x_ll_tile"]
-            y_ll_tile = list_item["y_ll_tile"]
-            # start in the upper left edge of the target area
-            i_pos = i_ur
-            j_pos = j_ll
-            full_path = os.path.join(self.path, file_name)
-            with open(full_path, "rb") as f:
-                while i_ur <= i_pos <= i_ll:
-                    f.seek((i_pos * NCOLS + j_pos) * 2)
-                    num_values = j_ur - j_ll + 1
-                    buf = f.read(num_values * 2)
-                    values = struct.unpack(">{:d}h".format(num_values), buf)
-                    while j_ll <= j_pos <= j_ur:
-                        # if current height value larger than previous maximum
-                        if values[j_pos - j_ll] > h_max:
-                            # store current height
-                            h_max = values[j_pos - j_ll]
-                            lat = get_lat_from_index(i_pos, y_ll_tile)
-                            lon = get_lon_from_index(j_pos, x_ll_tile)
-                            location_max = [(lat, lon)]
-                            counter_max = 1
-                        elif values[j_pos - j_ll] == h_max:
-                            lat = get_lat_from_index(i_pos, y_ll_tile)
-                            lon = get_lon_from_index(j_pos, x_ll_tile)
-                            location_max += [(lat, lon)]
-                            counter_max += 1
-                        j_pos += 1
-                    j_pos = j_ll
-                    i_pos += 1
+            _h_max, _locations = self.find_extreme(
+                file_name,
+                list_item,
+                self.get_cache_levels(file_name),
+                h_max,
+                True,
+            )
+            if _h_max < h_max:
+                continue
+            if _h_max > h_max:
+                h_max = _h_max
+                location_max = _locations
+            else:
+                location_max += _locations
+        counter_max = len(location_max)
         return {
             "location_max": location_max,
             "h_max": h_max,
@@ -226,39 +316,22 @@ class Srtm1:
     def check_min_files(self, file_list):
         h_min = -self.NODATA
         location_min = []
-        counter_min = 0
         for file_name, list_item in file_list.items():
-            j_ll = list_item["j_ll"]
-            i_ll = list_item["i_ll"]
-            j_ur = list_item["j_ur"]
-            i_ur = list_item["i_ur"]
-            x_ll_tile = list_item["x_ll_tile"]
-            y_ll_tile = list_item["y_ll_tile"]
-            # start in the upper left edge of the target area
-            i_pos = i_ur
-            j_pos = j_ll
-            full_path = os.path.join(self.path, file_name)
-            with open(full_path, "rb") as f:
-                while i_ur <= i_pos <= i_ll:
-                    f.seek((i_pos * NCOLS + j_pos) * 2)
-                    num_values = j_ur - j_ll + 1
-                    buf = f.read(num_values * 2)
-                    values = struct.unpack(">{:d}h".format(num_values), buf)
-                    while j_ll <= j_pos <= j_ur:
-                        if self.NODATA < values[j_pos - j_ll] < h_min:
-                            h_min = values[j_pos - j_ll]
-                            lat = get_lat_from_index(i_pos, y_ll_tile)
-                            lon = get_lon_from_index(j_pos, x_ll_tile)
-                            location_min = [(lat, lon)]
-                            counter_min = 1
-                        elif self.NODATA < values[j_pos - j_ll] == h_min:
-                            lat = get_lat_from_index(i_pos, y_ll_tile)
-                            lon = get_lon_from_index(j_pos, x_ll_tile)
-                            location_min += [(lat, lon)]
-                            counter_min += 1
-                        j_pos += 1
-                    j_pos = j_ll
-                    i_pos += 1
+            _h_min, _locations = self.find_extreme(
+                file_name,
+                list_item,
+                self.get_cache_levels(file_name),
+                h_min,
+                False,
+            )
+            if _h_min is None or _h_min > h_min:
+                continue
+            if _h_min < h_min:
+                h_min = _h_min
+                location_min = _locations
+            else:
+                location_min += _locations
+        counter_min = len(location_min)
         if h_min == -self.NODATA:
             h_min = self.NODATA
         return {
@@ -271,54 +344,34 @@ class Srtm1:
     def check_min_max_files(self, file_list):
         h_max = self.NODATA
         location_max = []
-        counter_max = 0
         h_min = -self.NODATA
         location_min = []
-        counter_min = 0
         for file_name, list_item in file_list.items():
-            j_ll = list_item["j_ll"]
-            i_ll = list_item["i_ll"]
-            j_ur = list_item["j_ur"]
-            i_ur = list_item["i_ur"]
-            x_ll_tile = list_item["x_ll_tile"]
-            y_ll_tile = list_item["y_ll_tile"]
-            # start in the upper left edge of the target area
-            i_pos = i_ur
-            j_pos = j_ll
-            full_path = os.path.join(self.path, file_name)
-            with open(full_path, "rb") as f:
-                while i_ur <= i_pos <= i_ll:
-                    f.seek((i_pos * NCOLS + j_pos) * 2)
-                    num_values = j_ur - j_ll + 1
-                    buf = f.read(num_values * 2)
-                    values = struct.unpack(">{:d}h".format(num_values), buf)
-                    while j_ll <= j_pos <= j_ur:
-                        if values[j_pos - j_ll] > h_max:
-                            # store current height
-                            h_max = values[j_pos - j_ll]
-                            lat = get_lat_from_index(i_pos, y_ll_tile)
-                            lon = get_lon_from_index(j_pos, x_ll_tile)
-                            location_max = [(lat, lon)]
-                            counter_max = 1
-                        elif values[j_pos - j_ll] == h_max:
-                            lat = get_lat_from_index(i_pos, y_ll_tile)
-                            lon = get_lon_from_index(j_pos, x_ll_tile)
-                            location_max += [(lat, lon)]
-                            counter_max += 1
-                        if self.NODATA < values[j_pos - j_ll] < h_min:
-                            h_min = values[j_pos - j_ll]
-                            lat = get_lat_from_index(i_pos, y_ll_tile)
-                            lon = get_lon_from_index(j_pos, x_ll_tile)
-                            location_min = [(lat, lon)]
-                            counter_min = 1
-                        elif self.NODATA < values[j_pos - j_ll] == h_min:
-                            lat = get_lat_from_index(i_pos, y_ll_tile)
-                            lon = get_lon_from_index(j_pos, x_ll_tile)
-                            location_min += [(lat, lon)]
-                            counter_min += 1
-                        j_pos += 1
-                    j_pos = j_ll
-                    i_pos += 1
+            cache_levels = self.get_cache_levels(file_name)
+            values = None
+            if not cache_levels:
+                # without pyramid the window is read once for both extremes
+                values = self.read_window(file_name, list_item)
+            _h_max, _locations = self.find_extreme(
+                file_name, list_item, cache_levels, h_max, True, values
+            )
+            if _h_max > h_max:
+                h_max = _h_max
+                location_max = _locations
+            elif _h_max == h_max:
+                location_max += _locations
+            _h_min, _locations = self.find_extreme(
+                file_name, list_item, cache_levels, h_min, False, values
+            )
+            if _h_min is None:
+                continue
+            if _h_min < h_min:
+                h_min = _h_min
+                location_min = _locations
+            elif _h_min == h_min:
+                location_min += _locations
+        counter_max = len(location_max)
+        counter_min = len(location_min)
         if h_min == -self.NODATA:
             h_min = self.NODATA
         return {
@@ -438,23 +491,13 @@ class Srtm1:
         val = self.NODATA
         lat_found = lat
         lon_found = lon
-        if os.path.isfile(fullpath):
+        tile = self.tiles.get(fullpath)
+        if tile is not None:
             # verified with
             # gdallocationinfo N52W002.hgt -wgs84 -1.215090 52.925315
             i = get_index_from_latitude(lat, y_ll_tile)
             j = get_index_from_longitude(lon, x_ll_tile)
-            if self.old_file_name == file_name:
-                f = self.old_file
-            else:
-                f = open(fullpath, "rb")
-                self.old_file_name = file_name
-                self.old_file = f
-            # go to the right spot,
-            f.seek((i * NCOLS + j) * 2)
-            # read two bytes and convert them:
-            buf = f.read(2)
-            # ">h" is a signed two byte integer
-            val = struct.unpack(">h", buf)[0]
+            val = int(tile[i, j])
             # turn indices back to coordinates
             lat_found = get_lat_from_index(i, y_ll_tile)
             lon_found = get_lon_from_index(j, x_ll_tile)
@@ -470,3 +513,81 @@ class Srtm1:
             ),
             "attributions": self.attributions.copy(),
         }
+
+    def group_by_tile(self, lats, lons):
+        """
+        Group locations by the tile containing them.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :returns: iterator of (full path, positions, row indices, column
+            indices, tile latitude, tile longitude) for each tile.
+        """
+        x_ll_tiles = np.floor(lons)
+        y_ll_tiles = np.floor(lats)
+        tile_keys = (y_ll_tiles + 90) * 360 + x_ll_tiles + 180
+        for _key, _indices in group_indices(tile_keys):
+            y_ll_tile = y_ll_tiles[_indices[0]]
+            x_ll_tile = x_ll_tiles[_indices[0]]
+            file_name = get_filename(y_ll_tile, x_ll_tile)
+            _lats = lats[_indices]
+            _lons = lons[_indices]
+            i = NROWS - np.rint((_lats - y_ll_tile) / CELLSIZE).astype(int)
+            i -= 1
+            j = np.rint((_lons - x_ll_tile) / CELLSIZE).astype(int)
+            yield (
+                os.path.join(self.path, file_name),
+                _indices,
+                i,
+                j,
+                y_ll_tile,
+                x_ll_tile,
+            )
+
+    def get_file_reads(self, lats, lons):
+        """
+        Plan the reads of get_heights for the given locations.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :returns: dict -- list of (offset, length) by tile path.
+        """
+        lats, lons = check_coordinates(lats, lons)
+        file_reads = {}
+        for full_path, _indices, i, *_ in self.group_by_tile(lats, lons):
+            # rows of 16 bit integers
+            file_reads[full_path] = get_row_ranges(i, NCOLS * 2)
+        return file_reads
+
+    def get_heights(self, lats, lons):
+        """
+        Get the elevations of many locations at once.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :returns: dict of arrays with one entry per location.
+        """
+        lats, lons = check_coordinates(lats, lons)
+        altitudes = np.full(lats.shape, self.NODATA, dtype=float)
+        lats_found = lats.copy()
+        lons_found = lons.copy()
+        for _tile in self.group_by_tile(lats, lons):
+            full_path, _indices, i, j, y_ll_tile, x_ll_tile = _tile
+            tile = self.tiles.get(full_path)
+            if tile is None:
+                continue
+            # one fancy-indexed read per tile
+            altitudes[_indices] = tile[i, j]
+            lats_found[_indices] = get_lat_from_index(i, y_ll_tile)
+            lons_found[_indices] = get_lon_from_index(j, x_ll_tile)
+        distances = calculate_distances(lats, lons, lats_found, lons_found)
+        return {
+            "lat": lats,
+            "lon": lons,
+            "lat_found": np.round(lats_found, 6),
+            "lon_found": np.round(lons_found, 6),
+            "altitude_m": altitudes,
+            "source": self.attribution_name,
+            "distance_m": np.round(distances, 3),
+            "attributions": self.attributions.copy(),
+        }
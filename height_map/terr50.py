@@ -1,9 +1,14 @@
 import os
-import struct
-import json
-from pygeodesy import ellipsoidalVincenty as eV
-from pygeodesy import toOsgr, parseOSGR, Osgr
-from height_map import calculate_distance
+import numpy as np
+from pygeodesy import Osgr
+from height_map import (calculate_distance, calculate_distances,
+    check_coordinates, group_indices)
+from height_map.block_pyramid import PyramidWindow
+from height_map.map_cache import load_map_cache
+from height_map.national_grid import (to_national_grid, from_national_grid,
+    is_on_grid, get_grid_letters, get_square_origin)
+from height_map.prefetch import get_row_ranges
+from height_map.tile_pool import TilePool
 from height_map.timeit import timeit
 
 CELLSIZE = 50
@@ -19,34 +24,84 @@ def get_y(osgr):
     return int(NROWS - 1 - osgr.northing % (NROWS * CELLSIZE) // CELLSIZE)
 
 
-def osgr_to_grid(osgr):
-    easting_remainder = osgr.easting % CELLSIZE
-    northing_remainder = osgr.northing % CELLSIZE
-    if easting_remainder > CELLSIZE / 2:
-        easting_remainder -= CELLSIZE
-    if northing_remainder > CELLSIZE / 2:
-        northing_remainder -= CELLSIZE
-    return Osgr(osgr.easting - easting_remainder,
-        osgr.northing - northing_remainder)
+def snap_to_grid(eastings, northings):
+    easting_remainders = eastings % CELLSIZE
+    northing_remainders = northings % CELLSIZE
+    easting_remainders = np.where(easting_remainders > CELLSIZE / 2,
+        easting_remainders - CELLSIZE, easting_remainders)
+    northing_remainders = np.where(northing_remainders > CELLSIZE / 2,
+        northing_remainders - CELLSIZE, northing_remainders)
+    return eastings - easting_remainders, northings - northing_remainders
+
+
+def latlon_to_osgr(lat, lon):
+    easting, northing = to_national_grid(lat, lon)
+    if not is_on_grid(easting, northing):
+        raise ValueError('not a valid OSGR coordinate')
+    return Osgr(float(easting), float(northing))
 
 
 def get_filename(osgr):
-    filename = osgr.toStr(prec=1, sep='') + '.bin'
-    return filename
+    return get_filenames(np.array([osgr.easting]),
+        np.array([osgr.northing]))[0]
+
+
+def get_filenames(eastings, northings):
+    # tiles of 10km named by the 100km square and the first digit of the
+    # easting and northing within, e.g. SU12.bin
+    letters = get_grid_letters(eastings, northings)
+    x_digits = (eastings % 100000 // 10000).astype(int)
+    y_digits = (northings % 100000 // 10000).astype(int)
+    return np.array(['{}{:d}{:d}.bin'.format(*_args) for _args in zip(
+        letters, x_digits, y_digits)], dtype=object)
+
+
+def get_grid_cells(lats, lons):
+    # project the requests and fit them to the grid
+    eastings, northings = to_national_grid(lats, lons)
+    valid = is_on_grid(eastings, northings)
+    eastings, northings = snap_to_grid(eastings, northings)
+    valid &= is_on_grid(eastings, northings)
+    return eastings, northings, valid
+
 
+def get_grid_cells_in_bounds(lats, lons):
+    # positions and grid cells of the locations covered by the grid
+    in_bounds = np.flatnonzero((lats >= 49.7) & (lats <= 62) &
+        (lons >= -10) & (lons <= 4))
+    eastings, northings, valid = get_grid_cells(lats[in_bounds],
+        lons[in_bounds])
+    return in_bounds[valid], eastings[valid], northings[valid]
 
-def get_lat_lon_from_indices(x, y, filename):
-    osgr = get_osgr_from_indices(x+1, y, filename)
-    latlon = osgr.toLatLon(eV.LatLon)
-    return latlon.lat, latlon.lon
 
+def get_tile_positions(x, y, filename):
+    # convert columns and rows of a tile to eastings and northings
+    easting_square, northing_square = get_square_origin(filename[-8:-6])
+    eastings = (x + int(filename[-6])*NCOLS) * CELLSIZE
+    northings = ((NROWS - 1 - y) + int(filename[-5])*NROWS) * CELLSIZE
+    return eastings + easting_square, northings + northing_square
 
-def get_osgr_from_indices(x, y, filename):
-    easting = (x + int(filename[-6])*NCOLS) * CELLSIZE
-    northing = ((NROWS - 1 - y) + int(filename[-5])*NROWS) * CELLSIZE
-    letters = filename[-8:-6]
-    osgr = parseOSGR('{}{:05d}{:05d}'.format(letters, easting, northing))
-    return osgr
+
+def get_grid_positions(mask, filename, list_item):
+    # convert the positions of a window mask to eastings and northings
+    y, x = np.nonzero(mask)
+    return [get_tile_positions(x + list_item['x_ll'], y + list_item['y_ur'],
+        filename)]
+
+
+def get_tile_locations(rows, cols, filename):
+    # convert rows and columns of a tile to latitudes and longitudes
+    return from_national_grid(*get_tile_positions(cols, rows, filename))
+
+
+def get_locations(grid_positions):
+    # convert all grid positions in one go
+    if not grid_positions:
+        return []
+    eastings = np.concatenate([_e for _e, _n in grid_positions])
+    northings = np.concatenate([_n for _e, _n in grid_positions])
+    lats, lons = from_national_grid(eastings, northings)
+    return list(zip(lats.tolist(), lons.tolist()))
 
 
 class Terrain50:
@@ -59,8 +114,10 @@ class Terrain50:
     NODATA = -32768
     precision = 4.0  # RMS error
     seabed_included = False
+    MAX_OPEN_TILES = 64
 
-    def __init__(self, path=None, cache_path=None, cache_file_name=None):
+    def __init__(self, path=None, cache_path=None, cache_file_name=None,
+            max_open_tiles=None):
         pwd = os.path.dirname(os.path.abspath(__file__))
         if path is None:
             self.path = os.path.join(pwd, 'maps/os_terr50_gb')
@@ -68,14 +125,11 @@ class Terrain50:
             self.cache_path = pwd
         if cache_file_name is None:
             cache_file_name = os.path.join(self.cache_path, 'terr50_map_cache.json')
-        if os.path.isfile(cache_file_name):
-            with open(cache_file_name) as json_cache_file:
-                try:
-                    self.map_cache = json.load(json_cache_file)
-                except json.decoder.JSONDecodeError:
-                    self.map_cache = {}
-        else:
-            self.map_cache = {}
+        # binary terr50_map_cache.npy is preferred over the JSON version
+        self.map_cache = load_map_cache(cache_file_name)
+        if max_open_tiles is None:
+            max_open_tiles = self.MAX_OPEN_TILES
+        self.tiles = TilePool('>f4', (NROWS, NCOLS), max_open_tiles)
 
     def get_height(self, lat, lon):
         if not (-90 <= lat <= 90 and -180 <= lon <= 180):
@@ -85,36 +139,99 @@ class Terrain50:
             'lon': lon, 'distance_m': 0, 'attributions': [self.attribution]}
         if lat < 49.7 or lat > 62 or lon < -10 or lon > 4:
             return result
-        try:
-            osgr = toOsgr(eV.LatLon(lat, lon))
-            if len(osgr.toStr()) == 0:
-                raise ValueError('not a valid OSGR coordinate')
-        except ValueError:
+        eastings, northings, valid = get_grid_cells(np.array([lat]),
+            np.array([lon]))
+        if not valid[0]:
             return result
-        # fit request to the grid
-        osgr = osgr_to_grid(osgr)
-        latlon = osgr.toLatLon(eV.LatLon)
-        lat_found = latlon.lat
-        lon_found = latlon.lon
-        filename = get_filename(osgr)
+        filename = get_filenames(eastings, northings)[0]
         full_path = os.path.join(self.path, filename[:2].lower(), filename)
-        if not os.path.isfile(full_path):
-            return result
-        x = get_x(osgr)
-        y = get_y(osgr)
-        with open(full_path, "rb") as f:
-            # go to the right spot,
-            f.seek((y * NCOLS + x) * 4)
-            # read four bytes and convert them:
-            buf = f.read(4)
-            # ">f" is a four byte float
-            val = struct.unpack('>f', buf)[0]
-            result.update({
-                'lat_found': round(lat_found, 6),
-                'lon_found': round(lon_found, 6), 'altitude_m': round(val, 2),
-                'distance_m': round(calculate_distance(lat, lon, lat_found,
-                lon_found), 3)})
+        tile = self.tiles.get(full_path)
+        if tile is None:
             return result
+        x = int(eastings[0] % (NCOLS * CELLSIZE) // CELLSIZE)
+        y = int(NROWS - 1 - northings[0] % (NROWS * CELLSIZE) // CELLSIZE)
+        val = float(tile[y, x])
+        lats_found, lons_found = from_national_grid(eastings, northings)
+        lat_found = float(lats_found[0])
+        lon_found = float(lons_found[0])
+        result.update({
+            'lat_found': round(lat_found, 6),
+            'lon_found': round(lon_found, 6), 'altitude_m': round(val, 2),
+            'distance_m': round(calculate_distance(lat, lon, lat_found,
+            lon_found), 3)})
+        return result
+
+    def group_by_tile(self, eastings, northings):
+        """
+        Group grid cells by the tile containing them.
+
+        :param eastings: array of float -- eastings of the grid cells.
+        :param northings: array of float -- northings of the grid cells.
+        :returns: iterator of (full path, positions, column indices, row
+            indices) for each tile.
+        """
+        filenames = get_filenames(eastings, northings)
+        for filename, _indices in group_indices(filenames):
+            full_path = os.path.join(self.path, filename[:2].lower(), filename)
+            x = (eastings[_indices] % (NCOLS * CELLSIZE) // CELLSIZE).astype(
+                int)
+            y = (NROWS - 1 - northings[_indices] % (NROWS * CELLSIZE) //
+                CELLSIZE).astype(int)
+            yield full_path, _indices, x, y
+
+    def get_file_reads(self, lats, lons):
+        """
+        Plan the reads of get_heights for the given locations.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :returns: dict -- list of (offset, length) by tile path.
+        """
+        lats, lons = check_coordinates(lats, lons)
+        in_bounds, eastings, northings = get_grid_cells_in_bounds(lats, lons)
+        file_reads = {}
+        for full_path, _indices, x, y in self.group_by_tile(eastings,
+                northings):
+            # rows of 32 bit floats
+            file_reads[full_path] = get_row_ranges(y, NCOLS * 4)
+        return file_reads
+
+    def get_heights(self, lats, lons):
+        """
+        Get the elevations of many locations at once.
+
+        :param lats: array of float -- latitudes.
+        :param lons: array of float -- longitudes.
+        :returns: dict of arrays with one entry per location.
+        """
+        lats, lons = check_coordinates(lats, lons)
+        altitudes = np.full(lats.shape, self.NODATA, dtype=float)
+        lats_found = np.full(lats.shape, np.nan)
+        lons_found = np.full(lats.shape, np.nan)
+        distances = np.zeros(lats.shape)
+        in_bounds, eastings, northings = get_grid_cells_in_bounds(lats, lons)
+        found = np.zeros(in_bounds.shape, dtype=bool)
+        for full_path, _indices, x, y in self.group_by_tile(eastings,
+                northings):
+            tile = self.tiles.get(full_path)
+            if tile is None:
+                continue
+            # one fancy-indexed read per tile
+            altitudes[in_bounds[_indices]] = np.round(
+                tile[y, x].astype(float), 2)
+            found[_indices] = True
+        # grid positions of all found locations converted at once
+        _lats, _lons = from_national_grid(eastings[found], northings[found])
+        found = in_bounds[found]
+        lats_found[found] = _lats
+        lons_found[found] = _lons
+        distances[found] = np.round(calculate_distances(lats[found],
+            lons[found], lats_found[found], lons_found[found]), 3)
+        return {
+            'lat': lats, 'lon': lons, 'lat_found': np.round(lats_found, 6),
+            'lon_found': np.round(lons_found, 6), 'altitude_m': altitudes,
+            'source': self.attribution_name, 'distance_m': distances,
+            'attributions': [self.attribution]}
 
     @timeit
     def get_max_height(self, lat_ll, lon_ll, lat_ur, lon_ur):
@@ -128,15 +245,8 @@ class Terrain50:
         if lat_ll > lat_ur or lon_ll > lon_ur:
             return result
         try:
-            osgr_ll = toOsgr(eV.LatLon(lat_ll, lon_ll))
-            if len(osgr_ll.toStr()) == 0:
-                raise ValueError('not a valid OSGR coordinate')
-        except ValueError:
-            return result
-        try:
-            osgr_ur = toOsgr(eV.LatLon(lat_ur, lon_ur))
-            if len(osgr_ur.toStr()) == 0:
-                raise ValueError('not a valid OSGR coordinate')
+            osgr_ll = latlon_to_osgr(lat_ll, lon_ll)
+            osgr_ur = latlon_to_osgr(lat_ur, lon_ur)
         except ValueError:
             return result
         file_list = {}
@@ -159,15 +269,8 @@ class Terrain50:
         if lat_ll > lat_ur or lon_ll > lon_ur:
             return result
         try:
-            osgr_ll = toOsgr(eV.LatLon(lat_ll, lon_ll))
-            if len(osgr_ll.toStr()) == 0:
-                raise ValueError('not a valid OSGR coordinate')
-        except ValueError:
-            return result
-        try:
-            osgr_ur = toOsgr(eV.LatLon(lat_ur, lon_ur))
-            if len(osgr_ur.toStr()) == 0:
-                raise ValueError('not a valid OSGR coordinate')
+            osgr_ll = latlon_to_osgr(lat_ll, lon_ll)
+            osgr_ur = latlon_to_osgr(lat_ur, lon_ur)
         except ValueError:
             return result
         file_list = {}
@@ -192,15 +295,8 @@ class Terrain50:
         if lat_ll > lat_ur or lon_ll > lon_ur:
             return result
         try:
-            osgr_ll = toOsgr(eV.LatLon(lat_ll, lon_ll))
-            if len(osgr_ll.toStr()) == 0:
-                raise ValueError('not a valid OSGR coordinate')
-        except ValueError:
-            return result
-        try:
-            osgr_ur = toOsgr(eV.LatLon(lat_ur, lon_ur))
-            if len(osgr_ur.toStr()) == 0:
-                raise ValueError('not a valid OSGR coordinate')
+            osgr_ll = latlon_to_osgr(lat_ll, lon_ll)
+            osgr_ur = latlon_to_osgr(lat_ur, lon_ur)
         except ValueError:
             return result
         file_list = {}
@@ -262,139 +358,133 @@ class Terrain50:
                 filtered_files[filename] = list_item
         return filtered_files
 
+    def get_search_windows(self, lat_ll, lon_ll, lat_ur, lon_ur,
+            use_maximum):
+        """
+        Provide the rectangle as windows of the tiles searched through the
+        extreme values of the map cache, see HeightInfo.find_extreme().
+
+        :returns: list of PyramidWindow -- empty if the rectangle is out of
+            coverage.
+        """
+        if lat_ll > lat_ur or lon_ll > lon_ur:
+            return []
+        file_list = {}
+        try:
+            self.create_filelist(latlon_to_osgr(lat_ll, lon_ll),
+                latlon_to_osgr(lat_ur, lon_ur), file_list)
+        except (ValueError, IOError):
+            return []
+        windows = []
+        for filename, list_item in file_list.items():
+            cache_data = self.map_cache.get(filename)
+            if use_maximum:
+                h = cache_data['h_max']
+            elif cache_data['h_min'] > self.NODATA:
+                h = cache_data['h_min']
+            else:
+                h = np.inf
+            windows.append(PyramidWindow(
+                lambda h=h, filename=filename: [np.full((1, 1), h),
+                    self.get_tile(filename)], [NROWS],
+                (list_item['y_ur'], list_item['y_ll'] + 1, list_item['x_ll'],
+                list_item['x_ur'] + 1), use_maximum, self.NODATA,
+                lambda rows, cols, filename=filename: get_tile_locations(rows,
+                    cols, filename), bound=h))
+        return windows
+
+    def get_tile(self, filename):
+        full_path = os.path.join(self.path, filename[:2].lower(), filename)
+        tile = self.tiles.get(full_path)
+        if tile is None:
+            raise FileNotFoundError(full_path)
+        return tile
+
+    def read_window(self, filename, list_item):
+        tile = self.get_tile(filename)
+        return np.asarray(tile[list_item['y_ur']:list_item['y_ll'] + 1,
+            list_item['x_ll']:list_item['x_ur'] + 1])
+
     @timeit
     def check_max_files(self, file_list):
         h_max = self.NODATA
-        osgr_list = []
-        counter_max = 0
+        positions_max = []
         for filename, list_item in file_list.items():
-            x_ll = list_item['x_ll']
-            y_ll = list_item['y_ll']
-            x_ur = list_item['x_ur']
-            y_ur = list_item['y_ur']
-            x_pos = x_ll
-            y_pos = y_ur
-            full_path = os.path.join(self.path, filename[:2].lower(), filename)
-            with open(full_path, "rb") as f:
-                while y_ur <= y_pos <= y_ll:
-                    f.seek((y_pos * NCOLS + x_pos) * 4)
-                    num_values = x_ur - x_ll + 1
-                    buf = f.read(num_values * 4)
-                    values = struct.unpack('>{:d}f'.format(num_values), buf)
-                    while x_ll <= x_pos <= x_ur:
-                        # if current height value larger than previous maximum
-                        if values[x_pos - x_ll] > h_max:
-                            # store current height
-                            h_max = values[x_pos - x_ll]
-                            osgr_list = [get_osgr_from_indices(x_pos, y_pos,
-                                filename)]
-                            counter_max = 1
-                        elif values[x_pos - x_ll] == h_max:
-                            osgr_list += [get_osgr_from_indices(x_pos, y_pos,
-                                filename)]
-                            counter_max += 1
-                        x_pos += 1
-                    x_pos = x_ll
-                    y_pos += 1
-        _latlons_max = [_osgr.toLatLon(eV.LatLon) for _osgr in osgr_list]
-        location_max = [(latlon.lat, latlon.lon) for latlon in _latlons_max]
+            values = self.read_window(filename, list_item)
+            _h_max = float(values.max())
+            if _h_max < h_max:
+                continue
+            _positions = get_grid_positions(values == _h_max, filename,
+                list_item)
+            if _h_max > h_max:
+                h_max = _h_max
+                positions_max = _positions
+            else:
+                positions_max += _positions
+        location_max = get_locations(positions_max)
         return {'location_max': location_max, 'h_max': h_max,
-            'counter_max': counter_max}
+            'counter_max': len(location_max)}
 
     @timeit
     def check_min_files(self, file_list):
         h_min = -self.NODATA
-        osgr_list = []
-        counter_min = 0
+        positions_min = []
         for filename, list_item in file_list.items():
-            x_ll = list_item['x_ll']
-            y_ll = list_item['y_ll']
-            x_ur = list_item['x_ur']
-            y_ur = list_item['y_ur']
-            x_pos = x_ll
-            y_pos = y_ur
-            full_path = os.path.join(self.path, filename[:2].lower(), filename)
-            with open(full_path, "rb") as f:
-                while y_ur <= y_pos <= y_ll:
-                    f.seek((y_pos * NCOLS + x_pos) * 4)
-                    num_values = x_ur - x_ll + 1
-                    buf = f.read(num_values * 4)
-                    values = struct.unpack('>{:d}f'.format(num_values), buf)
-                    while x_ll <= x_pos <= x_ur:
-                        if self.NODATA < values[x_pos - x_ll] < h_min:
-                            h_min = values[x_pos - x_ll]
-                            osgr_list = [get_osgr_from_indices(x_pos, y_pos,
-                                filename)]
-                            counter_min = 1
-                        elif self.NODATA < values[x_pos - x_ll] == h_min:
-                            osgr_list += [get_osgr_from_indices(x_pos, y_pos,
-                                filename)]
-                            counter_min += 1
-                        x_pos += 1
-                    x_pos = x_ll
-                    y_pos += 1
+            values = self.read_window(filename, list_item)
+            valid = values > self.NODATA
+            if not valid.any():
+                continue
+            _h_min = float(values[valid].min())
+            if _h_min > h_min:
+                continue
+            _positions = get_grid_positions(values == _h_min, filename,
+                list_item)
+            if _h_min < h_min:
+                h_min = _h_min
+                positions_min = _positions
+            else:
+                positions_min += _positions
         if h_min == -self.NODATA:
             h_min = self.NODATA
-        _latlons_min = [_osgr.toLatLon(eV.LatLon) for _osgr in osgr_list]
-        location_min = [(latlon.lat, latlon.lon) for latlon in _latlons_min]
+        location_min = get_locations(positions_min)
         return {'location_min': location_min, 'h_min': h_min,
-            'counter_min': counter_min}
+            'counter_min': len(location_min)}
 
     @timeit
     def check_min_max_files(self, file_list):
         h_max = self.NODATA
-        osgr_list_max = []
-        counter_max = 0
+        positions_max = []
         h_min = -self.NODATA
-        osgr_list_min = []
-        counter_min = 0
+        positions_min = []
         for filename, list_item in file_list.items():
-            x_ll = list_item['x_ll']
-            y_ll = list_item['y_ll']
-            x_ur = list_item['x_ur']
-            y_ur = list_item['y_ur']
-            x_pos = x_ll
-            y_pos = y_ur
-            full_path = os.path.join(self.path, filename[:2].lower(), filename)
-            with open(full_path, "rb") as f:
-                while y_ur <= y_pos <= y_ll:
-                    f.seek((y_pos * NCOLS + x_pos) * 4)
-                    num_values = x_ur - x_ll + 1
-                    buf = f.read(num_values * 4)
-                    values = struct.unpack('>{:d}f'.format(num_values), buf)
-                    while x_ll <= x_pos <= x_ur:
-                        if values[x_pos - x_ll] > h_max:
-                            # store current height
-                            h_max = values[x_pos - x_ll]
-                            osgr_list_max = [get_osgr_from_indices(x_pos, y_pos,
-                                filename)]
-                            counter_max = 1
-                        elif values[x_pos - x_ll] == h_max:
-                            osgr_list_max += [get_osgr_from_indices(x_pos, y_pos,
-                                filename)]
-                            counter_max += 1
-                        if self.NODATA < values[x_pos - x_ll] < h_min:
-                            h_min = values[x_pos - x_ll]
-                            osgr_list_min = [get_osgr_from_indices(x_pos, y_pos,
-                                filename)]
-                            counter_min = 1
-                        elif self.NODATA < values[x_pos - x_ll] == h_min:
-                            osgr_list_min += [get_osgr_from_indices(x_pos, y_pos,
-                                filename)]
-                            counter_min += 1
-                        x_pos += 1
-                    x_pos = x_ll
-                    y_pos += 1
+            values = self.read_window(filename, list_item)
+            _h_max = float(values.max())
+            if _h_max > h_max:
+                h_max = _h_max
+                positions_max = get_grid_positions(values == _h_max,
+                    filename, list_item)
+            elif _h_max == h_max:
+                positions_max += get_grid_positions(values == _h_max,
+                    filename, list_item)
+            valid = values > self.NODATA
+            if not valid.any():
+                continue
+            _h_min = float(values[valid].min())
+            if _h_min < h_min:
+                h_min = _h_min
+                positions_min = get_grid_positions(values == _h_min,
+                    filename, list_item)
+            elif _h_min == h_min:
+                positions_min += get_grid_positions(values == _h_min,
+                    filename, list_item)
         if h_min == -self.NODATA:
             h_min = self.NODATA
-        _latlons_max = [_osgr.toLatLon(eV.LatLon) for _osgr in osgr_list_max]
-        location_max = [(latlon.lat, latlon.lon) for latlon in _latlons_max]
-        _latlons_min = [_osgr.toLatLon(eV.LatLon) for _osgr in osgr_list_min]
-        location_min = [(latlon.lat, latlon.lon) for latlon in _latlons_min]
+        location_max = get_locations(positions_max)
+        location_min = get_locations(positions_min)
         return {
             'location_min': location_min, 'h_min': h_min,
-            'counter_min': counter_min, 'location_max': location_max,
-            'h_max': h_max, 'counter_max': counter_max}
+            'counter_min': len(location_min), 'location_max': location_max,
+            'h_max': h_max, 'counter_max': len(location_max)}
 
     def create_filelist(self, osgr_ll, osgr_ur, file_list):
         # obtain the coordinates of the tile containing the lower left
@@ -0,0 +1,55 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class TilePool:
+    """
+    Pool of read-only memory mapped tiles of identical shape.
+
+    The least recently used tile is unmapped when more than max_tiles
+    tiles are in use. The pool may be shared between threads.
+    """
+
+    def __init__(self, dtype, shape, max_tiles=16):
+        self.dtype = dtype
+        self.shape = shape
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, full_path):
+        return full_path in self.tiles
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def get(self, full_path):
+        """
+        Get the memory mapped tile stored at the given path.
+
+        :param full_path: str -- path of the tile file.
+        :returns: numpy.memmap or None if the file does not exist.
+        """
+        with self.lock:
+            tile = self.tiles.get(full_path)
+            if tile is not None:
+                self.tiles.move_to_end(full_path)
+                return tile
+        if not os.path.isfile(full_path):
+            return None
+        tile = np.memmap(
+            full_path, dtype=self.dtype, mode="r", shape=self.shape
+        )
+        with self.lock:
+            # another thread may have mapped the same tile meanwhile
+            tile = self.tiles.setdefault(full_path, tile)
+            self.tiles.move_to_end(full_path)
+            while len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+        return tile
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
@@ -1,19 +1,22 @@
+import json
+import base64
 import logging
+from concurrent.futures import wait
 import numpy as np
 from pydantic import BaseModel, confloat, constr, conlist
 from typing import List
 from geojson import FeatureCollection, Feature, LineString
-import pygeodesy.ellipsoidalVincenty as eV
 from simplification.cutil import simplify_coords
-from height_map.height_info import HeightInfo
-from height_map.cci_land_cover import LandCover
-from fastapi import APIRouter
+from height_map import geodesic
+from height_map.prefetch import get_executor as get_prefetch_executor
+from height_map.sources import get_height_info, get_land_cover
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
-hi = HeightInfo()
-lc = LandCover()
 
 
 class Location(BaseModel):
@@ -26,36 +29,37 @@ class PositionRequest(BaseModel):
     distance: confloat(ge=0)
 
 
+def _get_track_arrays(track):
+    lats = np.array([_location.lat for _location in track], dtype=float)
+    lons = np.array([_location.lon for _location in track], dtype=float)
+    return lats, lons
+
+
 @router.post("/api/get_track_length")
 def get_track_length(track: List[Location]):
-    distance = 0
-    old_location = None
-    for _location in track:
-        current_location = eV.LatLon(_location.lat, _location.lon)
-        if old_location:
-            distance += old_location.distanceTo(current_location)
-        old_location = current_location
-    return round(distance, 3)
+    lats, lons = _get_track_arrays(track)
+    segment_lengths = geodesic.inverse(
+        lats[:-1], lons[:-1], lats[1:], lons[1:]
+    )[0]
+    return round(sum(segment_lengths.tolist()), 3)
 
 
 @router.post("/api/get_track_position")
 def get_track_position(data: PositionRequest):
-    distance = 0
-    old_location = None
-    for _location in data.track:
-        current_location = eV.LatLon(_location.lat, _location.lon)
-        if old_location:
-            segment_length, bearing = old_location.distanceTo3(
-                current_location
-            )[:2]
-            if distance + segment_length >= data.distance:
-                position = old_location.destination(
-                    data.distance - distance, bearing
-                ).latlon2(ndigits=6)
-                return {"lat": position.lat, "lon": position.lon}
-            distance += segment_length
-        old_location = current_location
-    return {}
+    lats, lons = _get_track_arrays(data.track)
+    segment_lengths, bearings = geodesic.inverse(
+        lats[:-1], lons[:-1], lats[1:], lons[1:]
+    )[:2]
+    segment_ends = np.cumsum(segment_lengths)
+    reached = np.flatnonzero(segment_ends >= data.distance)
+    if len(reached) == 0:
+        return {}
+    _i = reached[0]
+    distance = segment_ends[_i - 1] if _i > 0 else 0
+    lat, lon = geodesic.direct(
+        lats[_i], lons[_i], data.distance - distance, bearings[_i]
+    )[:2]
+    return {"lat": round(float(lat[0]), 6), "lon": round(float(lon[0]), 6)}
 
 
 class ElevationRequest(BaseModel):
@@ -64,6 +68,7 @@ class ElevationRequest(BaseModel):
 
 @router.post("/api/get_track_elevation")
 def get_track_elevation(data: ElevationRequest):
+    hi = get_height_info()
     new_track = []
     for _location in data.track:
         response = hi.get_height(_location.lat, _location.lon)
@@ -75,6 +80,161 @@ def get_track_elevation(data: ElevationRequest):
     return new_track
 
 
+# coordinates are packed as little-endian float64 pairs of lat and lon
+PACKED_COORDINATE_DTYPE = np.dtype("<f8")
+PACKED_ALTITUDE_DTYPE = np.dtype("<f8")
+PACKED_SOURCE_DTYPE = np.dtype("u1")
+
+
+def unpack_coordinates(body, content_type):
+    """
+    Decode packed coordinates sent either as raw application/octet-stream
+    body or base64 encoded as {"coordinates": "..."} in a JSON body.
+
+    :param body: bytes -- request body.
+    :param content_type: str -- content type of the request.
+    :returns: tuple of arrays -- latitudes and longitudes.
+    """
+    if content_type.startswith("application/json"):
+        try:
+            body = base64.b64decode(
+                json.loads(body)["coordinates"], validate=True
+            )
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(
+                status_code=422, detail="invalid base64 coordinates"
+            )
+    if len(body) % (2 * PACKED_COORDINATE_DTYPE.itemsize) != 0:
+        raise HTTPException(
+            status_code=422, detail="incomplete coordinate pair"
+        )
+    coordinates = np.frombuffer(body, dtype=PACKED_COORDINATE_DTYPE)
+    return coordinates[0::2], coordinates[1::2]
+
+
+def pack_elevations(altitudes, source_ids):
+    """
+    All altitudes as float64 followed by one uint8 source id per location.
+    """
+    return (
+        altitudes.astype(PACKED_ALTITUDE_DTYPE).tobytes()
+        + source_ids.astype(PACKED_SOURCE_DTYPE).tobytes()
+    )
+
+
+@router.post("/api/get_packed_track_elevation")
+async def get_packed_track_elevation(
+    request: Request, output: str = Query("binary", regex="^(binary|json)$")
+):
+    """
+    Batch elevation lookup for large tracks avoiding one JSON object per
+    location, the source ids index the list in the X-Source-Names header.
+    """
+    lats, lons = unpack_coordinates(
+        await request.body(), request.headers.get("content-type", "")
+    )
+    hi = await run_in_threadpool(get_height_info)
+    try:
+        result = await run_in_threadpool(hi.get_heights, lats, lons)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    source_ids = hi.get_source_ids(result["source"])
+    if output == "json":
+        return {
+            "altitude_m": hi.get_altitude_list(result),
+            "source": source_ids.tolist(),
+            "source_names": hi.source_names,
+        }
+    return Response(
+        content=pack_elevations(result["altitude_m"], source_ids),
+        media_type="application/octet-stream",
+        headers={"X-Source-Names": json.dumps(hi.source_names)},
+    )
+
+
+# number of locations resolved at once by the streaming endpoint
+STREAM_CHUNK_SIZE = 1000
+STREAM_KEYS = [
+    "lat",
+    "lon",
+    "lat_found",
+    "lon_found",
+    "altitude_m",
+    "distance_m",
+    "source",
+    "wb_label",
+]
+
+
+async def read_location_chunks(lines, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Parse NDJSON locations like {"lat": 52.1, "lon": 7.6} from an async
+    iterator of bytes and yield them in chunks of latitudes and longitudes.
+    """
+    lats = []
+    lons = []
+    buffer = b""
+    async for data in lines:
+        buffer += data
+        *complete_lines, buffer = buffer.split(b"\n")
+        for _line in complete_lines:
+            if _line.strip():
+                location = Location.parse_raw(_line)
+                lats.append(location.lat)
+                lons.append(location.lon)
+            if len(lats) >= chunk_size:
+                yield lats, lons
+                lats = []
+                lons = []
+    if buffer.strip():
+        location = Location.parse_raw(buffer)
+        lats.append(location.lat)
+        lons.append(location.lon)
+    if lats:
+        yield lats, lons
+
+
+def format_elevation_lines(result, altitudes):
+    columns = {
+        key: [
+            None if isinstance(_value, float) and np.isnan(_value) else _value
+            for _value in np.asarray(result[key]).tolist()
+        ]
+        for key in STREAM_KEYS
+    }
+    # typed like the altitudes of get_height
+    columns["altitude_m"] = altitudes
+    return "".join(
+        json.dumps(dict(zip(STREAM_KEYS, _values))) + "\n"
+        for _values in zip(*columns.values())
+    )
+
+
+async def generate_elevation_lines(lines, chunk_size=STREAM_CHUNK_SIZE):
+    hi = await run_in_threadpool(get_height_info)
+    try:
+        async for lats, lons in read_location_chunks(lines, chunk_size):
+            result = await run_in_threadpool(hi.get_heights, lats, lons)
+            yield format_elevation_lines(result, hi.get_altitude_list(result))
+    except ValueError as e:
+        # the response status is already sent, report the error in-band
+        logger.warning(f"stream_track_elevation: {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+@router.post("/api/stream_track_elevation")
+async def stream_track_elevation(request: Request):
+    """
+    Elevations of a track of any length sent as NDJSON with one location
+    per line. The body is consumed incrementally and the results are
+    returned as NDJSON lines as soon as each chunk is resolved.
+    """
+    return StreamingResponse(
+        generate_elevation_lines(request.stream()),
+        media_type="application/x-ndjson",
+    )
+
+
 class SimplifyRequest(BaseModel):
     track: List[Location]
     epsilon: confloat(ge=0) = 0
@@ -94,37 +254,103 @@ class ResamplingRequest(BaseModel):
     include_existing_points: bool = True
 
 
-def _get_lonlat(latlon, digits=6):
-    _position = latlon.latlon2(ndigits=digits)
-    return [_position.lon, _position.lat]
+def _get_lonlat(lat, lon, digits=6):
+    return [round(float(lon), digits), round(float(lat), digits)]
+
+
+def _plan_resampling(
+    segment_lengths, step, include_existing_points, first, target_distance
+):
+    """
+    Distances between the resampled points of each segment starting from
+    segment first and the last target distance reached within each segment.
+    """
+    segment_ends = np.cumsum(segment_lengths)
+    offsets = []
+    last_targets = []
+    for _i in range(first, len(segment_lengths)):
+        distance = segment_ends[_i - 1] if _i > 0 else 0
+        targets = np.arange(target_distance, segment_ends[_i], step)
+        offsets.append(np.diff(targets, prepend=distance))
+        if len(targets) > 0:
+            target_distance = targets[-1]
+        last_targets.append(target_distance)
+        if include_existing_points:
+            # assume the existing point at the segment end is appended
+            target_distance = segment_ends[_i] + step
+        else:
+            target_distance += step
+    return offsets, last_targets, segment_ends
+
+
+def _chain_destinations(lats, lons, bearings, offsets):
+    """
+    Walk along all segments at once, each point is the destination of its
+    predecessor at the given offset in the initial bearing of the segment.
+    """
+    counts = np.array([len(_offsets) for _offsets in offsets], dtype=int)
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    flat_offsets = np.concatenate([np.zeros(0)] + offsets)
+    points_lat = np.empty(starts[-1])
+    points_lon = np.empty(starts[-1])
+    # segments sorted by their number of points, active ones are a suffix
+    order = np.argsort(counts, kind="stable")
+    sorted_counts = counts[order]
+    lats = lats[order]
+    lons = lons[order]
+    for _k in range(sorted_counts[-1] if len(counts) > 0 else 0):
+        first_active = np.searchsorted(sorted_counts, _k, side="right")
+        indices = starts[order[first_active:]] + _k
+        lats[first_active:], lons[first_active:] = geodesic.direct(
+            lats[first_active:],
+            lons[first_active:],
+            flat_offsets[indices],
+            bearings[order[first_active:]],
+        )[:2]
+        points_lat[indices] = lats[first_active:]
+        points_lon[indices] = lons[first_active:]
+    return [
+        list(zip(points_lat[_start:_end], points_lon[_start:_end]))
+        for _start, _end in zip(starts[:-1], starts[1:])
+    ]
 
 
 def resample_track_list(track, step, include_existing_points=True):
     if len(track) == 0:
         return []
-    distance = 0
+    lons = np.array([_location[0] for _location in track], dtype=float)
+    lats = np.array([_location[1] for _location in track], dtype=float)
+    segment_lengths, bearings = geodesic.inverse(
+        lats[:-1], lons[:-1], lats[1:], lons[1:]
+    )[:2]
+    new_track = [_get_lonlat(lats[0], lons[0])]
+    first = 0
     target_distance = step
-    old_location = eV.LatLon(track[0][1], track[0][0])
-    new_track = [_get_lonlat(old_location)]
-    for _location in track[1:]:
-        current_location = eV.LatLon(_location[1], _location[0])
-        segment_length, bearing = old_location.distanceTo3(current_location)[:2]
-        segment_end = distance + segment_length
-        for target_distance in np.arange(target_distance, segment_end, step):
-            old_location = old_location.destination(
-                target_distance - distance, bearing
-            )
-            new_track.append(_get_lonlat(old_location))
-            distance = target_distance
-        existing_point = _get_lonlat(current_location)
-        distance = segment_end
-        if include_existing_points and existing_point != new_track[-1]:
-            new_track.append(existing_point)
-            target_distance = segment_end + step
-        elif not include_existing_points:
-            target_distance += step
-        old_location = current_location
-    last_item = _get_lonlat(old_location)
+    while first < len(segment_lengths):
+        offsets, last_targets, segment_ends = _plan_resampling(
+            segment_lengths,
+            step,
+            include_existing_points,
+            first,
+            target_distance,
+        )
+        segments = _chain_destinations(
+            lats[first:-1], lons[first:-1], bearings[first:], offsets
+        )
+        for _j, points in enumerate(segments):
+            _i = first + _j
+            new_track.extend(_get_lonlat(*_point) for _point in points)
+            existing_point = _get_lonlat(lats[_i + 1], lons[_i + 1])
+            if include_existing_points and existing_point == new_track[-1]:
+                # the existing point is skipped and the last target is kept,
+                # plan again if this differs from the assumed next target
+                target_distance = last_targets[_j]
+                if target_distance != segment_ends[_i] + step:
+                    break
+            elif include_existing_points:
+                new_track.append(existing_point)
+        first = _i + 1
+    last_item = _get_lonlat(lats[-1], lons[-1])
     if not include_existing_points and new_track[-1] != last_item:
         new_track.append(last_item)
     return new_track
@@ -155,29 +381,38 @@ def geojson_get_height_graph_data(data: GeoJSONRequest):
     _coords = [xy[0:2] for xy in data.dict()["geometry"]["coordinates"]]
     simplified_track = simplify_coords(_coords, epsilon=0.00003)
     simplified_track = resample_track_list(simplified_track, 300)
-    track_elevation = [hi.get_height(y, x) for x, y in simplified_track]
-    _coordinates = [
-        (round(pt["lon"], 6), round(pt["lat"], 6), pt["altitude_m"])
-        for pt in track_elevation
-    ]
-    _lc_values = [
-        lc.get_value_at_position(_lat, _lon)
-        for _lon, _lat, _altitude_m in _coordinates
+    lons, lats = np.array(simplified_track, dtype=float).reshape(-1, 2).T
+    hi = get_height_info()
+    lc = get_land_cover()
+    # all points are known up front, read their tiles and blocks at once
+    executor = get_prefetch_executor()
+    futures = hi.prefetch(lats, lons, executor)
+    futures += lc.gth.prefetch_blocks(lats, lons, executor)
+    wait(futures)
+    track_elevation = hi.get_heights(lats, lons)
+    _coordinates = list(
+        zip(
+            np.round(track_elevation["lon"], 6).tolist(),
+            np.round(track_elevation["lat"], 6).tolist(),
+            hi.get_altitude_list(track_elevation),
+        )
+    )
+    # masked values are kept apart as -1 and reported as None
+    _lc_values = lc.get_values_at_positions(lats, lons)
+    _lc_codes = _lc_values.astype(int).filled(-1)
+    # each run of equal values ends at the first point of the next run
+    _ends = np.append(
+        np.flatnonzero(np.diff(_lc_codes)) + 1, len(_lc_codes) - 1
+    )
+    _ends = np.unique(_ends[_ends > 0])
+    _starts = np.concatenate([[0], _ends[:-1]])
+    _features = [
+        Feature(
+            geometry=LineString(_coordinates[_start : _end + 1]),
+            properties={"attributeType": str(_lc_values[_start].tolist())},
+        )
+        for _start, _end in zip(_starts.tolist(), _ends.tolist())
     ]
-    _features = []
-    _track = [_coordinates[0]]
-    _current_value = _lc_values[0]
-    _number_coords = len(_lc_values)
-    for _i in range(1, _number_coords):
-        _track.append(_coordinates[_i])
-        if _current_value != _lc_values[_i] or _i == _number_coords - 1:
-            _feature = Feature(
-                geometry=LineString(_track),
-                properties={"attributeType": str(_current_value)},
-            )
-            _features.append(_feature)
-            _track = [_coordinates[_i]]
-            _current_value = _lc_values[_i]
     _land_cover_feature_collection = FeatureCollection(
         _features, properties={"summary": "land cover"}
     )
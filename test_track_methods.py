@@ -1,5 +1,7 @@
 import requests
 import json
+import base64
+import numpy as np
 
 host = 'http://127.0.0.1:8000'
 
@@ -80,6 +82,48 @@ if r.status_code == 200:
 else:
     print(r.status_code)
 
+print('### Testing /api/get_packed_track_elevation ###')
+endpoint = '/api/get_packed_track_elevation'
+url = host + endpoint
+
+print('# test_track (binary):')
+packed_track = np.array([[_location['lat'], _location['lon']]
+    for _location in test_track], dtype='<f8').tobytes()
+r = requests.post(url, data=packed_track,
+    headers={'Content-Type': 'application/octet-stream'})
+if r.status_code == 200:
+    altitudes = np.frombuffer(r.content, dtype='<f8', count=len(test_track))
+    source_ids = np.frombuffer(r.content, dtype='u1',
+        offset=altitudes.nbytes)
+    source_names = json.loads(r.headers['X-Source-Names'])
+    print([(_altitude, source_names[_id])
+        for _altitude, _id in zip(altitudes, source_ids)])
+else:
+    print(r.status_code)
+
+print('# test_track (base64 in JSON, JSON output):')
+payload = {'coordinates': base64.b64encode(packed_track).decode()}
+r = requests.post(url, json=payload, params={'output': 'json'})
+if r.status_code == 200:
+    print(f'{r.json()}')
+else:
+    print(r.status_code)
+
+print('### Testing /api/stream_track_elevation ###')
+endpoint = '/api/stream_track_elevation'
+url = host + endpoint
+
+print('# test_track:')
+ndjson_track = ''.join(json.dumps(_location) + '\n'
+    for _location in test_track)
+r = requests.post(url, data=ndjson_track.encode(), stream=True,
+    headers={'Content-Type': 'application/x-ndjson'})
+if r.status_code == 200:
+    for _line in r.iter_lines():
+        print(json.loads(_line))
+else:
+    print(r.status_code)
+
 print('### Testing /api/get_simplified_track ###')
 endpoint = '/api/get_simplified_track'
 url = host + endpoint
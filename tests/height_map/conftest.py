@@ -0,0 +1,26 @@
+import math
+import pytest
+
+
+@pytest.fixture
+def check_heights():
+
+    def check(source, locations):
+        """
+        Compare get_heights for a batch of locations with get_height for
+        each of them and return the batch result.
+        """
+        lats, lons = zip(*locations)
+        data = source.get_heights(lats, lons)
+        assert len(data['altitude_m']) == len(locations)
+        for _i, location in enumerate(locations):
+            _data = source.get_height(*location)
+            assert data['altitude_m'][_i] == _data['altitude_m']
+            assert math.isclose(data['distance_m'][_i], _data['distance_m'],
+                abs_tol=0.01)
+            if 'lat_found' in _data:
+                assert data['lat_found'][_i] == _data['lat_found']
+                assert data['lon_found'][_i] == _data['lon_found']
+        return data
+
+    return check
@@ -0,0 +1,101 @@
+import os
+import sys
+import numpy as np
+sys.path.append(os.getcwd())
+from height_map.block_pyramid import (create_levels, split_window,
+    get_extreme, find_cells, PyramidWindow)
+
+block_sizes = [60, 12]
+
+
+def test_split_window():
+    shape = (361, 301)
+    for window in [(0, 361, 0, 301), (5, 6, 7, 8), (59, 200, 1, 129),
+            (300, 361, 250, 301), (10, 10, 0, 5)]:
+        coverage = np.zeros(shape, dtype=int)
+        for level, i_0, i_1, j_0, j_1 in split_window(*window, shape,
+                block_sizes):
+            _b = (block_sizes + [1])[level]
+            coverage[i_0*_b:i_1*_b, j_0*_b:j_1*_b] += 1
+        expected = np.zeros(shape, dtype=int)
+        expected[window[0]:window[1], window[2]:window[3]] = 1
+        assert np.array_equal(coverage, expected)
+
+
+def test_find_extremes():
+    rng = np.random.default_rng(1)
+    values = rng.integers(-5, 20, (361, 301)).astype('>i2')
+    values[rng.random(values.shape) < 0.2] = -32768
+    values[:100, :100] = -32768
+    levels = create_levels(values, block_sizes, -32768)
+    assert [_level[1].shape for _level in levels] == [(7, 6), (35, 30)]
+    for window in [(0, 361, 0, 301), (13, 14, 7, 8), (59, 200, 1, 129),
+            (300, 361, 250, 301), (0, 90, 0, 90)]:
+        pieces = split_window(*window, values.shape, block_sizes)
+        _values = values[window[0]:window[1], window[2]:window[3]]
+        valid = _values != -32768
+        for use_maximum, index in [(True, 2), (False, 1)]:
+            _levels = [_level[index] for _level in levels] + [values]
+            h = get_extreme(pieces, _levels, use_maximum, -32768)
+            if use_maximum:
+                expected = _values.max()
+            elif valid.any():
+                expected = _values[valid].min()
+            else:
+                assert h is None
+                continue
+            assert h == expected
+            rows, cols = find_cells(pieces, _levels, block_sizes, h)
+            _rows, _cols = np.nonzero(_values == expected)
+            assert np.array_equal(rows, _rows + window[0])
+            assert np.array_equal(cols, _cols + window[2])
+
+
+class SlicedGrid:
+    # grid without fancy indexing like an h5py.Dataset
+
+    def __init__(self, values):
+        self.values = values
+        self.shape = values.shape
+        self.dtype = values.dtype
+
+    def __getitem__(self, key):
+        rows, cols = key
+        assert isinstance(rows, slice) and isinstance(cols, slice)
+        return self.values[key]
+
+
+def test_find_cells_in_sliced_grid():
+    rng = np.random.default_rng(2)
+    values = rng.integers(-5, 20, (361, 301)).astype('>i2')
+    levels = create_levels(values, block_sizes, -32768)
+    grid = SlicedGrid(values)
+    for window in [(0, 361, 0, 301), (13, 14, 7, 8), (59, 200, 1, 129)]:
+        pieces = split_window(*window, values.shape, block_sizes)
+        _values = values[window[0]:window[1], window[2]:window[3]]
+        for use_maximum, index in [(True, 2), (False, 1)]:
+            _levels = [_level[index] for _level in levels] + [grid]
+            h = get_extreme(pieces, _levels, use_maximum, -32768)
+            rows, cols = find_cells(pieces, _levels, block_sizes, h)
+            _rows, _cols = np.nonzero(_values == h)
+            assert np.array_equal(rows, _rows + window[0])
+            assert np.array_equal(cols, _cols + window[2])
+
+
+def test_pyramid_window():
+    values = np.full((120, 120), -32768, dtype='>i2')
+    levels = create_levels(values, block_sizes, -32768)
+    window = PyramidWindow([_level[2] for _level in levels] + [values],
+        block_sizes, (0, 120, 0, 120), True, -32768,
+        lambda rows, cols: (rows / 10, cols / 10))
+    assert window.get_extreme() is None
+    values[5, 7] = 3
+    values[90, 100] = 3
+    levels = create_levels(values, block_sizes, -32768)
+    window = PyramidWindow(
+        lambda: [_level[2] for _level in levels] + [values], block_sizes,
+        (0, 120, 0, 120), True, -32768,
+        lambda rows, cols: (rows / 10, cols / 10))
+    assert window.get_extreme() == 3
+    rows, cols = window.find_cells(3)
+    assert rows.tolist() == [5, 90] and cols.tolist() == [7, 100]
@@ -87,3 +87,14 @@ def test_content():
     assert lc.get_data_at_position(40.8, -112)['value'] == 100
     # Tokyo
     assert lc.get_data_at_position(35.68, 139.77)['value'] == 190
+
+
+def test_get_values_at_positions():
+    lc = LandCover()
+    locations = [[53.8, 6.9], [47.56, 9.5], [47.94, 8.3], [90, 180], [-90, 0]]
+    lats, lons = zip(*locations)
+    values = lc.get_values_at_positions(lats, lons)
+    for _i, location in enumerate(locations):
+        assert values.tolist()[_i] == lc.get_value_at_position(*location)
+    with pytest.raises(ValueError):
+        lc.get_values_at_positions([0], [180.1])
@@ -2,7 +2,9 @@ import os
 import sys
 sys.path.append(os.getcwd())
 import pytest
+import numpy as np
 from height_map.cci_water_bodies_v4 import WaterBodies
+from height_map.geotiff_handler import BlockCache
 
 
 def test_missing_file_operation():
@@ -84,3 +86,36 @@ def test_content():
     assert wb.get_data_at_position(40.8, -112)['label'] == 'Land'
     # Tokyo
     assert wb.get_data_at_position(35.68, 139.77)['label'] == 'Land'
+
+
+def test_get_values_at_positions():
+    wb = WaterBodies()
+    locations = [[53.8, 6.9], [47.56, 9.5], [47.94, 8.3], [90, 180], [-90, 0]]
+    lats, lons = zip(*locations)
+    values = wb.get_values_at_positions(lats, lons)
+    for _i, location in enumerate(locations):
+        assert values.tolist()[_i] == wb.get_value_at_position(*location)
+
+
+def test_block_cache():
+    wb = WaterBodies()
+    wb.gth.block_cache.clear()
+    lats = [53.5 + _i * 0.001 for _i in range(100)]
+    lons = [9.9 + _i * 0.001 for _i in range(100)]
+    values = wb.get_values_at_positions(lats, lons)
+    block_cache = wb.gth.block_cache
+    # 100 positions within a few blocks of the raster
+    assert 0 < len(block_cache) < 10
+    assert block_cache.nbytes <= block_cache.max_bytes
+    for _i in range(0, 100, 10):
+        assert values.tolist()[_i] == wb.get_value_at_position(lats[_i],
+            lons[_i])
+
+
+def test_block_cache_eviction():
+    block_cache = BlockCache(max_bytes=250)
+    for _i in range(3):
+        block_cache.get(_i, lambda: np.zeros(100, dtype=np.uint8))
+    assert len(block_cache) == 2
+    assert 0 not in block_cache
+    assert block_cache.nbytes == 200
@@ -2,8 +2,12 @@ import os
 import sys
 import pytest
 import math
+import numpy as np
+import pygeodesy
 sys.path.append(os.getcwd())
-from height_map.dgm200 import Dgm200
+from height_map.dgm200 import (Dgm200, to_utm32, from_utm32,
+    create_cache_levels, get_cache_level_file, NROWS, NCOLS, CACHE_BLOCK_SIZES,
+    LAT_MIN, LAT_MAX, LON_MIN, LON_MAX)
 
 
 def test_missing_file_operation():
@@ -158,3 +162,71 @@ def test_check_bounds_get_min_height():
     # lowest location
     assert math.isclose(dgm.get_min_height(47.240591, 6.093066, 54.886907,
         15.570925)['h_min'], -290, abs_tol=10)
+
+
+def test_get_heights(check_heights):
+    dgm = Dgm200()
+    data = check_heights(dgm, [
+        # Hambach open pit, storage pool in Geeste and highest location
+        [50.91, 6.51], [52.588, 7.294], [47.42219, 10.98877],
+        # corners of the bounding box and London outside of it
+        [LAT_MIN, LON_MIN], [LAT_MAX, LON_MAX], [51.5, -0.12]])
+    assert math.isclose(data['altitude_m'][0], -77.13, abs_tol=10)
+    assert math.isclose(data['altitude_m'][1], 34, abs_tol=2)
+    assert math.isclose(data['altitude_m'][2], 2914, abs_tol=10)
+    # found cells are at most half a diagonal of a 200m cell away
+    assert max(data['distance_m'][:3]) < 141.43
+    # the grid covers Germany only, the corners of its bounding box hold
+    # no data
+    assert data['altitude_m'][3:].tolist() == [dgm.NODATA] * 3
+    assert np.isnan(data['lat_found'][5])
+    assert data['distance_m'][5] == 0
+    with pytest.raises(ValueError):
+        dgm.get_heights([90.1], [0])
+
+
+def test_utm32_projection():
+    lats = np.array([47.27, 50.11, 53.57, 54.91, 51.03])
+    lons = np.array([5.87, 8.68, 9.98, 13.82, 15.03])
+    eastings, northings = to_utm32(lats, lons)
+    _lats, _lons = from_utm32(eastings, northings)
+    for _i in range(len(lats)):
+        utm = pygeodesy.toUtm(lats[_i], lons[_i]).toUtm(32)
+        assert math.isclose(eastings[_i], utm.easting, abs_tol=1e-6)
+        assert math.isclose(northings[_i], utm.northing, abs_tol=1e-6)
+        latlon = pygeodesy.Utm(32, 'N', eastings[_i], northings[_i]
+            ).toLatLon()
+        assert math.isclose(_lats[_i], latlon.lat, abs_tol=1e-10)
+        assert math.isclose(_lons[_i], latlon.lon, abs_tol=1e-10)
+
+
+def test_shared_grid():
+    dgm_1 = Dgm200()
+    dgm_2 = Dgm200()
+    assert dgm_1.grid is dgm_2.grid
+    assert dgm_1.grid.shape == (4331, 3207)
+    assert not dgm_1.grid.flags.writeable
+
+
+def test_cache_levels(tmp_path):
+    rng = np.random.default_rng(0)
+    grid = np.round(rng.uniform(-10, 30, (NROWS, NCOLS)))
+    grid[rng.random((NROWS, NCOLS)) < 0.1] = Dgm200.NODATA
+    grid[1000:1300, 500:900] = Dgm200.NODATA
+    grid.astype('>f4').tofile(tmp_path / 'dgm200_utm32s_f4.bin')
+    dgm_scan = Dgm200(path=tmp_path)
+    for _b, _minimum, _maximum in create_cache_levels(dgm_scan.grid,
+            dgm_scan.NODATA):
+        np.save(get_cache_level_file(dgm_scan.file, _b), np.stack([
+            _minimum, _maximum]))
+    dgm = Dgm200(path=tmp_path)
+    assert not dgm_scan.cache_levels
+    assert len(dgm.cache_levels) == len(CACHE_BLOCK_SIZES)
+    for rectangle in [(50, 8, 50.1, 8.15), (48, 7, 48.02, 7.3),
+            (49.1, 7.5, 49.3, 7.6), (51.5, 10, 51.5, 10)]:
+        assert dgm.get_min_max_height(*rectangle) == (
+            dgm_scan.get_min_max_height(*rectangle))
+        assert dgm.get_max_height(*rectangle) == dgm_scan.get_max_height(
+            *rectangle)
+        assert dgm.get_min_height(*rectangle) == dgm_scan.get_min_height(
+            *rectangle)
@@ -233,3 +233,78 @@ def test_check_bounds_get_min_max_height():
     _result = gebco.get_min_max_height(-90, -180, 90, 180)
     assert math.isclose(_result['h_max'], 8613.2, abs_tol=16)
     assert math.isclose(_result['h_min'], -10928, abs_tol=16)
+
+
+def test_get_heights(check_heights):
+    gebco = Gebco()
+    data = check_heights(gebco, [
+        # Black Forest, lowest and highest location
+        [47.94, 8.3], [11.366667, 142.5875], [27.9875, 86.925],
+        # poles and both sides of the antimeridian
+        [90, 180], [-90, -180], [0, 179.999], [0, -179.999]])
+    assert math.isclose(data['altitude_m'][0], 927.52, abs_tol=16)
+    assert math.isclose(data['altitude_m'][1], -10928, abs_tol=16)
+    assert math.isclose(data['altitude_m'][2], 8613.2, abs_tol=16)
+    # the poles are found in the last and first row of cells
+    assert data['lat_found'][3] == 89.995833
+    assert data['lat_found'][4] == -90
+    # the antimeridian wraps around to the first column
+    assert data['lon_found'][3] == data['lon_found'][4] == -180
+    assert data['lon_found'][5] == data['lon_found'][6] == -180
+    assert data['altitude_m'][5] == data['altitude_m'][6]
+    # the grid covers the whole world
+    assert gebco.NODATA not in data['altitude_m']
+    with pytest.raises(ValueError):
+        gebco.get_heights([90.1], [0])
+
+
+def test_get_heights_by_chunk():
+    gebco = Gebco()
+    calls = []
+    get_chunk = gebco.get_chunk
+    gebco.get_chunk = lambda *_args: calls.append(_args) or get_chunk(*_args)
+    rows, cols = gebco.chunk_shape
+    # cells within the first chunk and one of the next chunk
+    lats = [-90, -90 + (rows - 1) / 240, -90 + rows / 240, -90]
+    lons = [-180, -180 + (cols - 1) / 240, -180, -180]
+    data = gebco.get_heights(lats, lons)
+    # each chunk is read once per batch
+    assert sorted(calls) == [(0, 0), (1, 0)]
+    assert data['altitude_m'][0] == data['altitude_m'][3]
+
+
+def test_cache_levels():
+    gebco = Gebco()
+    assert gebco.cache_levels[0][0] == 240
+    for block_size, minimum, maximum in gebco.cache_levels:
+        assert minimum.shape == (43200 // block_size, 86400 // block_size)
+        assert maximum.shape == minimum.shape
+        assert (minimum <= maximum).all()
+    with pytest.raises(FileNotFoundError):
+        Gebco(cache_file_name='missing_file.json').get_max_height(10, 10,
+            15, 15)
+
+
+def test_chunk_cache():
+    gebco = Gebco(file_name='GEBCO_2023.nc', cache_size=2 * 240 * 240 * 2)
+    gebco.chunk_cache.clear()
+    # neighbouring cells of an ocean track share a chunk
+    for _i in range(10):
+        gebco.get_height(40 + _i * 0.001, -30 + _i * 0.001)
+    assert len(gebco.chunk_cache) == 1
+    data = gebco.get_height(-41, 172)
+    assert len(gebco.chunk_cache) <= 2
+    assert data['altitude_m'] == round(float(gebco.elevation[
+        int(round((data['lat_found'] + 90) * 240)),
+        int(round((data['lon_found'] + 180) * 240)) % 86400]), 2)
+
+
+def test_reopen():
+    gebco = Gebco(file_name='GEBCO_2023.nc')
+    data = gebco.get_height(-41, 172)
+    h5_file = gebco.h5_file
+    # as done in forked worker processes
+    gebco.reopen()
+    assert gebco.h5_file is not h5_file
+    gebco.chunk_cache.clear()
+    assert gebco.get_height(-41, 172) == data
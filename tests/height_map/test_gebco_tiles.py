@@ -0,0 +1,19 @@
+import os
+import sys
+import numpy as np
+sys.path.append(os.getcwd())
+from height_map.gebco_tiles import TiledGrid, write_tiles
+
+
+def test_write_and_read_tiles(tmp_path):
+    file_name = str(tmp_path / 'tiles.bin')
+    grid = np.arange(48 * 72, dtype=np.int16).reshape(48, 72) - 1000
+    write_tiles(grid, file_name, tile_size=12, log=None)
+    assert os.path.getsize(file_name) == grid.nbytes
+    tiled_grid = TiledGrid(file_name, grid.shape, tile_size=12)
+    assert tiled_grid.chunks == (12, 12)
+    assert np.array_equal(tiled_grid.tiles[1, 2], grid[12:24, 24:36])
+    for rows, cols in [(slice(0, 48), slice(0, 72)), (slice(5, 6),
+            slice(7, 8)), (slice(11, 37), slice(3, 70)), (slice(40, None),
+            slice(None, 13)), (slice(10, 10), slice(0, 5))]:
+        assert np.array_equal(tiled_grid[rows, cols], grid[rows, cols])
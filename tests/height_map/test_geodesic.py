@@ -0,0 +1,63 @@
+import os
+import sys
+import numpy as np
+from pygeodesy import ellipsoidalVincenty as eV
+from pygeodesy import ellipsoidalExact as ee
+sys.path.append(os.getcwd())
+from height_map import calculate_distance, calculate_distances
+from height_map.geodesic import inverse, direct
+
+lats1 = np.array([52.1346, 51.5, 0., 89.9, -33.86, 47.94, 52.1346])
+lons1 = np.array([7.6848, -0.12, 0., 10., 151.21, 8.3, 7.6848])
+lats2 = np.array([51.5, 52.1346, 0., -89.9, 40.71, 47.56, 52.1346])
+lons2 = np.array([-0.12, 7.6848, 90., 10., -74.01, 9.5, 7.6848])
+
+
+def test_inverse():
+    distances, initial_bearings, final_bearings = inverse(lats1, lons1,
+        lats2, lons2)
+    for _i in range(len(lats1)):
+        expected = eV.LatLon(lats1[_i], lons1[_i]).distanceTo3(
+            eV.LatLon(lats2[_i], lons2[_i]))
+        assert abs(distances[_i] - expected[0]) < 0.001
+        assert abs(initial_bearings[_i] - expected[1]) < 1e-6
+        assert abs(final_bearings[_i] - expected[2]) < 1e-6
+    assert distances[-1] == 0
+
+
+def test_inverse_antipodal():
+    # Vincenty does not converge for nearly antipodal positions
+    distances = inverse([0, 10], [0, 20], [0.5, -10], [179.7, -160])[0]
+    assert abs(distances[0] - ee.LatLon(0, 0).distanceTo(
+        ee.LatLon(0.5, 179.7))) < 0.001
+    assert abs(distances[1] - ee.LatLon(10, 20).distanceTo(
+        ee.LatLon(-10, -160))) < 0.001
+
+
+def test_direct():
+    distances = np.array([0, 300, 542538.395, 1e7, -2500, 1e6, 20])
+    bearings = np.array([0, 45, 273.5, 90, 180, 359.9, 12])
+    _lats, _lons, _bearings = direct(lats1, lons1, distances, bearings)
+    for _i in range(len(lats1)):
+        start = eV.LatLon(lats1[_i], lons1[_i])
+        expected = start.destination(distances[_i], bearings[_i])
+        assert abs(_lats[_i] - expected.lat) < 1e-9
+        assert abs(_lons[_i] - expected.lon) < 1e-9
+        assert abs(_bearings[_i] - start.finalBearingOn(distances[_i],
+            bearings[_i])) < 1e-6
+
+
+def test_calculate_distances():
+    # nearby positions like grid points use the local tangent plane
+    _lats = lats1 + np.array([0.001, -0.0004, 0.002, 0.0001, 0.01, -0.5, 0])
+    _lons = lons1 + np.array([0.001, 0.0008, -0.002, 0.01, -0.01, 0.5, 0])
+    distances = calculate_distances(lats1, lons1, _lats, _lons)
+    exact_distances = calculate_distances(lats1, lons1, _lats, _lons,
+        exact=True)
+    for _i in range(len(lats1)):
+        expected = eV.LatLon(lats1[_i], lons1[_i]).distanceTo(
+            eV.LatLon(_lats[_i], _lons[_i]))
+        assert abs(distances[_i] - expected) < 0.0001
+        assert abs(exact_distances[_i] - expected) < 0.0001
+    assert calculate_distance(50, 7, 50, 7) == 0
+    assert abs(calculate_distance(0, 179.9995, 0, -179.9995) - 111.319) < 0.001
@@ -226,3 +226,49 @@ def test_check_bounds_get_min_max_height():
     _result = height_info.get_min_max_height(-90, -180, 90, 180)
     assert math.isclose(_result['h_max'], 8613.2, abs_tol=16)
     assert math.isclose(_result['h_min'], -10928, abs_tol=16)
+
+
+def test_find_extreme():
+    height_info = HeightInfo()
+    # Black Forest and North Sea
+    assert height_info.is_ocean([47.94, 53.8], [8.3, 6.9]).tolist() == [
+        False, True]
+    # the highest cells of the Black Forest
+    h_max, locations = height_info.find_extreme(height_info.dgm, 47.8, 7.9,
+        48.0, 8.2, True)
+    lats, lons = zip(*locations)
+    assert not height_info.is_ocean(lats, lons).any()
+    assert 0 < len(locations) < height_info.MAX_EXTREME_LOCATIONS
+    heights = height_info.dgm.get_heights(lats, lons)['altitude_m']
+    assert all(heights == h_max)
+    assert height_info.find_extreme(height_info.dgm, 60, 6.9, 60.5, 8.3,
+        False) is None
+
+
+def test_coastal_min_max_height():
+    height_info = HeightInfo()
+    # the lowest location of the coast of Lower Saxony is in the sea, the
+    # land based sources are rejected in favour of the GEBCO sea floor
+    _result = height_info.get_min_max_height(53.4, 6.9, 53.9, 8.3)
+    assert _result['source_min'] == height_info.gebco.attribution_name
+    assert _result['h_min'] < 0
+    assert 0 < _result['counter_min'] < height_info.MAX_EXTREME_LOCATIONS
+
+
+def test_get_heights():
+    height_info = HeightInfo()
+    locations = [[53.57, 9.98], [52.51, 13.42], [47.94, 8.3], [-41, 172],
+                 [51.5052, -0.1666], [50.91, 6.51], [53.8, 6.9], [0, 0]]
+    lats, lons = zip(*locations)
+    data = height_info.get_heights(lats, lons)
+    altitudes = height_info.get_altitude_list(data)
+    for _i, location in enumerate(locations):
+        _data = height_info.get_height(*location)
+        assert data['source'][_i] == _data['source']
+        assert data['wb_label'][_i] == _data['wb_label']
+        assert data['altitude_m'][_i] == _data['altitude_m']
+        assert type(altitudes[_i]) is type(_data['altitude_m'])
+        assert math.isclose(data['distance_m'][_i], _data['distance_m'],
+            abs_tol=0.01)
+    with pytest.raises(ValueError):
+        height_info.get_heights([0, 0], [0, 180.1])
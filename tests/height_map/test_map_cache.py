@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import numpy as np
+sys.path.append(os.getcwd())
+from height_map.map_cache import MapCache, load_map_cache, save_map_cache
+
+map_cache = {
+    'N52E013.hgt': {'counter_max': 1, 'counter_min': 3, 'h_max': 122,
+        'h_min': 29},
+    'N27E086.hgt': {'counter_max': 1, 'counter_min': 1, 'h_max': 8752,
+        'h_min': 2868}}
+
+
+def test_save_and_load(tmp_path):
+    file_name = str(tmp_path / 'srtm1_map_cache.npy')
+    save_map_cache(file_name, map_cache)
+    cache = load_map_cache(str(tmp_path / 'srtm1_map_cache.json'))
+    assert isinstance(cache, MapCache)
+    assert len(cache) == 2
+    assert 'N27E086.hgt' in cache
+    assert 'N00E000.hgt' not in cache
+    for name, entry in map_cache.items():
+        cached_entry = cache.get(name)
+        for key in entry:
+            assert cached_entry[key] == entry[key]
+        assert cached_entry['mtime'] == 0
+    assert dict(cache.items()).keys() == map_cache.keys()
+    assert cache.get('N00E000.hgt') is None
+
+
+def test_json_fallback(tmp_path):
+    with open(tmp_path / 'terr50_map_cache.json', 'w') as f:
+        json.dump(map_cache, f)
+    cache = load_map_cache(str(tmp_path / 'terr50_map_cache.json'))
+    assert cache == map_cache
+    assert load_map_cache(str(tmp_path / 'missing.json')) == {}
+
+
+def test_save_and_load_blocks(tmp_path):
+    file_name = str(tmp_path / 'srtm1_map_cache.npy')
+    blocks = {
+        name: np.full((2, 7, 7), entry['h_max'], dtype=np.float32)
+        for name, entry in map_cache.items()}
+    save_map_cache(file_name, {
+        name: dict(entry, blocks_600=blocks[name])
+        for name, entry in map_cache.items()})
+    cache = load_map_cache(file_name)
+    for name in map_cache:
+        assert np.array_equal(cache.get(name)['blocks_600'], blocks[name])
+    # blocks are only stored if available for all tiles
+    save_map_cache(file_name, dict(map_cache, **{
+        'N52E013.hgt': dict(map_cache['N52E013.hgt'], blocks_600=blocks[
+            'N52E013.hgt'])}))
+    assert 'blocks_600' not in load_map_cache(file_name).get('N52E013.hgt')
@@ -0,0 +1,68 @@
+import os
+import sys
+import numpy as np
+sys.path.append(os.getcwd())
+from height_map.map_cache_builder import (build_map_cache, find_tiles,
+    scan_tile, is_up_to_date)
+
+
+def create_tile(path, file_name, values):
+    os.makedirs(path, exist_ok=True)
+    full_path = os.path.join(path, file_name)
+    np.asarray(values, dtype='>f4').tofile(full_path)
+    return full_path
+
+
+def test_build_map_cache(tmp_path):
+    values = np.full((200, 200), 12.5)
+    values[0, :3] = 97.25
+    values[199, 199] = -32768
+    values[100, 100:102] = -2.5
+    create_tile(tmp_path / 'su', 'SU12.bin', values)
+    create_tile(tmp_path / 'tq', 'TQ38.bin', np.full((200, 200), -32768))
+    tiles = find_tiles(str(tmp_path), '*.bin')
+    assert sorted(tiles) == ['SU12.bin', 'TQ38.bin']
+    map_cache, stats = build_map_cache(tiles, 'terr50', max_workers=1,
+        log=None)
+    assert stats['scanned'] == 2
+    entry = map_cache['SU12.bin']
+    assert (entry['h_max'], entry['counter_max']) == (97.25, 3)
+    assert (entry['h_min'], entry['counter_min']) == (-2.5, 2)
+    entry = map_cache['TQ38.bin']
+    assert (entry['h_max'], entry['counter_max']) == (-32768, 40000)
+    assert (entry['h_min'], entry['counter_min']) == (-32768, 0)
+
+
+def test_incremental_rebuild(tmp_path):
+    create_tile(tmp_path, 'SU12.bin', np.zeros((200, 200)))
+    full_path = create_tile(tmp_path, 'SU13.bin', np.zeros((200, 200)))
+    tiles = find_tiles(str(tmp_path), '*.bin')
+    map_cache, stats = build_map_cache(tiles, 'terr50', max_workers=1,
+        log=None)
+    assert map_cache['SU13.bin']['h_max'] == 0
+    os.remove(os.path.join(tmp_path, 'SU12.bin'))
+    create_tile(tmp_path, 'SU13.bin', np.ones((200, 200)))
+    stat = os.stat(full_path)
+    os.utime(full_path, (stat.st_atime, stat.st_mtime + 10))
+    tiles = find_tiles(str(tmp_path), '*.bin')
+    map_cache, stats = build_map_cache(tiles, 'terr50', map_cache,
+        max_workers=1, log=None)
+    assert stats['scanned'] == 1
+    assert stats['removed'] == 1
+    assert list(map_cache) == ['SU13.bin']
+    assert map_cache['SU13.bin']['h_max'] == 1
+
+
+def test_scan_tile_blocks(tmp_path):
+    values = np.full((200, 200), 12.5)
+    values[150, 30] = 97.25
+    values[:100, 100:] = -32768
+    full_path = create_tile(tmp_path, 'SU12.bin', values)
+    entry = scan_tile(full_path, '>f4', (200, 200), -32768, (100, 20))
+    minimum, maximum = entry['blocks_100']
+    assert np.array_equal(maximum, [[12.5, -32768], [97.25, 12.5]])
+    assert np.array_equal(minimum, [[12.5, np.inf], [12.5, 12.5]])
+    assert entry['blocks_20'].shape == (2, 10, 10)
+    assert entry['blocks_20'][1, 7, 1] == 97.25
+    assert is_up_to_date(entry, full_path, (100, 20))
+    assert not is_up_to_date(entry, full_path, (100, 20, 4))
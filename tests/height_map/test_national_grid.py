@@ -0,0 +1,38 @@
+import os
+import sys
+import numpy as np
+from pygeodesy import ellipsoidalVincenty as eV
+from pygeodesy import toOsgr, Osgr
+sys.path.append(os.getcwd())
+from height_map.national_grid import (to_national_grid, from_national_grid,
+    is_on_grid, get_grid_letters, get_square_origin)
+
+lats = np.array([51.4778, 50.0657, 58.6373, 60.8608, 53.2387, 49.9285])
+lons = np.array([-0.0014, -5.7132, -3.0689, -0.8849, -4.1227, -6.2983])
+
+
+def test_to_national_grid():
+    eastings, northings = to_national_grid(lats, lons)
+    for _e, _n, _lat, _lon in zip(eastings, northings, lats, lons):
+        osgr = toOsgr(eV.LatLon(_lat, _lon))
+        assert abs(_e - osgr.easting) < 0.001
+        assert abs(_n - osgr.northing) < 0.001
+    assert is_on_grid(eastings, northings).all()
+
+
+def test_from_national_grid():
+    eastings, northings = to_national_grid(lats, lons)
+    _lats, _lons = from_national_grid(eastings, northings)
+    for _e, _n, _lat, _lon in zip(eastings, northings, _lats, _lons):
+        latlon = Osgr(_e, _n).toLatLon(eV.LatLon)
+        assert latlon.distanceTo(eV.LatLon(_lat, _lon)) < 0.001
+
+
+def test_grid_letters():
+    eastings, northings = to_national_grid(lats, lons)
+    for _e, _n, _letters in zip(eastings, northings, get_grid_letters(
+            eastings, northings)):
+        assert Osgr(_e, _n).toStr(prec=1, sep='')[:2] == _letters
+    assert get_square_origin('TQ') == (500000, 100000)
+    assert get_square_origin('HP') == (400000, 1200000)
+    assert not is_on_grid(np.array([-1, 700000]), np.array([5, 5])).any()
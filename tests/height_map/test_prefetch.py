@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+sys.path.append(os.getcwd())
+from height_map.prefetch import (get_row_ranges, read_ranges, prefetch_files,
+    FileHandles, get_executor)
+
+
+def test_row_ranges():
+    assert get_row_ranges(np.array([], dtype=int), 10) == []
+    assert get_row_ranges(np.array([7, 3, 4, 4, 5, 9, 10]), 10) == [
+        (30, 30), (70, 10), (90, 20)]
+
+
+def test_prefetch_files(tmp_path):
+    file_name = str(tmp_path / 'N00E000.hgt')
+    np.zeros((4, 5), dtype='>i2').tofile(file_name)
+    assert read_ranges(file_name, [(0, 10), (30, 20)]) == 20
+    assert read_ranges(str(tmp_path / 'missing.hgt'), [(0, 10)]) == 0
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = prefetch_files({file_name: get_row_ranges([1, 3], 10),
+            str(tmp_path / 'missing.hgt'): [(0, 10)]}, executor)
+    assert [_future.result() for _future in futures] == [20, 0]
+
+
+def test_file_handles(tmp_path):
+    file_names = [str(tmp_path / 'N00E00{}.hgt'.format(_i)) for _i in range(3)]
+    for _i, _file_name in enumerate(file_names):
+        np.full((4, 5), _i, dtype='>i2').tofile(_file_name)
+    handles = FileHandles(max_files=2)
+    assert handles.acquire(str(tmp_path / 'missing.hgt')) is None
+    fd = handles.acquire(file_names[0])
+    assert handles.acquire(file_names[0]) == fd
+    handles.release(file_names[0])
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _file_name: read_ranges(
+            _file_name, [(0, 10), (30, 10)], handles), file_names * 20))
+    assert results == [20] * 60
+    # the file still being read stays open beyond max_files
+    assert os.pread(fd, 2, 0) == b'\x00\x00'
+    assert len(handles) == 2
+    handles.release(file_names[0])
+    handles.clear()
+    assert len(handles) == 0
+
+
+def test_get_executor(tmp_path):
+    file_name = str(tmp_path / 'N00E000.hgt')
+    np.zeros((4, 5), dtype='>i2').tofile(file_name)
+    executor = get_executor()
+    # the pool is shared by all requests of the process
+    assert get_executor() is executor
+    futures = prefetch_files({file_name: [(0, 10)]}, executor)
+    assert [_future.result() for _future in futures] == [10]
+    thread_names = set(executor.map(
+        lambda _: threading.current_thread().name, range(20)))
+    assert all(_name.startswith('prefetch') for _name in thread_names)
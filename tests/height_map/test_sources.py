@@ -0,0 +1,56 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.getcwd())
+from height_map.sources import SourceRegistry
+
+
+def test_source_registry():
+    calls = []
+
+    def create_source(name):
+        def factory(registry):
+            calls.append(name)
+            return {'name': name}
+        return factory
+
+    registry = SourceRegistry({
+        'a': create_source('a'),
+        'b': lambda registry: [registry.get('a'), create_source('b')(
+            registry)]})
+    assert 'a' not in registry
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(registry.get, ['b', 'a'] * 10))
+    # each source is constructed once and shared
+    assert calls == ['a', 'b']
+    assert all(_result is results[0] for _result in results[::2])
+    assert results[0][0] is results[1]
+    assert sorted(registry.init_times) == ['a', 'b']
+    registry.clear()
+    assert 'b' not in registry
+    assert registry.get('a') == {'name': 'a'}
+    assert calls == ['a', 'b', 'a']
+
+
+def test_preload_and_reopen():
+
+    class Source:
+        def __init__(self):
+            self.preloaded = False
+            self.reopened = 0
+
+        def preload(self):
+            self.preloaded = True
+
+        def reopen(self):
+            self.reopened += 1
+
+    registry = SourceRegistry({'a': lambda registry: Source(),
+        'b': lambda registry: 'plain'})
+    registry.reopen()
+    assert 'a' not in registry
+    registry.preload()
+    assert registry.get('a').preloaded
+    assert registry.get('b') == 'plain'
+    registry.reopen()
+    assert registry.get('a').reopened == 1
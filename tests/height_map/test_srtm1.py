@@ -2,6 +2,7 @@ import os
 import sys
 import pytest
 import math
+import numpy as np
 sys.path.append(os.getcwd())
 from height_map.srtm1 import Srtm1
 
@@ -208,3 +209,47 @@ def test_check_bounds_get_min_max_height():
     _result = srtm.get_min_max_height(56.65, -5.6, 56.85, -3.9)
     assert math.isclose(_result['h_max'], 1345.4, abs_tol=16)
     assert math.isclose(_result['h_min'], -12, abs_tol=16)
+
+
+def test_get_heights(check_heights):
+    srtm = Srtm1()
+    data = check_heights(srtm, [
+        # London, River Thames and Ben Nevis
+        [51.499, -0.122], [56.796556, -5.004599],
+        # both sides of the tile boundaries at 0 deg east and 52 deg north
+        [51.5, -0.0001], [51.5, 0.0001], [51.99999, 7.4], [52.00001, 7.4],
+        # Atlantic Ocean, no tile available
+        [40, -30]])
+    assert math.isclose(data['altitude_m'][0], -2.3, abs_tol=16)
+    assert math.isclose(data['altitude_m'][1], 1311, abs_tol=16)
+    # neighbouring tiles share the cells along their common edge
+    assert data['lon_found'][2] == data['lon_found'][3] == 0
+    assert data['altitude_m'][2] == data['altitude_m'][3]
+    assert data['lat_found'][4] == data['lat_found'][5] == 52
+    assert data['altitude_m'][4] == data['altitude_m'][5]
+    assert data['altitude_m'][6] == srtm.NODATA
+    with pytest.raises(ValueError):
+        srtm.get_heights([90.1], [0])
+
+
+def test_group_by_tile():
+    srtm = Srtm1()
+    lats = np.array([51.5, 56.8, 51.2, 51.5, 52.00001])
+    lons = np.array([-0.12, -5.0, -0.9, 0.0001, 7.4])
+    groups = list(srtm.group_by_tile(lats, lons))
+    assert [(os.path.basename(_group[0]), _group[1].tolist())
+        for _group in groups] == [('N51W001.hgt', [0, 2]),
+        ('N51E000.hgt', [3]), ('N52E007.hgt', [4]), ('N56W005.hgt', [1])]
+    full_path, _indices, i, j, y_ll_tile, x_ll_tile = groups[0]
+    assert i.tolist() == [1800, 2880]
+    assert j.tolist() == [3168, 360]
+    assert (y_ll_tile, x_ll_tile) == (51, -1)
+    # the bottom row of a tile is its last row
+    assert groups[2][2].tolist() == [3600]
+    # each tile is looked up once per batch
+    calls = []
+    get = srtm.tiles.get
+    srtm.tiles.get = lambda _full_path: calls.append(_full_path) or get(
+        _full_path)
+    srtm.get_heights(lats, lons)
+    assert calls == [_group[0] for _group in groups]
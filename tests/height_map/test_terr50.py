@@ -2,6 +2,7 @@ import os
 import sys
 import pytest
 import math
+import numpy as np
 sys.path.append(os.getcwd())
 from height_map.terr50 import Terrain50
 
@@ -190,3 +191,43 @@ def test_check_bounds_get_min_max_height():
     _result = terr50.get_min_max_height(50.8, -3.1, 53.8, 0.1)
     assert math.isclose(_result['h_max'], 797, abs_tol=4)
     assert math.isclose(_result['h_min'], -132, abs_tol=4)
+
+
+def test_get_heights(check_heights):
+    terr50 = Terrain50()
+    data = check_heights(terr50, [
+        # London, River Thames and Ben Nevis
+        [51.499, -0.122], [56.796556, -5.004599],
+        # Greenwich Observatory close to the 0 deg meridian
+        [51.477963, -0.001647],
+        # Berlin and the Atlantic Ocean, not covered by the grid
+        [52.51, 13.42], [49.9262, -16.2979]])
+    assert math.isclose(data['altitude_m'][0], -2.3, abs_tol=4)
+    assert math.isclose(data['altitude_m'][1], 1345, abs_tol=6)
+    assert math.isclose(data['altitude_m'][2], 38, abs_tol=4)
+    # found cells are at most half a diagonal of a 50m cell away
+    assert max(data['distance_m'][:3]) < 35.36
+    assert data['altitude_m'][3:].tolist() == [terr50.NODATA] * 2
+    assert all(np.isnan(data['lat_found'][3:]))
+    assert data['distance_m'][3:].tolist() == [0, 0]
+    with pytest.raises(ValueError):
+        terr50.get_heights([90.1], [0])
+
+
+def test_group_by_tile():
+    terr50 = Terrain50()
+    # cells on both sides of the tile boundaries at 530000m east and
+    # 180000m north
+    eastings = np.array([529950., 530000., 529950., 530000., 538000.])
+    northings = np.array([179950., 179950., 180000., 180000., 171000.])
+    groups = list(terr50.group_by_tile(eastings, northings))
+    assert [(os.path.basename(_group[0]), _group[1].tolist())
+        for _group in groups] == [('TQ27.bin', [0]), ('TQ28.bin', [2]),
+        ('TQ37.bin', [1, 4]), ('TQ38.bin', [3])]
+    assert [_group[0].split(os.sep)[-2] for _group in groups] == ['tq'] * 4
+    full_path, _indices, x, y = groups[2]
+    assert x.tolist() == [0, 160]
+    assert y.tolist() == [0, 179]
+    assert groups[0][2].tolist() == [199]
+    assert groups[0][3].tolist() == [0]
+    assert groups[1][3].tolist() == [199]
@@ -0,0 +1,29 @@
+import os
+import sys
+import numpy as np
+sys.path.append(os.getcwd())
+from height_map.tile_pool import TilePool
+
+
+def test_missing_tile(tmp_path):
+    pool = TilePool('>i2', (3, 3))
+    assert pool.get(str(tmp_path / 'missing.hgt')) is None
+    assert len(pool) == 0
+
+
+def test_lru_eviction(tmp_path):
+    file_names = []
+    for _i in range(3):
+        file_name = str(tmp_path / f'{_i}.hgt')
+        np.full((3, 3), _i, dtype='>i2').tofile(file_name)
+        file_names.append(file_name)
+    pool = TilePool('>i2', (3, 3), max_tiles=2)
+    assert pool.get(file_names[0])[1, 1] == 0
+    assert pool.get(file_names[1])[2, 0] == 1
+    # touch the first tile to make the second one least recently used
+    pool.get(file_names[0])
+    assert pool.get(file_names[2])[0, 2] == 2
+    assert len(pool) == 2
+    assert file_names[0] in pool
+    assert file_names[1] not in pool
+    assert file_names[2] in pool